@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from background import BackgroundWorkers
+from blacklist import BlacklistIndex, BlacklistStore
+from campaign_store import CampaignStore
+from list_catalog import ListCatalog
+from list_preview import ListPreview
+from scheduler import EmailScheduler
+from sender import EmailDispatcher
+
+
+class AppContext:
+    """Serviços da aplicação, criados uma vez em run_server e injetados em cada WebHandler
+
+    Dispatcher, scheduler, índice da blacklist, catálogo de listas e workers
+    de segundo plano são compartilhados por todas as requisições (que rodam
+    em paralelo no pool do servidor).
+    """
+
+    def __init__(self, lists_dir='lists', campanhas=None, workers_tarefas=2):
+        self.lists_dir = Path(lists_dir)
+        self.lists_dir.mkdir(exist_ok=True)
+        # Agendamentos persistidos em SQLite, compartilhados entre servidor e scheduler
+        self.campanhas = campanhas or CampaignStore()
+
+        self.blacklist = BlacklistIndex.compartilhado()
+        # Único escritor da blacklist (descadastros e bounces, com commit em grupo)
+        self.blacklist_store = BlacklistStore.compartilhado()
+        self.dispatcher = EmailDispatcher()
+        self.scheduler = EmailScheduler(self.campanhas, dispatcher=self.dispatcher)
+        self.catalogo = ListCatalog(self.lists_dir)
+        self.previews = ListPreview()
+        # Operações demoradas (ex.: envio de teste) rodam fora das threads HTTP
+        self.tarefas = BackgroundWorkers(workers=workers_tarefas)
+
+    def iniciar(self):
+        """Inicia o scheduler e o observador do diretório de listas"""
+        self.scheduler.start()
+        self.catalogo.iniciar()
+        print(f"Diretório de listas inicializado em: {self.lists_dir.absolute()}")
+
+    def close(self):
+        self.scheduler.running = False
+        self.scheduler.executor.close()
+        self.campanhas.acordar()
+        self.catalogo.parar()
+        self.tarefas.close(wait=False)
+        self.dispatcher.fechar_pool_smtp()
+        self.dispatcher.estatisticas.close()
+        self.blacklist_store.close()
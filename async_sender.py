@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import dominio_do_email
+
+
+class AsyncDispatchEngine:
+    """Motor de envio assíncrono com N transações SMTP simultâneas sobre o pool do dispatcher"""
+
+    def __init__(self, dispatcher, concurrency=8, rate_limiter=None):
+        self.dispatcher = dispatcher
+        self.logger = dispatcher.logger
+        self.rate_limiter = rate_limiter or dispatcher.rate_limiter
+        self.concurrency = concurrency
+
+    def run(self, destinatarios, template, assunto, remetente, stats, checkpoint=None, retentativas=None):
+        """Executa a campanha e bloqueia até o fim (pode ser chamado de qualquer thread)"""
+        return asyncio.run(self._run(destinatarios, template, assunto, remetente, stats, checkpoint, retentativas))
+
+    def _preparar_pool(self):
+        """Garante um pool com ao menos uma sessão por transação simultânea"""
+        pool = self.dispatcher.smtp_pool
+        if pool is not None and pool.size < self.concurrency:
+            self.dispatcher.fechar_pool_smtp()
+        self.dispatcher.smtp_pool_config['size'] = max(
+            self.dispatcher.smtp_pool_config['size'], self.concurrency
+        )
+
+    async def _run(self, destinatarios, template, assunto, remetente, stats, checkpoint=None, retentativas=None):
+        self._preparar_pool()
+        loop = asyncio.get_running_loop()
+        vagas = asyncio.Semaphore(self.concurrency)
+        pendentes = set()
+
+        self.logger.info(
+            f"Envio assíncrono: {self.concurrency} transações simultâneas, "
+            f"até {self.rate_limiter.taxa_global():.1f} emails/s"
+        )
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='smtp') as executor, \
+                self.dispatcher.sessao_campanha():
+
+            async def enviar(destinatario):
+                email, nome, primeiro_nome, campos, linha = destinatario
+                dominio = dominio_do_email(email)
+                try:
+                    resposta = await loop.run_in_executor(
+                        executor, self.dispatcher.enviar_email,
+                        email, nome, assunto, template, remetente, campos, primeiro_nome
+                    )
+                    self.dispatcher.registrar_envio(linha, resposta, stats, checkpoint)
+                    self.rate_limiter.registrar_sucesso(dominio)
+                except Exception as e:
+                    self.rate_limiter.registrar_resultado(dominio, e)
+                    self.dispatcher.tratar_falha(destinatario, e, stats, checkpoint, retentativas)
+                finally:
+                    vagas.release()
+                self.dispatcher.registrar_progresso(stats)
+
+            fonte = destinatarios if retentativas is None else retentativas.intercalar(destinatarios)
+            while fonte is not None:
+                # O limitador intercala domínios com orçamento disponível
+                liberados = self.rate_limiter.liberar_async(
+                    self.dispatcher.destinatarios_validos(fonte, stats),
+                    dominio=lambda destinatario: dominio_do_email(destinatario[0])
+                )
+                async for destinatario in liberados:
+                    # Limita as transações em andamento
+                    await vagas.acquire()
+                    tarefa = asyncio.create_task(enviar(destinatario))
+                    pendentes.add(tarefa)
+                    tarefa.add_done_callback(pendentes.discard)
+
+                if pendentes:
+                    await asyncio.gather(*pendentes)
+
+                # Novas tentativas que sobraram: espera vencerem, sem bloquear o loop
+                espera = retentativas.espera() if retentativas is not None else None
+                if espera is None:
+                    break
+                await asyncio.sleep(espera)
+                fonte = retentativas.vencidos()
@@ -0,0 +1,85 @@
+import itertools
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class BackgroundWorkers:
+    """Executa operações demoradas fora das threads do servidor HTTP
+
+    Cada tarefa recebe um id e tem o estado consultável por `obter`
+    (pendente, executando, concluido ou erro). Apenas as `historico`
+    tarefas mais recentes são mantidas. Tarefas submetidas com
+    `submeter_com_progresso` publicam o andamento em `progresso`.
+    """
+
+    def __init__(self, workers=2, historico=200):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tarefa')
+        self._tarefas = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.historico = historico
+
+    def submeter(self, tipo, funcao, *args, **kwargs):
+        """Enfileira `funcao(*args, **kwargs)` e retorna o registro da tarefa"""
+        tarefa = self._registrar(tipo)
+        self._executor.submit(self._executar, tarefa, funcao, args, kwargs)
+        return dict(tarefa)
+
+    def submeter_com_progresso(self, tipo, funcao, *args, **kwargs):
+        """Como `submeter`, mas `funcao` recebe também `progresso=callback(valor)`"""
+        tarefa = self._registrar(tipo)
+
+        def progresso(valor):
+            tarefa['progresso'] = valor
+
+        kwargs['progresso'] = progresso
+        self._executor.submit(self._executar, tarefa, funcao, args, kwargs)
+        return dict(tarefa)
+
+    def _registrar(self, tipo):
+        with self._lock:
+            tarefa = {
+                'id': next(self._ids),
+                'tipo': tipo,
+                'status': 'pendente',
+                'criada_em': datetime.now().isoformat(),
+                'inicio': None,
+                'fim': None,
+                'progresso': None,
+                'resultado': None,
+                'erro': None
+            }
+            self._tarefas[tarefa['id']] = tarefa
+            while len(self._tarefas) > self.historico:
+                self._tarefas.popitem(last=False)
+        return tarefa
+
+    def _executar(self, tarefa, funcao, args, kwargs):
+        tarefa['status'] = 'executando'
+        tarefa['inicio'] = datetime.now().isoformat()
+        try:
+            tarefa['resultado'] = funcao(*args, **kwargs)
+            tarefa['status'] = 'concluido'
+        except Exception as e:
+            tarefa['erro'] = str(e)
+            tarefa['status'] = 'erro'
+            print(f"Erro na tarefa {tarefa['id']} ({tarefa['tipo']}): {e}")
+            traceback.print_exc()
+        finally:
+            tarefa['fim'] = datetime.now().isoformat()
+
+    def obter(self, tarefa_id):
+        """Cópia do registro da tarefa, ou None se não existir (ou já saiu do histórico)"""
+        with self._lock:
+            tarefa = self._tarefas.get(tarefa_id)
+            return dict(tarefa) if tarefa else None
+
+    def listar(self):
+        with self._lock:
+            return [dict(tarefa) for tarefa in self._tarefas.values()]
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,84 @@
+"""Compara o envio sequencial com o motor assíncrono contra um SMTP local
+
+Uso: python benchmarks/bench_async_dispatch.py [--emails 500] [--concurrency 16] [--latency 0.02]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from fake_smtp import FakeSMTPServer  # noqa: E402
+from sender import EmailDispatcher  # noqa: E402
+from rate_limiter import DomainRateLimiter  # noqa: E402
+
+
+def preparar_ambiente(diretorio, total):
+    """Cria lista, template e blacklist vazia em um diretório temporário"""
+    lista = os.path.join(diretorio, 'lista.csv')
+    with open(lista, 'w') as f:
+        f.write("EMAIL,NOME\n")
+        for i in range(total):
+            f.write(f"cliente{i}@example.com,Cliente {i}\n")
+
+    template = os.path.join(diretorio, 'template.html')
+    shutil.copy(os.path.join(RAIZ, 'templates', 'desconto10.html'), template)
+
+    conn = sqlite3.connect(os.path.join(diretorio, 'email_blacklist.db'))
+    conn.execute('CREATE TABLE IF NOT EXISTS invalid_emails (email TEXT PRIMARY KEY, reason TEXT, '
+                 'date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP, campaign_id TEXT)')
+    conn.commit()
+    conn.close()
+    return lista, template
+
+
+def executar(modo, lista, template, sink, args):
+    dispatcher = EmailDispatcher()
+    dispatcher.logger.setLevel('WARNING')
+    dispatcher.smtp_config.update({'host': '127.0.0.1', 'port': sink.port})
+    dispatcher.rate_limiter = DomainRateLimiter(global_rate=args.rate, domain_limits={})
+    dispatcher.async_config['concurrency'] = args.concurrency
+
+    inicio_msgs = sink.mensagens
+    inicio = time.perf_counter()
+    dispatcher.enviar_emails(lista, template, '2000-01-01 00:00:00', 'Oferta para {primeiro_nome}',
+                             'Bench <bench@example.com>', modo=modo)
+    duracao = time.perf_counter() - inicio
+    dispatcher.fechar_pool_smtp()
+    enviados = sink.mensagens - inicio_msgs
+    return enviados, duracao
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=1000, help='limite de emails/s de ambos os modos')
+    parser.add_argument('--latency', type=float, default=0.02, help='latência simulada do MTA por mensagem (s)')
+    args = parser.parse_args()
+
+    sink = FakeSMTPServer(latency=args.latency).start()
+    diretorio = tempfile.mkdtemp(prefix='bench_async_')
+    cwd = os.getcwd()
+    try:
+        lista, template = preparar_ambiente(diretorio, args.emails)
+        os.chdir(diretorio)
+        resultados = {}
+        for modo in ('sequencial', 'async'):
+            enviados, duracao = executar(modo, lista, template, sink, args)
+            resultados[modo] = enviados / duracao
+            print(f"{modo:>10}: {enviados} emails em {duracao:.2f}s ({resultados[modo]:.1f} emails/s)")
+        print(f"Ganho: {resultados['async'] / resultados['sequencial']:.1f}x")
+    finally:
+        os.chdir(cwd)
+        sink.stop()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Escritas na blacklist: uma conexão e um commit por email vs. BlacklistStore (WAL + commit em grupo)
+
+Mede inserções por segundo com várias threads gravando ao mesmo tempo
+(bounces de uma campanha, pico de descadastros) e a latência das consultas
+ao banco (confirmação do filtro de Bloom) enquanto um escritor grava sem
+parar.
+
+Uso: python benchmarks/bench_blacklist_store.py [--emails 5000] [--threads 4] [--duracao 3]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from blacklist import SCHEMA_BLACKLIST, BlacklistIndex, BlacklistStore  # noqa: E402
+
+CONSULTA = 'SELECT 1 FROM invalid_emails WHERE lower(email) = ?'
+
+
+def banco_antigo(db_path):
+    """Banco como era criado antes: journal padrão (rollback), sem WAL"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(SCHEMA_BLACKLIST)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_invalid_emails_lower ON invalid_emails(lower(email))')
+    conn.commit()
+    conn.close()
+
+
+def inserir_antigo(db_path, email):
+    # Como nos handlers de descadastro: conexão nova, um INSERT e um commit
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("INSERT OR IGNORE INTO invalid_emails (email, reason) VALUES (?, ?)", (email, 'bench'))
+    conn.commit()
+    conn.close()
+
+
+def em_threads(threads, funcao, total):
+    """Divide `total` chamadas de funcao(i) entre as threads; retorna a duração"""
+    def trabalho(inicio):
+        for i in range(inicio, total, threads):
+            funcao(i)
+    grupo = [threading.Thread(target=trabalho, args=(t,)) for t in range(threads)]
+    inicio = time.perf_counter()
+    for thread in grupo:
+        thread.start()
+    for thread in grupo:
+        thread.join()
+    return time.perf_counter() - inicio
+
+
+def medir_insercoes(diretorio, args):
+    resultados = []
+
+    db_path = os.path.join(diretorio, 'antigo.db')
+    banco_antigo(db_path)
+    duracao = em_threads(args.threads, lambda i: inserir_antigo(db_path, f"a{i}@example.com"), args.emails)
+    resultados.append(('commit por email', duracao, args.emails))
+
+    for nome, aguardar in (('store (enfileira)', False), ('store (aguarda)', True)):
+        db_path = os.path.join(diretorio, f"store_{aguardar}.db")
+        store = BlacklistStore(db_path, indice=BlacklistIndex(db_path))
+        inicio = time.perf_counter()
+        em_threads(args.threads, lambda i: store.adicionar(f"a{i}@example.com", 'bench', aguardar=aguardar), args.emails)
+        store.sincronizar()
+        duracao = time.perf_counter() - inicio
+        commits = store.get_metrics()['commits']
+        store.close()
+        resultados.append((f"{nome}, {commits} commits", duracao, args.emails))
+
+    print(f"\nInserções: {args.emails} emails, {args.threads} threads")
+    print(f"{'caminho':<34}{'inserções/s':>12}{'tempo (s)':>11}")
+    for nome, duracao, total in resultados:
+        print(f"{nome:<34}{total / duracao:>12.0f}{duracao:>11.2f}")
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+
+def consultas_sob_escrita(consultar, escrever, existentes, args):
+    """Leitores consultam emails existentes enquanto uma thread grava sem parar"""
+    parar = threading.Event()
+    latencias = [[] for _ in range(args.threads)]
+    escritos = [0]
+
+    def escritor():
+        while not parar.is_set():
+            escrever(f"novo{escritos[0]}@example.com")
+            escritos[0] += 1
+
+    def leitor(n):
+        i = n
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            consultar(existentes[i % len(existentes)])
+            latencias[n].append(time.perf_counter() - inicio)
+            i += args.threads
+
+    threads = [threading.Thread(target=escritor)] + [
+        threading.Thread(target=leitor, args=(n,)) for n in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duracao)
+    parar.set()
+    for thread in threads:
+        thread.join()
+    todas = [latencia for lista in latencias for latencia in lista]
+    return todas, escritos[0]
+
+
+def medir_consultas(diretorio, args):
+    existentes = [f"base{i}@example.com" for i in range(args.emails)]
+    resultados = []
+
+    # Antes: uma conexão compartilhada protegida por lock, journal de rollback
+    db_path = os.path.join(diretorio, 'consulta_antigo.db')
+    banco_antigo(db_path)
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn.executemany("INSERT INTO invalid_emails (email, reason) VALUES (?, 'base')", ((e,) for e in existentes))
+    conn.commit()
+    lock = threading.Lock()
+
+    def consultar_antigo(email):
+        with lock:
+            return conn.execute(CONSULTA, (email,)).fetchone() is not None
+
+    latencias, escritos = consultas_sob_escrita(consultar_antigo, lambda e: inserir_antigo(db_path, e), existentes, args)
+    conn.close()
+    resultados.append(('conexão única + rollback', latencias, escritos))
+
+    # Depois: WAL, pool de leitura do índice (modo Bloom: positivos confirmados no banco)
+    db_path = os.path.join(diretorio, 'consulta_store.db')
+    indice = BlacklistIndex(db_path, bloom_threshold=0)
+    store = BlacklistStore(db_path, indice=indice)
+    store.importar(existentes, 'base')
+    indice.carregar()
+    latencias, escritos = consultas_sob_escrita(indice.contem, lambda e: store.adicionar(e, 'bench'), existentes, args)
+    store.close()
+    indice.close()
+    resultados.append(('pool de leitura + WAL', latencias, escritos))
+
+    print(f"\nConsultas com um escritor concorrente: {args.threads} leitores, {args.duracao:.0f}s")
+    print(f"{'caminho':<28}{'consultas/s':>12}{'p50 us':>9}{'p99 us':>9}{'max ms':>9}{'escritas/s':>12}")
+    for nome, latencias, escritos in resultados:
+        print(f"{nome:<28}{len(latencias) / args.duracao:>12.0f}{percentil(latencias, 0.5) * 1e6:>9.0f}"
+              f"{percentil(latencias, 0.99) * 1e6:>9.0f}{max(latencias, default=0) * 1e3:>9.1f}"
+              f"{escritos / args.duracao:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emails', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duracao', type=float, default=3.0, help='segundos de consultas por cenário')
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix='bench_blacklist_')
+    try:
+        medir_insercoes(diretorio, args)
+        medir_consultas(diretorio, args)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Retomada de uma campanha interrompida pelo log de checkpoint
+
+Modo padrão: grava um checkpoint com as primeiras `--enviados` linhas já
+enviadas e mede quanto a retomada leva para carregar o log, pular essas
+linhas e fazer o primeiro envio novo, contra um SMTP local.
+
+Com --crash: roda a campanha em um subprocesso, mata-o com SIGKILL depois de
+`--enviados` envios e retoma, contando quantos emails foram reenviados.
+
+Uso: python benchmarks/bench_checkpoint_resume.py [--emails 80000] [--enviados 65000] [--crash]
+"""
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bench_async_dispatch import preparar_ambiente  # noqa: E402
+from checkpoint import ENVIADO, CheckpointLog  # noqa: E402
+from fake_smtp import FakeSMTPServer  # noqa: E402
+from rate_limiter import DomainRateLimiter  # noqa: E402
+from sender import EmailDispatcher  # noqa: E402
+
+CAMPANHA = 1
+
+
+def criar_dispatcher(porta):
+    dispatcher = EmailDispatcher()
+    dispatcher.logger.setLevel('WARNING')
+    dispatcher.smtp_config.update({'host': '127.0.0.1', 'port': porta})
+    dispatcher.rate_limiter = DomainRateLimiter(global_rate=1_000_000, domain_limits={})
+    return dispatcher
+
+
+def enviar(dispatcher, lista, template):
+    """Executa a campanha; retorna (duração, momento do primeiro envio novo)"""
+    primeiro = []
+    enviar_email = dispatcher.enviar_email
+
+    def medir_primeiro(*args, **kwargs):
+        if not primeiro:
+            primeiro.append(time.perf_counter())
+        return enviar_email(*args, **kwargs)
+
+    dispatcher.enviar_email = medir_primeiro
+    inicio = time.perf_counter()
+    dispatcher.enviar_emails(lista, template, '2000-01-01 00:00:00', 'Oferta para {primeiro_nome}',
+                             'Bench <bench@example.com>', modo='sequencial', campanha_id=CAMPANHA)
+    fim = time.perf_counter()
+    dispatcher.fechar_pool_smtp()
+    return fim - inicio, (primeiro[0] - inicio) if primeiro else float('nan')
+
+
+def filho(args):
+    """Processo que envia a campanha até ser morto pelo pai"""
+    lista, template = os.path.join(args.diretorio, 'lista.csv'), os.path.join(args.diretorio, 'template.html')
+    enviar(criar_dispatcher(args.porta), lista, template)
+
+
+def registros_no_log(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().count(b'\n') - 1
+    except FileNotFoundError:
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emails', type=int, default=80_000)
+    parser.add_argument('--enviados', type=int, default=65_000)
+    parser.add_argument('--crash', action='store_true')
+    parser.add_argument('--filho', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--diretorio', help=argparse.SUPPRESS)
+    parser.add_argument('--porta', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        os.chdir(args.diretorio)
+        return filho(args)
+
+    sink = FakeSMTPServer().start()
+    diretorio = tempfile.mkdtemp(prefix='bench_checkpoint_')
+    cwd = os.getcwd()
+    try:
+        lista, template = preparar_ambiente(diretorio, args.emails)
+        os.chdir(diretorio)
+        log = os.path.join(diretorio, 'checkpoints', f'campanha_{CAMPANHA}.log')
+
+        if args.crash:
+            processo = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--filho',
+                 '--diretorio', diretorio, '--porta', str(sink.port)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            while sink.mensagens < args.enviados and processo.poll() is None:
+                time.sleep(0.01)
+            processo.send_signal(signal.SIGKILL)
+            processo.wait()
+            antes = sink.mensagens
+            print(f"Processo morto após {antes} envios; {registros_no_log(log)} registros no checkpoint")
+        else:
+            with CheckpointLog.da_campanha(CAMPANHA, lista) as checkpoint:
+                for linha in range(args.enviados):
+                    checkpoint.registrar(linha, ENVIADO, '250 2.0.0 Ok: queued')
+            antes = args.enviados
+            print(f"Checkpoint com {args.enviados} de {args.emails} linhas enviadas")
+
+        inicio = time.perf_counter()
+        with CheckpointLog.da_campanha(CAMPANHA, lista) as checkpoint:
+            carregamento = time.perf_counter() - inicio
+            concluidos = len(checkpoint.concluidos)
+
+        sink.mensagens = 0
+        duracao, primeiro = enviar(criar_dispatcher(sink.port), lista, template)
+        reenviados = antes + sink.mensagens - args.emails
+
+        print(f"Leitura do checkpoint: {carregamento * 1000:.0f}ms ({concluidos} linhas concluídas)")
+        print(f"Retomada até o primeiro envio novo: {primeiro:.2f}s")
+        print(f"Restante: {sink.mensagens} emails em {duracao:.2f}s; reenviados: {max(0, reenviados)}")
+    finally:
+        os.chdir(cwd)
+        sink.stop()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
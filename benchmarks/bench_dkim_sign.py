@@ -0,0 +1,102 @@
+"""Compara dkim.sign (caminho anterior) com o DKIMSigner, com e sem pool de processos
+
+Uso: python benchmarks/bench_dkim_sign.py [--mensagens 200] [--key chave.pem] [--processos N]
+Sem --key, gera uma chave RSA 2048 temporária com o openssl.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import dkim  # noqa: E402
+from email.mime.multipart import MIMEMultipart  # noqa: E402
+from email.mime.text import MIMEText  # noqa: E402
+from dkim_signer import DKIMSigner, HEADERS_ASSINADOS  # noqa: E402
+from sender import POLITICA_SMTP  # noqa: E402
+from template_engine import CompiledTemplate  # noqa: E402
+
+
+def gerar_mensagens(total):
+    with open(os.path.join(RAIZ, 'templates', 'desconto10.html'), encoding='utf-8') as f:
+        template = CompiledTemplate(f.read())
+    mensagens = []
+    for i in range(total):
+        msg = MIMEMultipart('alternative')
+        msg['From'] = 'Bench <bench@example.com>'
+        msg['To'] = f'cliente{i}@example.com'
+        msg['Subject'] = f'Oferta {i}'
+        html = template.render({'unsubscribe': f'https://x/unsubscribe?email=cliente{i}@example.com'})
+        msg.attach(MIMEText(template.texto_alternativo.render({}), 'plain'))
+        msg.attach(MIMEText(html, 'html'))
+        mensagens.append(msg)
+    return mensagens
+
+
+def medir(nome, funcao, total):
+    inicio = time.perf_counter()
+    funcao()
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:<32}{duracao / total * 1000:>10.2f} ms/msg{total / duracao:>10.1f} msg/s")
+    return duracao
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mensagens', type=int, default=200)
+    parser.add_argument('--key')
+    parser.add_argument('--processos', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    key_path = args.key
+    if not key_path:
+        key_path = os.path.join(tempfile.mkdtemp(prefix='bench_dkim_'), 'private.key')
+        subprocess.run(['openssl', 'genrsa', '-out', key_path, '2048'], check=True, capture_output=True)
+    with open(key_path, 'rb') as f:
+        pem = f.read()
+
+    mensagens = gerar_mensagens(args.mensagens)
+    total = len(mensagens)
+
+    def anterior():
+        # dkim.sign + nova serialização completa, como fazia o send_message
+        for msg in mensagens:
+            sig = dkim.sign(message=msg.as_bytes(), selector=b'default', domain=b'example.com',
+                            privkey=pem, include_headers=list(HEADERS_ASSINADOS))
+            copia = MIMEMultipart('alternative')
+            copia._headers = list(msg._headers) + [('DKIM-Signature', sig[len('DKIM-Signature: '):].decode())]
+            copia._payload = msg._payload
+            copia.as_bytes()
+
+    signer = DKIMSigner(pem, 'default', 'example.com')
+
+    def rapido():
+        # Serializa uma vez e prefixa a assinatura nos mesmos bytes
+        for msg in mensagens:
+            dados = msg.as_bytes(policy=POLITICA_SMTP)
+            signer.sign(dados) + dados
+
+    base = medir('dkim.sign + reserialização', anterior, total)
+    t = medir('DKIMSigner', rapido, total)
+
+    if args.processos and args.processos > 1:
+        pool = DKIMSigner(pem, 'default', 'example.com', processes=args.processos)
+        dados = [msg.as_bytes(policy=POLITICA_SMTP) for msg in mensagens]
+        pool.sign(dados[0])  # aquece os workers
+
+        def paralelo():
+            for futuro in [pool.submit(d) for d in dados]:
+                futuro.result()
+
+        tp = medir(f'DKIMSigner ({args.processos} processos)', paralelo, total)
+        pool.close()
+        print(f"Ganho com processos: {base / tp:.1f}x")
+    print(f"Ganho: {base / t:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Latência de /unsubscribe sob carga concorrente: HTTPServer serial vs. ServidorHTTP com pool
+
+Sobe o WebHandler em um diretório temporário, dispara clientes simultâneos
+de descadastro (cada um com emails novos, que gravam no SQLite) enquanto
+outros clientes consultam /api/stats, /api/lists e enviam /api/send_test,
+e mede p50/p99 por rota.
+
+Uso: python benchmarks/bench_http_load.py [--clientes 32] [--requisicoes 20] [--workers 16]
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import HTTPServer
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import server  # noqa: E402
+from app_context import AppContext  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    if not valores:
+        return float('nan')
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def requisitar(porta, metodo, caminho, corpo=None):
+    conn = http.client.HTTPConnection('127.0.0.1', porta, timeout=60)
+    inicio = time.perf_counter()
+    cabecalhos = {'Content-Type': 'application/json'} if corpo is not None else {}
+    conn.request(metodo, caminho, body=json.dumps(corpo) if corpo is not None else None, headers=cabecalhos)
+    resposta = conn.getresponse()
+    resposta.read()
+    conn.close()
+    return resposta.status, (time.perf_counter() - inicio) * 1000
+
+
+def medir(tipo_servidor, contexto, args):
+    handler = partial(server.WebHandler, contexto=contexto)
+    if tipo_servidor == 'serial':
+        httpd = HTTPServer(('127.0.0.1', 0), handler)
+        httpd.request_queue_size = 128
+    else:
+        httpd = server.ServidorHTTP(('127.0.0.1', 0), handler, workers=args.workers)
+    porta = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    latencias = {}
+    erros = []
+    lock = threading.Lock()
+    parar = threading.Event()
+
+    def registrar(rota, status, ms):
+        with lock:
+            latencias.setdefault(rota, []).append(ms)
+            if status >= 500:
+                erros.append((rota, status))
+
+    def descadastros(cliente):
+        for i in range(args.requisicoes):
+            email = f'{tipo_servidor}-{cliente}-{i}@example.com'
+            registrar('/unsubscribe', *requisitar(porta, 'GET', f'/unsubscribe?email={email}'))
+
+    def ruido(cliente):
+        rotas = ('/api/stats', '/api/lists')
+        n = 0
+        while not parar.is_set():
+            if n % 5 == 4:
+                corpo = {'email': f'teste{cliente}@example.com', 'name': 'Teste',
+                         'template': 'desconto10.html', 'subject': 'Teste'}
+                registrar('/api/send_test', *requisitar(porta, 'POST', '/api/send_test', corpo))
+            else:
+                rota = rotas[n % len(rotas)]
+                registrar(rota, *requisitar(porta, 'GET', rota))
+            n += 1
+
+    # Os prints e logs do servidor ficam fora da saída do benchmark
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        inicio = time.perf_counter()
+        clientes = [threading.Thread(target=descadastros, args=(c,)) for c in range(args.clientes)]
+        paineis = [threading.Thread(target=ruido, args=(c,)) for c in range(args.paineis)]
+        for t in clientes + paineis:
+            t.start()
+        for t in clientes:
+            t.join()
+        parar.set()
+        for t in paineis:
+            t.join()
+        duracao = time.perf_counter() - inicio
+
+    httpd.shutdown()
+    httpd.server_close()
+
+    total = len(latencias['/unsubscribe'])
+    print(f"\n{tipo_servidor}: {total} descadastros em {duracao:.1f}s ({total / duracao:.0f} req/s)")
+    print(f"{'rota':<18}{'n':>6}{'p50 (ms)':>11}{'p99 (ms)':>11}")
+    for rota, valores in sorted(latencias.items()):
+        print(f"{rota:<18}{len(valores):>6}{percentil(valores, 50):>11.1f}{percentil(valores, 99):>11.1f}")
+    if erros:
+        print(f"  {len(erros)} respostas 5xx")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clientes', type=int, default=32)
+    parser.add_argument('--requisicoes', type=int, default=20)
+    parser.add_argument('--paineis', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--servidor', choices=('serial', 'pool', 'ambos'), default='ambos')
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    try:
+        shutil.copytree(os.path.join(RAIZ, 'templates'), os.path.join(diretorio, 'templates'))
+        shutil.copytree(os.path.join(RAIZ, 'lists'), os.path.join(diretorio, 'lists'))
+        shutil.copy(os.path.join(RAIZ, 'app.html'), diretorio)
+        os.chdir(diretorio)
+
+        server.WebHandler.log_message = lambda *a, **k: None
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            contexto = AppContext()
+            # Aquece o cache das listas antes de medir
+            for arquivo in contexto.lists_dir.glob('*.csv'):
+                contexto.catalogo.info(arquivo)
+
+        tipos = ('serial', 'pool') if args.servidor == 'ambos' else (args.servidor,)
+        for tipo in tipos:
+            medir(tipo, contexto, args)
+        contexto.close()
+    finally:
+        os.chdir(RAIZ)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Pico de memória ao preparar uma lista grande: read_csv inteiro vs. leitura em blocos
+
+Gera uma lista sintética no formato de lists/lista_completa.csv (EMAIL, NOME
+e quatro colunas vazias sem nome) e mede, em subprocessos separados, o pico
+de RSS de cada estratégia percorrendo todos os destinatários aptos.
+
+Uso: python benchmarks/bench_list_memory.py [--linhas 5000000] [--bloco 50000]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def gerar_lista(caminho, linhas):
+    dominios = ('gmail.com', 'hotmail.com', 'yahoo.com.br', 'uol.com.br', 'empresa.com.br')
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write('EMAIL,NOME,,,\n')
+        for i in range(linhas):
+            # ~1% de duplicados e ~0,5% de inválidos
+            n = i - 7 if i % 100 == 99 else i
+            email = f'cliente{n}@{dominios[n % len(dominios)]}' if i % 200 != 17 else f'invalido{i}'
+            f.write(f'{email},Cliente Número {n} Silva,,,\n')
+
+
+def pico_rss_mb():
+    # ru_maxrss em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def executar(estrategia, caminho, bloco, db_path):
+    import pandas as pd
+    from blacklist import BlacklistIndex
+    from list_reader import ListaCSV
+    from recipients import RegistroVistos, preparar_destinatarios
+
+    blacklist = BlacklistIndex(db_path)
+    base = pico_rss_mb()
+    inicio = time.perf_counter()
+    aptos = 0
+    if estrategia == 'completo':
+        # Caminho anterior: todas as colunas de uma vez, dtype object
+        df = pd.read_csv(caminho)
+        df.columns = [str(coluna).upper() for coluna in df.columns]
+        for _ in preparar_destinatarios(df, blacklist):
+            aptos += 1
+    else:
+        vistos = RegistroVistos()
+        for df in ListaCSV(caminho, chunksize=bloco).blocos():
+            for _ in preparar_destinatarios(df, blacklist, vistos):
+                aptos += 1
+    duracao = time.perf_counter() - inicio
+    print(f"{estrategia:>10}: {aptos} aptos em {duracao:.1f}s, "
+          f"pico de RSS {pico_rss_mb():.0f} MB (base {base:.0f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--linhas', type=int, default=5_000_000)
+    parser.add_argument('--bloco', type=int, default=50_000)
+    parser.add_argument('--executar', choices=('completo', 'blocos'))
+    parser.add_argument('--lista')
+    parser.add_argument('--db')
+    args = parser.parse_args()
+
+    if args.executar:
+        executar(args.executar, args.lista, args.bloco, args.db)
+        return
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, 'lista.csv')
+        inicio = time.perf_counter()
+        gerar_lista(caminho, args.linhas)
+        tamanho = os.path.getsize(caminho) / 1024 / 1024
+        print(f"Lista sintética: {args.linhas} linhas, {tamanho:.0f} MB "
+              f"(gerada em {time.perf_counter() - inicio:.1f}s)")
+
+        for estrategia in ('blocos', 'completo'):
+            subprocess.run([
+                sys.executable, os.path.abspath(__file__),
+                '--executar', estrategia, '--lista', caminho, '--bloco', str(args.bloco),
+                '--db', os.path.join(diretorio, 'blacklist.db')
+            ], check=False)
+
+
+if __name__ == '__main__':
+    main()
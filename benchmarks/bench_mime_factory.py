@@ -0,0 +1,88 @@
+"""Custo por mensagem da montagem MIME: MIMEMultipart + as_bytes vs. esqueleto pré-codificado
+
+Mede tempo, chamadas de função (cProfile) e pico de memória temporária
+(tracemalloc) por mensagem. O CPython não expõe um contador acumulado de
+alocações; chamadas de função e pico de memória são usados como proxies.
+
+Uso: python benchmarks/bench_mime_factory.py [--mensagens 500] [--template desconto10.html]
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from sender import EmailDispatcher  # noqa: E402
+from mime_factory import MessageFactory  # noqa: E402
+from template_engine import compilar_template  # noqa: E402
+
+REMETENTE = 'Bench <bench@example.com>'
+
+
+def medir(funcao, mensagens):
+    inicio = time.perf_counter()
+    for i in range(mensagens):
+        funcao(i)
+    tempo = (time.perf_counter() - inicio) / mensagens * 1e6
+
+    perfil = cProfile.Profile()
+    perfil.enable()
+    for i in range(mensagens):
+        funcao(i)
+    perfil.disable()
+    chamadas = pstats.Stats(perfil).total_calls / mensagens
+
+    funcao(0)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    funcao(1)
+    pico = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return tempo, chamadas, pico
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mensagens', type=int, default=500)
+    parser.add_argument('--template', default='desconto10.html')
+    args = parser.parse_args()
+
+    with open(os.path.join(RAIZ, 'templates', args.template), encoding='utf-8') as f:
+        template = compilar_template(f.read())
+    assunto = compilar_template('Oferta especial para {primeiro_nome}')
+
+    dispatcher = EmailDispatcher()
+    dispatcher.logger.setLevel('WARNING')
+
+    def antigo(i):
+        msg = dispatcher.montar_email(f"cliente{i}@example.com", f"Cliente {i}", assunto, template,
+                                      REMETENTE, None, "Cliente")
+        dispatcher.serializar_email(msg)
+
+    resultados = [('MIMEMultipart', antigo)]
+    for oito_bits in (False, True):
+        fabrica = MessageFactory(template, assunto, REMETENTE, dispatcher.hostname, oito_bits=oito_bits)
+
+        def novo(i, fabrica=fabrica):
+            fabrica.montar(f"cliente{i}@example.com", f"Cliente {i}", "Cliente")
+
+        resultados.append(('fábrica (8bit)' if oito_bits else 'fábrica (QP)', novo))
+
+    print(f"template: {args.template} ({len(template.texto)} caracteres), {args.mensagens} mensagens")
+    print(f"{'caminho':<18}{'us/msg':>10}{'chamadas/msg':>14}{'pico KB':>10}{'ganho':>8}")
+    referencia = None
+    for nome, funcao in resultados:
+        tempo, chamadas, pico = medir(funcao, args.mensagens)
+        referencia = referencia or (tempo, chamadas)
+        print(f"{nome:<18}{tempo:>10.1f}{chamadas:>14.0f}{pico / 1024:>10.1f}"
+              f"{referencia[0] / tempo:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Latência por rota com serviços criados a cada requisição vs. contexto compartilhado (AppContext)
+
+"antes" reproduz o WebHandler anterior, que construía um EmailDispatcher e
+um EmailScheduler (com conexão SQLite própria) em cada requisição, inclusive
+nas de arquivos estáticos. Um único cliente faz requisições em sequência.
+
+Uso: python benchmarks/bench_request_latency.py [--requisicoes 200]
+"""
+import argparse
+import contextlib
+import copy
+import http.client
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import server  # noqa: E402
+from app_context import AppContext  # noqa: E402
+from scheduler import EmailScheduler  # noqa: E402
+from sender import EmailDispatcher  # noqa: E402
+
+ROTAS = ('/app.html', '/api/stats', '/schedules', '/list_templates', '/api/lists')
+
+
+class HandlerPorRequisicao(server.WebHandler):
+    """Comportamento anterior: dispatcher e scheduler novos em cada requisição"""
+
+    def __init__(self, *args, contexto=None, **kwargs):
+        contexto = copy.copy(contexto)
+        contexto.dispatcher = EmailDispatcher()
+        contexto.scheduler = EmailScheduler(contexto.campanhas)
+        super().__init__(*args, contexto=contexto, **kwargs)
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def medir(handler_class, contexto, requisicoes):
+    httpd = server.ServidorHTTP(('127.0.0.1', 0), partial(handler_class, contexto=contexto), workers=4)
+    porta = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    resultados = {}
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        for rota in ROTAS:
+            latencias = []
+            for _ in range(requisicoes):
+                conn = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+                inicio = time.perf_counter()
+                conn.request('GET', rota)
+                conn.getresponse().read()
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                conn.close()
+            resultados[rota] = (percentil(latencias, 50), percentil(latencias, 99))
+
+    httpd.shutdown()
+    httpd.server_close()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requisicoes', type=int, default=200)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    try:
+        shutil.copytree(os.path.join(RAIZ, 'templates'), os.path.join(diretorio, 'templates'))
+        shutil.copytree(os.path.join(RAIZ, 'lists'), os.path.join(diretorio, 'lists'))
+        shutil.copy(os.path.join(RAIZ, 'app.html'), diretorio)
+        os.chdir(diretorio)
+
+        server.WebHandler.log_message = lambda *a, **k: None
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            contexto = AppContext()
+            for arquivo in contexto.lists_dir.glob('*.csv'):
+                contexto.catalogo.info(arquivo)
+
+        antes = medir(HandlerPorRequisicao, contexto, args.requisicoes)
+        depois = medir(server.WebHandler, contexto, args.requisicoes)
+        contexto.close()
+
+        print(f"{'rota':<16}{'antes p50':>11}{'p99':>9}{'depois p50':>12}{'p99':>9}  (ms)")
+        for rota in ROTAS:
+            print(f"{rota:<16}{antes[rota][0]:>11.2f}{antes[rota][1]:>9.2f}"
+                  f"{depois[rota][0]:>12.2f}{depois[rota][1]:>9.2f}")
+    finally:
+        os.chdir(RAIZ)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Envio sequencial vs. campanha dividida em processos (modo 'processos') contra um SMTP local
+
+Com DKIM (chave RSA 2048 gerada pelo openssl) e sem latência no SMTP, o
+trabalho é dominado por CPU (render, MIME, assinatura) e o ganho
+acompanha o número de núcleos; com --latency, os processos também
+sobrepõem a espera do servidor.
+
+Uso: python benchmarks/bench_sharded_dispatch.py [--emails 2000] [--processos 1 2 4] [--latency 0]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bench_async_dispatch import preparar_ambiente  # noqa: E402
+from fake_smtp import FakeSMTPServer  # noqa: E402
+from rate_limiter import DomainRateLimiter  # noqa: E402
+from sender import EmailDispatcher  # noqa: E402
+
+
+def executar(modo, processos, lista, template, key_path, sink):
+    dispatcher = EmailDispatcher()
+    dispatcher.logger.setLevel('WARNING')
+    dispatcher.smtp_config.update({'host': '127.0.0.1', 'port': sink.port})
+    dispatcher.rate_limiter = DomainRateLimiter(global_rate=1_000_000, domain_limits={})
+    dispatcher.dkim_config.update({'private_key_path': key_path, 'domain': 'example.com'})
+    dispatcher.dkim_signer = None
+    dispatcher.carregar_dkim()
+    dispatcher.processos_config['processos'] = processos
+
+    inicio_msgs = sink.mensagens
+    inicio = time.perf_counter()
+    dispatcher.enviar_emails(lista, template, '2000-01-01 00:00:00', 'Oferta para {primeiro_nome}',
+                             'Bench <bench@example.com>', modo=modo)
+    duracao = time.perf_counter() - inicio
+    dispatcher.fechar_pool_smtp()
+    return sink.mensagens - inicio_msgs, duracao
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emails', type=int, default=2000)
+    parser.add_argument('--processos', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--latency', type=float, default=0.0, help='latência simulada do MTA por mensagem (s)')
+    args = parser.parse_args()
+
+    sink = FakeSMTPServer(latency=args.latency).start()
+    diretorio = tempfile.mkdtemp(prefix='bench_sharded_')
+    cwd = os.getcwd()
+    try:
+        lista, template = preparar_ambiente(diretorio, args.emails)
+        key_path = os.path.join(diretorio, 'private.key')
+        subprocess.run(['openssl', 'genrsa', '-out', key_path, '2048'], check=True, capture_output=True)
+        os.chdir(diretorio)
+
+        print(f"{os.cpu_count()} núcleos, {args.emails} emails, latência do SMTP {args.latency * 1000:.0f}ms")
+        enviados, duracao = executar('sequencial', 1, lista, template, key_path, sink)
+        base = enviados / duracao
+        print(f"{'sequencial':>14}: {enviados} emails em {duracao:6.2f}s ({base:7.1f} emails/s)")
+        for processos in args.processos:
+            enviados, duracao = executar('processos', processos, lista, template, key_path, sink)
+            taxa = enviados / duracao
+            print(f"{f'{processos} processo(s)':>14}: {enviados} emails em {duracao:6.2f}s "
+                  f"({taxa:7.1f} emails/s, {taxa / base:.1f}x)")
+    finally:
+        os.chdir(cwd)
+        sink.stop()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Comandos SMTP por segundo: transação síncrona vs. PIPELINING vs. vários RCPT por envelope
+
+O sink local responde cada rajada de comandos depois de `--rtt` segundos,
+simulando a ida e volta na rede. O aiosmtpd não é dependência do projeto;
+o sink de fake_smtp anuncia PIPELINING e 8BITMIME como o Postfix.
+
+Uso: python benchmarks/bench_smtp_pipeline.py [--emails 1000] [--rtt 0.002] [--conexoes 1]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bench_async_dispatch import preparar_ambiente  # noqa: E402
+from fake_smtp import FakeSMTPServer  # noqa: E402
+from sender import EmailDispatcher  # noqa: E402
+from rate_limiter import DomainRateLimiter  # noqa: E402
+from template_engine import PADRAO_PLACEHOLDER  # noqa: E402
+
+
+def executar(modo, lista, template, assunto, por_envelope, sink, args):
+    dispatcher = EmailDispatcher()
+    dispatcher.logger.setLevel('WARNING')
+    dispatcher.smtp_config.update({'host': '127.0.0.1', 'port': sink.port})
+    dispatcher.rate_limiter = DomainRateLimiter(global_rate=args.rate, domain_limits={})
+    dispatcher.pipeline_config['conexoes'] = args.conexoes
+    dispatcher.pipeline_config['destinatarios_por_envelope'] = por_envelope
+
+    inicio_cmds, inicio_rcpts = sink.comandos, sink.destinatarios
+    inicio = time.perf_counter()
+    dispatcher.enviar_emails(lista, template, '2000-01-01 00:00:00', assunto,
+                             'Bench <bench@example.com>', modo=modo)
+    duracao = time.perf_counter() - inicio
+    dispatcher.fechar_pool_smtp()
+    return sink.destinatarios - inicio_rcpts, sink.comandos - inicio_cmds, duracao
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emails', type=int, default=1000)
+    parser.add_argument('--rtt', type=float, default=0.002, help='ida e volta simulada na rede (s)')
+    parser.add_argument('--conexoes', type=int, default=1, help='conexões do modo pipeline')
+    parser.add_argument('--rate', type=float, default=100000, help='limite de emails/s')
+    args = parser.parse_args()
+
+    sink = FakeSMTPServer(rtt=args.rtt).start()
+    diretorio = tempfile.mkdtemp(prefix='bench_pipeline_')
+    cwd = os.getcwd()
+    try:
+        lista, template = preparar_ambiente(diretorio, args.emails)
+        # Mesmo template sem placeholders: a mensagem é igual para todos (vários RCPT por envelope)
+        coletivo = os.path.join(diretorio, 'coletivo.html')
+        with open(template, encoding='utf-8') as f, open(coletivo, 'w', encoding='utf-8') as saida:
+            saida.write(PADRAO_PLACEHOLDER.sub('', f.read()))
+        os.chdir(diretorio)
+
+        cenarios = [
+            ('sequencial', 'sequencial', template, 'Oferta para {primeiro_nome}', 1),
+            ('pipeline', 'pipeline', template, 'Oferta para {primeiro_nome}', 1),
+            # Opt-in: o envelope coletivo não leva o descadastro de um clique
+            ('pipeline + RCPT', 'pipeline', coletivo, 'Oferta da semana', 50),
+        ]
+        print(f"{args.emails} emails, rtt {args.rtt * 1000:.1f}ms, {args.conexoes} conexão(ões) no pipeline")
+        print(f"{'cenário':<18}{'emails/s':>10}{'comandos':>10}{'comandos/s':>12}{'tempo (s)':>11}")
+        base = None
+        for nome, modo, arquivo, assunto, por_envelope in cenarios:
+            enviados, comandos, duracao = executar(modo, lista, arquivo, assunto, por_envelope, sink, args)
+            base = base or enviados / duracao
+            print(f"{nome:<18}{enviados / duracao:>10.1f}{comandos:>10}{comandos / duracao:>12.1f}{duracao:>11.2f}"
+                  f"  ({enviados / duracao / base:.1f}x)")
+    finally:
+        os.chdir(cwd)
+        sink.stop()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Custo por mensagem da personalização: replace encadeado vs. template compilado
+
+Uso: python benchmarks/bench_template_render.py [--iteracoes 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from template_engine import CompiledTemplate  # noqa: E402
+
+
+def render_replace(template, nome, primeiro_nome, unsubscribe_url):
+    """Caminho anterior: três str.replace sobre o template inteiro"""
+    return template.replace('{nome}', nome)\
+                   .replace('{primeiro_nome}', primeiro_nome)\
+                   .replace('{{ unsubscribe }}', unsubscribe_url)
+
+
+def medir(funcao, iteracoes):
+    inicio = time.perf_counter()
+    for i in range(iteracoes):
+        funcao(i)
+    return (time.perf_counter() - inicio) / iteracoes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iteracoes', type=int, default=2000)
+    args = parser.parse_args()
+
+    diretorio = os.path.join(RAIZ, 'templates')
+    print(f"{'template':<24}{'bytes':>8}{'replace (us)':>14}{'compilado (us)':>16}{'ganho':>8}")
+    for arquivo in sorted(os.listdir(diretorio)):
+        if not arquivo.endswith('.html'):
+            continue
+        with open(os.path.join(diretorio, arquivo), encoding='utf-8') as f:
+            texto = f.read()
+
+        compilado = CompiledTemplate(texto)
+
+        def antigo(i):
+            render_replace(texto, f"Cliente {i}", "Cliente", f"https://x/unsubscribe?email=c{i}@ex.com")
+
+        def novo(i):
+            compilado.render({
+                'nome': f"Cliente {i}",
+                'primeiro_nome': "Cliente",
+                'unsubscribe': f"https://x/unsubscribe?email=c{i}@ex.com"
+            })
+
+        t_antigo = medir(antigo, args.iteracoes)
+        t_novo = medir(novo, args.iteracoes)
+        print(f"{arquivo:<24}{len(texto):>8}{t_antigo:>14.2f}{t_novo:>16.2f}{t_antigo / t_novo:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
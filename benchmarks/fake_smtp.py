@@ -0,0 +1,96 @@
+"""Servidor SMTP local descartável usado pelos benchmarks (aceita e descarta tudo)"""
+import socketserver
+import threading
+import time
+
+
+class _SMTPSinkHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        sock = self.request
+        sock.sendall(b"220 sink.local ESMTP\r\n")
+        em_dados = False
+        destinatarios = 0
+        pendente = b""
+        while True:
+            dados = sock.recv(65536)
+            if not dados:
+                return
+            linhas = (pendente + dados).split(b"\r\n")
+            pendente = linhas.pop()
+            respostas = []
+            encerrar = False
+            # Tudo o que o cliente enviou de uma vez é respondido de uma vez (PIPELINING)
+            for linha in linhas:
+                if em_dados:
+                    if linha == b".":
+                        em_dados = False
+                        if server.latency:
+                            time.sleep(server.latency)
+                        with server.lock:
+                            server.mensagens += 1
+                            server.destinatarios += destinatarios
+                        destinatarios = 0
+                        respostas.append(b"250 2.0.0 Ok: queued\r\n")
+                    continue
+                with server.lock:
+                    server.comandos += 1
+                comando = linha[:4].upper()
+                if comando in (b"EHLO", b"HELO"):
+                    respostas.append(b"250-sink.local\r\n250-PIPELINING\r\n250-8BITMIME\r\n250 SIZE 104857600\r\n")
+                elif comando == b"DATA":
+                    em_dados = True
+                    respostas.append(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                elif comando == b"RCPT":
+                    destinatarios += 1
+                    respostas.append(b"250 2.1.5 Ok\r\n")
+                elif comando in (b"MAIL", b"RSET"):
+                    destinatarios = 0
+                    respostas.append(b"250 2.0.0 Ok\r\n")
+                elif comando == b"QUIT":
+                    respostas.append(b"221 2.0.0 Bye\r\n")
+                    encerrar = True
+                    break
+                else:
+                    respostas.append(b"250 2.0.0 Ok\r\n")
+            if respostas:
+                # Uma ida e volta na rede por rajada de comandos do cliente
+                if server.rtt:
+                    time.sleep(server.rtt)
+                sock.sendall(b"".join(respostas))
+            if encerrar:
+                return
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Sink SMTP em thread
+
+    `latency` simula o tempo do MTA para enfileirar cada mensagem e `rtt` o
+    tempo de ida e volta na rede, pago uma vez a cada rajada de comandos
+    que o cliente envia antes de esperar as respostas.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rtt=0.0):
+        super().__init__((host, port), _SMTPSinkHandler)
+        self.latency = latency
+        self.rtt = rtt
+        self.lock = threading.Lock()
+        self.mensagens = 0
+        self.destinatarios = 0
+        self.comandos = 0
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,577 @@
+import csv
+import hashlib
+import io
+import math
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+
+from list_reader import detectar_encoding
+from recipients import PADRAO_EMAIL
+
+
+DB_BLACKLIST = 'email_blacklist.db'
+
+SCHEMA_BLACKLIST = '''
+    CREATE TABLE IF NOT EXISTS invalid_emails (
+        email TEXT PRIMARY KEY,
+        reason TEXT,
+        date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        campaign_id TEXT
+    )
+'''
+
+
+# Inclusões avulsas (bounces, descadastros) atualizam motivo, data e campanha
+# de quem já estava na lista, como o antigo INSERT OR REPLACE, mas sem trocar
+# o rowid. A importação em massa só insere os novos e conta o que entrou.
+GRAVAR_BLACKLIST = '''
+    INSERT INTO invalid_emails (email, reason, campaign_id) VALUES (?, ?, ?)
+    ON CONFLICT(email) DO UPDATE SET
+        reason = excluded.reason,
+        date_added = CURRENT_TIMESTAMP,
+        campaign_id = excluded.campaign_id
+'''
+
+IMPORTAR_BLACKLIST = 'INSERT OR IGNORE INTO invalid_emails (email, reason, campaign_id) VALUES (?, ?, ?)'
+
+# Limite de parâmetros por consulta na confirmação dos positivos do filtro de Bloom
+LOTE_CONFIRMACAO = 500
+
+COLUNAS_EXPORTACAO = ('email', 'reason', 'date_added', 'campaign_id')
+
+
+def normalizar_email(email):
+    """Forma canônica usada nas comparações com a blacklist"""
+    return str(email).strip().lower()
+
+
+def abrir_banco(db_path):
+    """Conexão com o banco da blacklist em modo WAL (leitores não esperam o escritor)"""
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # Em WAL, NORMAL só sincroniza no checkpoint: o commit não espera o fsync
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(SCHEMA_BLACKLIST)
+    conn.commit()
+    return conn
+
+
+def abrir_leitura(db_path):
+    """Conexão somente leitura (mode=ro): não cria a tabela nem mexe no journal"""
+    uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30)
+
+
+class ReadConnectionPool:
+    """Conexões de leitura reutilizadas entre threads, criadas sob demanda até `tamanho`"""
+
+    def __init__(self, db_path, tamanho=4):
+        self.db_path = db_path
+        self.tamanho = tamanho
+        self._livres = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        conn = abrir_banco(self.db_path)
+        conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    @contextmanager
+    def conexao(self):
+        try:
+            conn = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                criar = self._criadas < self.tamanho
+                if criar:
+                    self._criadas += 1
+            if criar:
+                try:
+                    conn = self._abrir()
+                except Exception:
+                    with self._lock:
+                        self._criadas -= 1
+                    raise
+            else:
+                conn = self._livres.get()
+        try:
+            yield conn
+        finally:
+            self._livres.put(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._livres.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._criadas -= 1
+
+
+class BloomFilter:
+    """Filtro de Bloom simples (bytearray + hashing duplo com blake2b)"""
+
+    def __init__(self, capacidade, taxa_erro=0.001):
+        capacidade = max(1, capacidade)
+        self.bits = max(8, int(-capacidade * math.log(taxa_erro) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacidade * math.log(2))))
+        self.dados = bytearray((self.bits + 7) // 8)
+
+    def _posicoes(self, valor):
+        digest = hashlib.blake2b(valor.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, valor):
+        for posicao in self._posicoes(valor):
+            self.dados[posicao >> 3] |= 1 << (posicao & 7)
+
+    def __contains__(self, valor):
+        return all(self.dados[posicao >> 3] & (1 << (posicao & 7)) for posicao in self._posicoes(valor))
+
+
+class BlacklistIndex:
+    """Índice em memória da tabela invalid_emails, carregado uma vez por campanha
+
+    Tabelas pequenas ficam inteiras em um set. Acima de `bloom_threshold`
+    linhas, apenas um filtro de Bloom fica em memória e os positivos são
+    confirmados no SQLite. Novas entradas chegam pelo feed incremental
+    (rowid > último rowid visto) e por `registrar`, chamado pelos
+    descadastros no mesmo processo. As consultas ao SQLite usam um pool de
+    conexões de leitura, fora do lock do índice.
+    """
+
+    _compartilhados = {}
+    _lock_compartilhados = threading.Lock()
+
+    def __init__(self, db_path=DB_BLACKLIST, bloom_threshold=2_000_000, intervalo_atualizacao=5):
+        self.db_path = db_path
+        self.bloom_threshold = bloom_threshold
+        self.intervalo_atualizacao = intervalo_atualizacao
+        self._lock = threading.RLock()
+        self._leitura = ReadConnectionPool(db_path)
+        self._emails = set()
+        self._bloom = None
+        self._ultimo_rowid = 0
+        self._ultima_atualizacao = 0
+        self.carregado = False
+
+    @classmethod
+    def compartilhado(cls, db_path=DB_BLACKLIST):
+        """Instância única por banco no processo, compartilhada entre dispatcher, scheduler e servidor"""
+        with cls._lock_compartilhados:
+            indice = cls._compartilhados.get(db_path)
+            if indice is None:
+                indice = cls(db_path)
+                cls._compartilhados[db_path] = indice
+            return indice
+
+    def carregar(self):
+        """Carrega (ou recarrega) toda a tabela de uma vez"""
+        with self._lock, self._leitura.conexao() as conn:
+            total, ultimo = conn.execute('SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM invalid_emails').fetchone()
+            self._emails = set()
+            self._bloom = None
+            if total > self.bloom_threshold:
+                # Positivos do filtro são confirmados por lower(email), que precisa de índice
+                escrita = abrir_banco(self.db_path)
+                try:
+                    escrita.execute('CREATE INDEX IF NOT EXISTS idx_invalid_emails_lower ON invalid_emails(lower(email))')
+                    escrita.commit()
+                finally:
+                    escrita.close()
+                self._bloom = BloomFilter(total * 2)
+            for (email,) in conn.execute('SELECT email FROM invalid_emails WHERE rowid <= ?', (ultimo,)):
+                self._adicionar(normalizar_email(email))
+            self._ultimo_rowid = ultimo
+            self._ultima_atualizacao = time.monotonic()
+            self.carregado = True
+            return total
+
+    def garantir_carregado(self):
+        """Carrega na primeira utilização; depois apenas aplica o feed incremental"""
+        if not self.carregado:
+            return self.carregar()
+        self.atualizar()
+
+    def _adicionar(self, email):
+        if self._bloom is not None:
+            self._bloom.add(email)
+        else:
+            self._emails.add(email)
+
+    def atualizar(self):
+        """Aplica as linhas inseridas desde a última leitura (feed por rowid)"""
+        with self._lock:
+            if not self.carregado:
+                self.carregar()
+                return
+            with self._leitura.conexao() as conn:
+                cursor = conn.execute(
+                    'SELECT rowid, email FROM invalid_emails WHERE rowid > ? ORDER BY rowid',
+                    (self._ultimo_rowid,)
+                )
+                for rowid, email in cursor:
+                    self._adicionar(normalizar_email(email))
+                    self._ultimo_rowid = rowid
+            self._ultima_atualizacao = time.monotonic()
+
+    def _talvez_atualizar(self):
+        if time.monotonic() - self._ultima_atualizacao >= self.intervalo_atualizacao:
+            self.atualizar()
+
+    def registrar(self, email):
+        """Publica imediatamente um email recém-incluído na blacklist"""
+        with self._lock:
+            if self.carregado:
+                self._adicionar(normalizar_email(email))
+
+    def contem(self, email):
+        """Verifica se o email está na blacklist"""
+        email = normalizar_email(email)
+        with self._lock:
+            if not self.carregado:
+                self.carregar()
+            else:
+                self._talvez_atualizar()
+            if self._bloom is None:
+                return email in self._emails
+            if email not in self._bloom:
+                return False
+        # Confirma o positivo do filtro de Bloom no banco (fora do lock)
+        with self._leitura.conexao() as conn:
+            return conn.execute(
+                'SELECT 1 FROM invalid_emails WHERE lower(email) = ?', (email,)
+            ).fetchone() is not None
+
+    __contains__ = contem
+
+    def mascara(self, emails):
+        """Série booleana indicando quais emails (já normalizados) estão na blacklist"""
+        self.garantir_carregado()
+        with self._lock:
+            if self._bloom is None:
+                return emails.isin(self._emails)
+            candidatos = [email for email in emails.unique() if isinstance(email, str) and email in self._bloom]
+        # Confirma os positivos do filtro no banco, em lotes e fora do lock
+        confirmados = set()
+        with self._leitura.conexao() as conn:
+            for inicio in range(0, len(candidatos), LOTE_CONFIRMACAO):
+                lote = candidatos[inicio:inicio + LOTE_CONFIRMACAO]
+                cursor = conn.execute(
+                    f"SELECT lower(email) FROM invalid_emails WHERE lower(email) IN ({', '.join('?' * len(lote))})",
+                    lote
+                )
+                confirmados.update(email for (email,) in cursor)
+        return emails.isin(confirmados)
+
+    def filtrar(self, df, coluna='EMAIL'):
+        """Remove do DataFrame os emails da blacklist; retorna (df_filtrado, quantidade_removida)"""
+        bloqueados = self.mascara(df[coluna].astype(str).str.strip().str.lower())
+        removidos = int(bloqueados.sum())
+        if removidos:
+            df = df[~bloqueados]
+        return df, removidos
+
+    def __len__(self):
+        with self._lock:
+            if self._bloom is None:
+                return len(self._emails)
+        with self._leitura.conexao() as conn:
+            return conn.execute('SELECT COUNT(*) FROM invalid_emails').fetchone()[0]
+
+    def close(self):
+        self._leitura.close()
+
+
+class _Pedido:
+    """Linhas a gravar (ou um bloco de importação) e o Future avisado no commit"""
+
+    __slots__ = ('linhas', 'importacao', 'aguardado', 'futuro')
+
+    def __init__(self, linhas, importacao=False, aguardado=False):
+        self.linhas = linhas
+        self.importacao = importacao
+        # Alguém espera o commit: o grupo não aguarda o fim do intervalo
+        self.aguardado = aguardado
+        self.futuro = Future()
+
+
+class BlacklistStore:
+    """Escritas na blacklist por uma única conexão WAL, com commit em grupo
+
+    `adicionar` apenas enfileira: uma thread escritora junta o que chegou
+    em até `intervalo` segundos (ou `lote` linhas) e grava tudo com um
+    executemany e um único commit. O email é publicado no BlacklistIndex
+    na hora, então as campanhas em andamento já deixam de enviar para ele
+    antes do commit. Quem precisa da gravação confirmada (descadastros)
+    passa `aguardar=True`: o grupo é gravado assim que a fila esvazia, e
+    quem chegar durante o commit vai junto no próximo.
+
+    Importações (`importar`, `importar_csv`) passam pela mesma thread, um
+    pedido por bloco de `lote_importacao` linhas (uma transação cada), então
+    descadastros que chegam no meio esperam no máximo um bloco.
+    `exportar_csv` lê por uma conexão própria, somente leitura (em WAL a
+    leitura longa não trava o escritor).
+    """
+
+    _compartilhados = {}
+    _lock_compartilhados = threading.Lock()
+
+    def __init__(self, db_path=DB_BLACKLIST, intervalo=0.05, lote=500, lote_importacao=10_000, indice=None):
+        self.db_path = db_path
+        self.intervalo = intervalo
+        self.lote = lote
+        self.lote_importacao = lote_importacao
+        self.indice = indice if indice is not None else BlacklistIndex.compartilhado(db_path)
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._fechado = False
+        self.metrics = {
+            'enfileirados': 0,
+            'gravados': 0,
+            'commits': 0,
+            'importados': 0
+        }
+        # Cria o banco (e ativa o WAL) antes do primeiro uso
+        abrir_banco(db_path).close()
+
+    @classmethod
+    def compartilhado(cls, db_path=DB_BLACKLIST):
+        """Instância única por banco no processo (um único escritor)"""
+        with cls._lock_compartilhados:
+            store = cls._compartilhados.get(db_path)
+            if store is None:
+                store = cls(db_path)
+                cls._compartilhados[db_path] = store
+            return store
+
+    def _enfileirar(self, pedido):
+        with self._lock:
+            if self._fechado:
+                raise RuntimeError('BlacklistStore encerrado')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='blacklist-writer', daemon=True)
+                self._thread.start()
+            self._fila.put(pedido)
+        return pedido.futuro
+
+    def adicionar(self, email, motivo, campanha_id=None, aguardar=False):
+        """Enfileira o email para a blacklist; com `aguardar`, bloqueia até o commit"""
+        self.indice.registrar(email)
+        with self._lock:
+            self.metrics['enfileirados'] += 1
+        futuro = self._enfileirar(_Pedido([(email, motivo, campanha_id)], aguardado=aguardar))
+        if aguardar:
+            futuro.result()
+        return futuro
+
+    def importar(self, emails, motivo, campanha_id=None, progresso=None):
+        """Grava vários emails (iterável, consumido aos poucos); retorna quantos eram novos
+
+        Cada bloco de `lote_importacao` emails é um pedido à thread escritora;
+        `progresso(inseridos)` é chamado após o commit de cada um.
+        """
+        inseridos = 0
+        emails = iter(emails)
+        while True:
+            bloco = [(email, motivo, campanha_id) for email in islice(emails, self.lote_importacao)]
+            if not bloco:
+                return inseridos
+            inseridos += self._enfileirar(_Pedido(bloco, importacao=True)).result()
+            # As linhas novas chegam ao índice pelo feed incremental
+            self.indice.atualizar()
+            if progresso is not None:
+                progresso(inseridos)
+
+    @staticmethod
+    def coluna_csv(caminho, coluna='EMAIL'):
+        """Encoding, posição da coluna `coluna` e se o CSV tem cabeçalho
+
+        Em arquivos sem cabeçalho (a primeira linha já é um email) usa a
+        primeira coluna; com cabeçalho, a coluna precisa existir, senão
+        ValueError com as colunas disponíveis.
+        """
+        encoding = detectar_encoding(caminho)
+        # utf-8-sig lê arquivos com ou sem BOM
+        if encoding.lower().replace('_', '-') in ('utf-8', 'ascii'):
+            encoding = 'utf-8-sig'
+        with open(caminho, newline='', encoding=encoding) as f:
+            primeira = next(csv.reader(f), [])
+        if '@' in ''.join(primeira):
+            return encoding, 0, False
+        cabecalho = [nome.strip().upper() for nome in primeira]
+        if coluna.upper() not in cabecalho:
+            disponiveis = ', '.join(nome.strip() for nome in primeira if nome.strip()) or 'nenhuma'
+            raise ValueError(f"Coluna '{coluna}' não encontrada no CSV (colunas disponíveis: {disponiveis})")
+        return encoding, cabecalho.index(coluna.upper()), True
+
+    def importar_csv(self, caminho, motivo, coluna='EMAIL', campanha_id=None, progresso=None):
+        """Importa uma lista de supressão em CSV, lida em streaming
+
+        Usa a coluna `coluna` (a primeira em arquivos sem cabeçalho; ver
+        coluna_csv). Os emails são normalizados e validados; os que já estão
+        na blacklist (inclusive os gravados por blocos anteriores do mesmo
+        arquivo) são pulados pelo índice, e o INSERT OR IGNORE descarta os
+        repetidos dentro de um bloco. Retorna a contagem (linhas, invalidos,
+        duplicados, existentes, inseridos), também passada a
+        `progresso(contagem)` a cada bloco gravado.
+        """
+        contagem = {'linhas': 0, 'invalidos': 0, 'duplicados': 0, 'existentes': 0, 'inseridos': 0}
+        candidatos = 0
+        encoding, posicao, tem_cabecalho = self.coluna_csv(caminho, coluna)
+
+        def emails():
+            nonlocal candidatos
+            with open(caminho, newline='', encoding=encoding) as f:
+                linhas = csv.reader(f)
+                if tem_cabecalho:
+                    next(linhas, None)
+                for linha in linhas:
+                    contagem['linhas'] += 1
+                    email = normalizar_email(linha[posicao]) if len(linha) > posicao else ''
+                    if not PADRAO_EMAIL.match(email):
+                        contagem['invalidos'] += 1
+                    elif self.indice.contem(email):
+                        contagem['existentes'] += 1
+                    else:
+                        candidatos += 1
+                        yield email
+
+        def contar(inseridos):
+            # Os que o INSERT OR IGNORE descartou se repetiam no mesmo bloco
+            contagem['inseridos'] = inseridos
+            contagem['duplicados'] = candidatos - inseridos
+
+        def publicar(inseridos):
+            contar(inseridos)
+            if progresso is not None:
+                progresso(dict(contagem))
+
+        contar(self.importar(emails(), motivo, campanha_id, progresso=publicar))
+        return contagem
+
+    def exportar_csv(self, linhas_por_bloco=5000):
+        """Gera a blacklist em CSV (email, reason, date_added, campaign_id), em blocos de texto"""
+        conn = abrir_leitura(self.db_path)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(COLUNAS_EXPORTACAO)} FROM invalid_emails ORDER BY rowid")
+            saida = io.StringIO()
+            escritor = csv.writer(saida)
+            escritor.writerow(COLUNAS_EXPORTACAO)
+            while True:
+                linhas = cursor.fetchmany(linhas_por_bloco)
+                escritor.writerows(linhas)
+                bloco = saida.getvalue()
+                if bloco:
+                    yield bloco
+                if not linhas:
+                    return
+                saida.seek(0)
+                saida.truncate()
+        finally:
+            conn.close()
+
+    def sincronizar(self, timeout=None):
+        """Espera o commit de tudo o que foi enfileirado até agora"""
+        self._enfileirar(_Pedido([], aguardado=True)).result(timeout)
+
+    def _executar(self):
+        conn = abrir_banco(self.db_path)
+        proximo = False
+        try:
+            while True:
+                pedido = self._fila.get() if proximo is False else proximo
+                proximo = False
+                if pedido is None:
+                    return
+                if pedido.importacao:
+                    self._importar(conn, pedido)
+                    continue
+                # Junta os pedidos que chegarem até o fim do intervalo (ou até o lote encher)
+                grupo = [pedido]
+                linhas = len(pedido.linhas)
+                aguardado = pedido.aguardado
+                limite = time.monotonic() + self.intervalo
+                while linhas < self.lote:
+                    restante = limite - time.monotonic()
+                    try:
+                        if aguardado or restante <= 0:
+                            pedido = self._fila.get_nowait()
+                        else:
+                            pedido = self._fila.get(timeout=restante)
+                    except queue.Empty:
+                        break
+                    if pedido is None or pedido.importacao:
+                        # Tratado depois do commit do grupo, mantendo a ordem da fila
+                        proximo = pedido
+                        break
+                    grupo.append(pedido)
+                    linhas += len(pedido.linhas)
+                    aguardado = aguardado or pedido.aguardado
+                self._gravar(conn, grupo)
+        finally:
+            conn.close()
+
+    def _gravar(self, conn, grupo):
+        linhas = [linha for pedido in grupo for linha in pedido.linhas]
+        try:
+            if linhas:
+                with conn:
+                    conn.executemany(GRAVAR_BLACKLIST, linhas)
+                with self._lock:
+                    self.metrics['gravados'] += len(linhas)
+                    self.metrics['commits'] += 1
+        except Exception as e:
+            print(f"Erro ao gravar blacklist: {e}")
+            for pedido in grupo:
+                pedido.futuro.set_exception(e)
+            return
+        for pedido in grupo:
+            pedido.futuro.set_result(None)
+
+    def _importar(self, conn, pedido):
+        try:
+            antes = conn.total_changes
+            with conn:
+                conn.executemany(IMPORTAR_BLACKLIST, pedido.linhas)
+            inseridos = conn.total_changes - antes
+            with self._lock:
+                self.metrics['importados'] += inseridos
+                self.metrics['commits'] += 1
+        except Exception as e:
+            print(f"Erro ao importar blacklist: {e}")
+            pedido.futuro.set_exception(e)
+            return
+        pedido.futuro.set_result(inseridos)
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics['pendentes'] = self._fila.qsize()
+        return metrics
+
+    def close(self):
+        """Grava o que estiver na fila e encerra a thread escritora"""
+        with self._lock:
+            if self._fechado:
+                return
+            self._fechado = True
+            thread = self._thread
+            if thread is not None:
+                self._fila.put(None)
+        if thread is not None:
+            thread.join()
+        with self._lock_compartilhados:
+            if self._compartilhados.get(self.db_path) is self:
+                del self._compartilhados[self.db_path]
@@ -0,0 +1,67 @@
+"""Importação e exportação em massa da blacklist (email_blacklist.db)
+
+Uso:
+    python blacklist_cli.py importar supressao.csv [--motivo "Lista do parceiro"] [--coluna EMAIL]
+    python blacklist_cli.py exportar blacklist.csv   (ou "-" para a saída padrão)
+
+Pode rodar com o servidor no ar: o banco está em WAL e os emails
+importados chegam às campanhas em andamento pelo feed incremental do índice.
+"""
+import argparse
+import sys
+import time
+
+from blacklist import DB_BLACKLIST, BlacklistStore
+
+
+def importar(store, args):
+    inicio = time.monotonic()
+
+    def progresso(contagem):
+        print(f"\r{contagem['linhas']} linhas lidas, {contagem['inseridos']} inseridos", end='', file=sys.stderr)
+
+    contagem = store.importar_csv(args.arquivo, args.motivo, coluna=args.coluna, progresso=progresso)
+    print(file=sys.stderr)
+    print(
+        f"{contagem['inseridos']} emails inseridos de {contagem['linhas']} linhas em {time.monotonic() - inicio:.1f}s "
+        f"(inválidos: {contagem['invalidos']}, duplicados no arquivo: {contagem['duplicados']}, "
+        f"já na blacklist: {contagem['existentes']})"
+    )
+
+
+def exportar(store, args):
+    saida = sys.stdout if args.arquivo == '-' else open(args.arquivo, 'w', newline='', encoding='utf-8')
+    try:
+        for bloco in store.exportar_csv():
+            saida.write(bloco)
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importação e exportação em massa da blacklist')
+    parser.add_argument('--db', default=DB_BLACKLIST)
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    parser_importar = comandos.add_parser('importar', help='importa uma lista de supressão em CSV')
+    parser_importar.add_argument('arquivo')
+    parser_importar.add_argument('--motivo', default='Lista de supressão importada')
+    parser_importar.add_argument('--coluna', default='EMAIL', help='coluna com os emails (padrão: EMAIL ou a primeira)')
+
+    parser_exportar = comandos.add_parser('exportar', help='exporta a blacklist em CSV')
+    parser_exportar.add_argument('arquivo', help='arquivo de saída ou "-" para a saída padrão')
+
+    args = parser.parse_args()
+    store = BlacklistStore(args.db)
+    try:
+        if args.comando == 'importar':
+            importar(store, args)
+        else:
+            exportar(store, args)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
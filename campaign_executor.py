@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+
+from rate_limiter import FairShareLimiter
+
+
+# Prioridade por tipo de campanha (menor roda primeiro)
+PRIORIDADES = {'test': 0, 'mass': 1}
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+class CampaignExecutor:
+    """Pool de threads que executa as campanhas vencidas em paralelo
+
+    A fila é separada por prioridade (testes antes de envios em massa) e,
+    dentro dela, por ordem de chegada. No máximo `max_massa` campanhas em
+    massa rodam ao mesmo tempo; as demais threads ficam livres para testes,
+    que assim nunca esperam o fim de uma campanha longa. Cada campanha
+    recebe do FairShareLimiter sua parcela do orçamento global de envio,
+    de modo que campanhas em massa simultâneas são intercaladas.
+
+    `executar(campanha, rate_limiter)` é chamado na thread do pool.
+    """
+
+    def __init__(self, executar, limitador, workers=3, max_massa=2, historico_esperas=500):
+        self.executar = executar
+        self.divisao = FairShareLimiter(limitador)
+        self.workers = max(workers, max_massa + 1)
+        self.max_massa = max_massa
+
+        self._filas = {prioridade: deque() for prioridade in sorted(set(PRIORIDADES.values()))}
+        self._cond = threading.Condition()
+        self._ids = set()  # campanhas na fila ou em execução
+        self._em_execucao = {tipo: 0 for tipo in PRIORIDADES}
+        self._threads = []
+        self._parar = False
+
+        self._esperas = {tipo: deque(maxlen=historico_esperas) for tipo in PRIORIDADES}
+        self.metrics = {
+            'enfileiradas': 0,
+            'iniciadas': 0,
+            'concluidas': 0,
+            'falhas': 0
+        }
+
+    def iniciar(self):
+        with self._cond:
+            if self._threads:
+                return
+            self._parar = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._trabalhar, name=f'campanhas-{i}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def close(self, wait=False):
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def submeter(self, campanha):
+        """Enfileira a campanha; retorna False se ela já está na fila ou em execução"""
+        tipo = campanha['type'] if campanha['type'] in PRIORIDADES else 'mass'
+        with self._cond:
+            if campanha['id'] in self._ids:
+                return False
+            self._ids.add(campanha['id'])
+            self._filas[PRIORIDADES[tipo]].append((time.monotonic(), tipo, campanha))
+            self.metrics['enfileiradas'] += 1
+            self._cond.notify()
+        return True
+
+    def ids(self):
+        """IDs das campanhas na fila ou em execução"""
+        with self._cond:
+            return set(self._ids)
+
+    def _proxima(self):
+        # Chamado com o lock adquirido
+        for fila in self._filas.values():
+            if not fila:
+                continue
+            tipo = fila[0][1]
+            if tipo == 'mass' and self._em_execucao['mass'] >= self.max_massa:
+                continue
+            return fila.popleft()
+        return None
+
+    def _trabalhar(self):
+        while True:
+            with self._cond:
+                item = self._proxima()
+                while item is None and not self._parar:
+                    self._cond.wait()
+                    item = self._proxima()
+                if self._parar:
+                    return
+                enfileirada_em, tipo, campanha = item
+                self._em_execucao[tipo] += 1
+                self._esperas[tipo].append(time.monotonic() - enfileirada_em)
+                self.metrics['iniciadas'] += 1
+
+            limitador = self.divisao.para_campanha(prioritaria=PRIORIDADES[tipo] == 0)
+            try:
+                self.executar(campanha, limitador)
+                falhou = False
+            except Exception as e:
+                print(f"Erro ao executar campanha {campanha['id']}: {e}")
+                falhou = True
+            finally:
+                limitador.encerrar()
+                with self._cond:
+                    self._em_execucao[tipo] -= 1
+                    self._ids.discard(campanha['id'])
+                    self.metrics['concluidas'] += 1
+                    self.metrics['falhas'] += falhou
+                    # Uma vaga de campanha em massa pode ter sido liberada
+                    self._cond.notify_all()
+
+    def get_metrics(self):
+        """Profundidade da fila, campanhas em execução e tempos de espera (segundos) por tipo"""
+        with self._cond:
+            agora = time.monotonic()
+            metrics = dict(self.metrics)
+            metrics['workers'] = self.workers
+            metrics['max_massa'] = self.max_massa
+            metrics['fila'] = {tipo: 0 for tipo in PRIORIDADES}
+            espera_atual = {tipo: 0.0 for tipo in PRIORIDADES}
+            for fila in self._filas.values():
+                for enfileirada_em, tipo, _ in fila:
+                    metrics['fila'][tipo] += 1
+                    espera_atual[tipo] = max(espera_atual[tipo], agora - enfileirada_em)
+            metrics['em_execucao'] = dict(self._em_execucao)
+            metrics['espera'] = {
+                tipo: {
+                    'media': sum(esperas) / len(esperas) if esperas else 0.0,
+                    'p95': _percentil(esperas, 95),
+                    'maxima': max(esperas, default=0.0),
+                    'mais_antiga_na_fila': espera_atual[tipo]
+                }
+                for tipo, esperas in self._esperas.items()
+            }
+        metrics['parcela_por_campanha'] = self.divisao.parcela()
+        return metrics
@@ -0,0 +1,206 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+
+DB_CAMPANHAS = 'campaigns.db'
+
+FUSO_PADRAO = 'America/Sao_Paulo'
+
+# AUTOINCREMENT garante IDs crescentes que nunca são reaproveitados
+SCHEMA_CAMPANHAS = '''
+    CREATE TABLE IF NOT EXISTS campaigns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        template TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        preview TEXT,
+        datetime TEXT NOT NULL,
+        due_at REAL NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pendente',
+        list_path TEXT,
+        mode TEXT,
+        total_emails INTEGER,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_campaigns_status_due ON campaigns(status, due_at);
+'''
+
+# Máquina de estados: status atual -> status permitidos em seguida
+TRANSICOES = {
+    'pendente': {'enviando', 'cancelado', 'erro'},
+    'enviando': {'concluido', 'erro'},
+    'concluido': set(),
+    'erro': set(),
+    'cancelado': set(),
+}
+
+COLUNAS = (
+    'id', 'type', 'template', 'subject', 'preview', 'datetime', 'status',
+    'list_path', 'mode', 'total_emails', 'error', 'created_at', 'updated_at'
+)
+
+LIMITE_PAGINA = 50
+LIMITE_PAGINA_MAXIMO = 500
+
+
+def calcular_vencimento(horario, fuso=FUSO_PADRAO):
+    """Timestamp (epoch) de um horário 'YYYY-MM-DD HH:MM[:SS]'; sem fuso, assume `fuso`"""
+    momento = datetime.fromisoformat(str(horario).strip().replace(' ', 'T'))
+    if momento.tzinfo is None:
+        momento = pytz.timezone(fuso).localize(momento)
+    return momento.timestamp()
+
+
+class CampaignStore:
+    """Campanhas agendadas persistidas em SQLite (WAL)
+
+    O índice (status, due_at) atende as consultas do scheduler — campanhas
+    pendentes já vencidas e o próximo vencimento — sem varrer o histórico.
+    Mudanças de status só acontecem pelas transições de TRANSICOES, com um
+    UPDATE condicionado ao status atual, então duas threads nunca disparam
+    a mesma campanha. `aguardar` permite ao scheduler dormir até o próximo
+    vencimento e ser acordado quando uma campanha é criada ou cancelada.
+    """
+
+    def __init__(self, db_path=DB_CAMPANHAS, fuso=FUSO_PADRAO):
+        self.db_path = db_path
+        self.fuso = fuso
+        self._lock = threading.Lock()
+        self._alterado = threading.Condition(self._lock)
+        self._versao = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(SCHEMA_CAMPANHAS)
+        self._conn.commit()
+
+    @staticmethod
+    def _registro(linha):
+        return {coluna: linha[coluna] for coluna in COLUNAS} if linha else None
+
+    def _notificar(self):
+        # Chamado com o lock adquirido
+        self._versao += 1
+        self._alterado.notify_all()
+
+    def criar(self, tipo, template, subject, horario, preview='', list_path=None, mode=None, total_emails=None):
+        """Grava uma nova campanha pendente e retorna o registro (com o ID atribuído)"""
+        due_at = calcular_vencimento(horario, self.fuso)
+        agora = datetime.now().isoformat()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO campaigns (type, template, subject, preview, datetime, due_at, status, '
+                'list_path, mode, total_emails, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (tipo, template, subject, preview, horario, due_at, 'pendente',
+                 list_path, mode, total_emails, agora, agora)
+            )
+            self._conn.commit()
+            self._notificar()
+            campanha_id = cursor.lastrowid
+        return self.obter(campanha_id)
+
+    def obter(self, campanha_id):
+        with self._lock:
+            linha = self._conn.execute('SELECT * FROM campaigns WHERE id = ?', (campanha_id,)).fetchone()
+        return self._registro(linha)
+
+    def transicionar(self, campanha_id, novo_status, error=None):
+        """Move a campanha para `novo_status` se a transição for válida a partir do status atual
+
+        Retorna False se a campanha não existe ou se outro processo/thread já
+        mudou o status (ex.: cancelar uma campanha que começou a ser enviada).
+        """
+        origens = [status for status, destinos in TRANSICOES.items() if novo_status in destinos]
+        if not origens:
+            raise ValueError(f"Status inválido: {novo_status}")
+        marcadores = ', '.join('?' * len(origens))
+        with self._lock:
+            cursor = self._conn.execute(
+                f'UPDATE campaigns SET status = ?, error = COALESCE(?, error), updated_at = ? '
+                f'WHERE id = ? AND status IN ({marcadores})',
+                (novo_status, error, datetime.now().isoformat(), campanha_id, *origens)
+            )
+            self._conn.commit()
+            alterou = cursor.rowcount == 1
+            if alterou:
+                self._notificar()
+        return alterou
+
+    def cancelar(self, campanha_id):
+        return self.transicionar(campanha_id, 'cancelado')
+
+    def vencidas(self, agora=None, limite=10, ignorar=()):
+        """Campanhas pendentes com vencimento até `agora`, das mais antigas para as mais novas
+
+        `ignorar` são IDs que o chamador já tem em fila (ainda 'pendente').
+        """
+        agora = time.time() if agora is None else agora
+        ignorar = list(ignorar)
+        filtro = f" AND id NOT IN ({', '.join('?' * len(ignorar))})" if ignorar else ''
+        with self._lock:
+            linhas = self._conn.execute(
+                f"SELECT * FROM campaigns WHERE status = 'pendente' AND due_at <= ?{filtro} "
+                "ORDER BY due_at LIMIT ?",
+                (agora, *ignorar, limite)
+            ).fetchall()
+        return [self._registro(linha) for linha in linhas]
+
+    def proximo_vencimento(self, ignorar=()):
+        """Timestamp da próxima campanha pendente (None se não houver), fora as de `ignorar`"""
+        ignorar = list(ignorar)
+        filtro = f" AND id NOT IN ({', '.join('?' * len(ignorar))})" if ignorar else ''
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT MIN(due_at) FROM campaigns WHERE status = 'pendente'{filtro}", ignorar
+            ).fetchone()[0]
+
+    def aguardar(self, timeout):
+        """Dorme até `timeout` segundos ou até uma campanha ser criada/alterada"""
+        with self._lock:
+            versao = self._versao
+            self._alterado.wait_for(lambda: self._versao != versao, timeout=max(0, timeout))
+
+    def acordar(self):
+        with self._lock:
+            self._notificar()
+
+    def recuperar_interrompidas(self):
+        """Devolve para 'pendente' as campanhas que ficaram em 'enviando' (processo encerrado no meio do envio)
+
+        Fora da máquina de estados de propósito: só roda no início do
+        scheduler, e o envio é retomado pelo log de checkpoint da campanha.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE campaigns SET status = 'pendente', error = ?, updated_at = ? WHERE status = 'enviando'",
+                ('Envio interrompido, retomando', datetime.now().isoformat())
+            )
+            self._conn.commit()
+            if cursor.rowcount:
+                self._notificar()
+        return cursor.rowcount
+
+    def listar(self, limit=LIMITE_PAGINA, offset=0, status=None):
+        """Página de campanhas (mais recentes primeiro) e o total, para paginação"""
+        limit = max(0, min(int(limit), LIMITE_PAGINA_MAXIMO))
+        offset = max(0, int(offset))
+        filtro, parametros = ('WHERE status = ?', (status,)) if status else ('', ())
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM campaigns {filtro}', parametros).fetchone()[0]
+            linhas = self._conn.execute(
+                f'SELECT * FROM campaigns {filtro} ORDER BY id DESC LIMIT ? OFFSET ?',
+                (*parametros, limit, offset)
+            ).fetchall()
+        return [self._registro(linha) for linha in linhas], total
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+# Diretório dos logs de checkpoint, um arquivo por campanha
+DIR_CHECKPOINTS = 'checkpoints'
+
+VERSAO_FORMATO = 1
+
+# Status gravados no log; só 'enviado' conta como concluído na retomada
+ENVIADO = 'enviado'
+FALHA = 'falha'
+
+
+class Bitmap:
+    """Conjunto de índices de linha com 1 bit por linha (bytearray que cresce sob demanda)"""
+
+    def __init__(self, tamanho=0):
+        self.dados = bytearray((tamanho + 7) // 8)
+
+    def marcar(self, indice):
+        byte = indice >> 3
+        if byte >= len(self.dados):
+            self.dados.extend(bytes(max(byte + 1 - len(self.dados), len(self.dados))))
+        self.dados[byte] |= 1 << (indice & 7)
+
+    def __contains__(self, indice):
+        byte = indice >> 3
+        return byte < len(self.dados) and bool(self.dados[byte] & (1 << (indice & 7)))
+
+    def contem(self, indices):
+        """Máscara booleana (numpy) dos índices marcados"""
+        indices = np.asarray(indices, dtype=np.int64)
+        bits = np.frombuffer(bytes(self.dados), dtype=np.uint8)
+        bytes_ = indices >> 3
+        dentro = bytes_ < len(bits)
+        mascara = np.zeros(len(indices), dtype=bool)
+        mascara[dentro] = (bits[bytes_[dentro]] >> (indices[dentro] & 7)) & 1 == 1
+        return mascara
+
+    def __len__(self):
+        return int(np.unpackbits(np.frombuffer(bytes(self.dados), dtype=np.uint8)).sum())
+
+
+def _limpar(texto):
+    """Resposta SMTP em uma única linha (sem tabs/quebras, que separam os registros)"""
+    return ' '.join(str(texto).split())
+
+
+class CheckpointLog:
+    """Log de checkpoint de uma campanha: um registro por destinatário processado
+
+    Cada linha é `indice<TAB>status<TAB>resposta SMTP`, onde `indice` é a
+    posição da linha de dados na lista. O arquivo só recebe appends; cada
+    registro é entregue ao sistema na hora (um processo morto não perde
+    nada) e o fsync é feito a cada `lote` registros ou `intervalo` segundos
+    (e no `close`). Só uma queda da máquina perde o último lote, que é
+    reenviado na retomada. Quando a campanha termina, `remover` apaga o
+    log, e uma nova execução com o mesmo id começa do zero.
+
+    A primeira linha identifica a versão da lista (caminho, tamanho, mtime);
+    se a lista mudou, os índices não valem mais e o log anterior é
+    descartado. Os índices já enviados ficam em `concluidos` (Bitmap).
+    """
+
+    def __init__(self, path, identidade, lote=500, intervalo=1.0):
+        self.path = Path(path)
+        self.identidade = identidade
+        self.lote = lote
+        self.intervalo = intervalo
+        self.concluidos = Bitmap()
+        self.registros_anteriores = 0
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._ultimo_sync = time.monotonic()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        retomado = self._carregar()
+        self._arquivo = open(self.path, 'a' if retomado else 'w', encoding='utf-8', newline='\n')
+        if not retomado:
+            self._arquivo.write(self._cabecalho())
+            self._sincronizar()
+
+    @classmethod
+    def da_campanha(cls, campanha_id, lista_path, diretorio=DIR_CHECKPOINTS, **kwargs):
+        """Log da campanha `campanha_id`, identificado pela versão atual do arquivo da lista"""
+        estado = os.stat(lista_path)
+        identidade = {
+            'lista': os.path.abspath(lista_path),
+            'tamanho': estado.st_size,
+            'mtime_ns': estado.st_mtime_ns
+        }
+        return cls(Path(diretorio) / f'campanha_{campanha_id}.log', identidade, **kwargs)
+
+    def _cabecalho(self):
+        return f"#{json.dumps(dict(self.identidade, versao_formato=VERSAO_FORMATO), sort_keys=True)}\n"
+
+    def _carregar(self):
+        """Lê o log existente; retorna False se não há log válido para esta versão da lista"""
+        try:
+            with open(self.path, 'rb') as f:
+                dados = f.read()
+        except FileNotFoundError:
+            return False
+
+        cabecalho = self._cabecalho().encode('utf-8')
+        if not dados.startswith(cabecalho):
+            if dados:
+                os.replace(self.path, self.path.with_suffix('.descartado'))
+            return False
+
+        # Um registro sem '\n' final foi interrompido no meio da gravação
+        completo = dados.rfind(b'\n') + 1
+        if completo < len(dados):
+            with open(self.path, 'r+b') as f:
+                f.truncate(completo)
+
+        registros = dados[len(cabecalho):completo].decode('utf-8', 'replace').split('\n')[:-1]
+        for registro in registros:
+            indice, status, _ = registro.split('\t', 2)
+            if status == ENVIADO:
+                self.concluidos.marcar(int(indice))
+        self.registros_anteriores = len(registros)
+        return True
+
+    def registrar(self, indice, status, resposta=''):
+        """Acrescenta o resultado do envio da linha `indice` (fsync em lote)"""
+        with self._lock:
+            self._arquivo.write(f"{indice}\t{status}\t{_limpar(resposta)}\n")
+            self._arquivo.flush()
+            if status == ENVIADO:
+                self.concluidos.marcar(indice)
+            self._pendentes += 1
+            if self._pendentes >= self.lote or time.monotonic() - self._ultimo_sync >= self.intervalo:
+                self._sincronizar()
+
+    def _sincronizar(self):
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self._pendentes = 0
+        self._ultimo_sync = time.monotonic()
+
+    def sincronizar(self):
+        with self._lock:
+            self._sincronizar()
+
+    def close(self):
+        with self._lock:
+            if not self._arquivo.closed:
+                self._sincronizar()
+                self._arquivo.close()
+
+    def remover(self):
+        """Fecha e apaga o log (campanha concluída)"""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,149 @@
+import base64
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import dkim
+from dkim.canonicalization import CanonicalizationPolicy
+from dkim.crypto import parse_pem_private_key
+
+
+# Headers assinados por padrão (mesmos do envio anterior via dkim.sign)
+HEADERS_ASSINADOS = (
+    'From', 'To', 'Subject', 'Date', 'Message-ID',
+    'X-Mailer', 'List-Unsubscribe', 'List-Unsubscribe-Post'
+)
+
+
+def separar_mensagem(mensagem):
+    """Separa cabeçalhos e corpo de uma mensagem já serializada"""
+    for separador in (b'\r\n\r\n', b'\n\n'):
+        posicao = mensagem.find(separador)
+        if posicao != -1:
+            return mensagem[:posicao + len(separador)], mensagem[posicao + len(separador):]
+    return mensagem, b''
+
+
+class DKIMSigner:
+    """Assinador DKIM com a chave privada lida e decodificada uma única vez
+
+    O hash do corpo é calculado diretamente sobre os bytes já serializados da
+    mensagem e apenas o bloco de cabeçalhos é analisado pelo dkimpy. Com
+    `processes > 0`, as operações RSA rodam em um pool de processos.
+    """
+
+    def __init__(self, private_key, selector, domain, include_headers=HEADERS_ASSINADOS,
+                 canonicalize=(b'relaxed', b'simple'), processes=0):
+        self.private_key = private_key
+        self.selector = selector.encode() if isinstance(selector, str) else selector
+        self.domain = domain.encode() if isinstance(domain, str) else domain
+        self.include_headers = tuple(
+            (h.encode() if isinstance(h, str) else h).lower() for h in include_headers
+        )
+        self.canonicalize = canonicalize
+        self.canon_policy = CanonicalizationPolicy.from_c_value(b'/'.join(canonicalize))
+        self._pk = parse_pem_private_key(private_key)
+        self.key_path = None
+        self.key_mtime = None
+
+        self.processes = processes
+        self._executor = None
+        if processes:
+            # spawn: o servidor tem threads (HTTP, scheduler, escritores) e um fork
+            # copiaria locks que podem estar presos no processo pai
+            self._executor = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_worker,
+                initargs=(private_key, self.selector, self.domain, self.include_headers, canonicalize)
+            )
+
+    @classmethod
+    def from_file(cls, key_path, selector, domain, **kwargs):
+        """Carrega a chave PEM do disco e cria o assinador"""
+        with open(key_path, 'rb') as f:
+            private_key = f.read()
+        signer = cls(private_key, selector, domain, **kwargs)
+        signer.key_path = key_path
+        signer.key_mtime = os.path.getmtime(key_path)
+        return signer
+
+    def chave_alterada(self):
+        """Indica se o arquivo da chave mudou desde o carregamento"""
+        if self.key_path is None:
+            return False
+        try:
+            return os.path.getmtime(self.key_path) != self.key_mtime
+        except OSError:
+            return True
+
+    def body_hash(self, corpo):
+        """Hash (bh=) do corpo canonicalizado"""
+        corpo = self.canon_policy.canonicalize_body(corpo)
+        return base64.b64encode(hashlib.sha256(corpo).digest())
+
+    def _assinar(self, mensagem):
+        cabecalhos, corpo = separar_mensagem(mensagem)
+        campos = [
+            (b'v', b'1'),
+            (b'a', b'rsa-sha256'),
+            (b'c', self.canon_policy.to_c_value()),
+            (b'd', self.domain),
+            (b'i', b'@' + self.domain),
+            (b'q', b'dns/txt'),
+            (b's', self.selector),
+            (b't', str(int(time.time())).encode('ascii')),
+            (b'h', b' : '.join(self.include_headers)),
+            (b'bh', self.body_hash(corpo)),
+            # b= em linha própria, como no dkimpy
+            (b'b', b'0' * 60),
+        ]
+        # Apenas os cabeçalhos são analisados; o corpo já foi resumido acima
+        assinador = dkim.DKIM(cabecalhos)
+        assinador.hasher = hashlib.sha256
+        valor = assinador.gen_header(campos, self.include_headers, self.canon_policy, b'DKIM-Signature', self._pk)
+        return b'DKIM-Signature: ' + valor
+
+    def sign(self, mensagem):
+        """Retorna o cabeçalho DKIM-Signature completo (terminado em CRLF) para os bytes da mensagem"""
+        if self._executor is not None:
+            return self._executor.submit(_assinar_no_worker, mensagem).result()
+        return self._assinar(mensagem)
+
+    def submit(self, mensagem):
+        """Versão não bloqueante de sign; retorna um Future"""
+        if self._executor is not None:
+            return self._executor.submit(_assinar_no_worker, mensagem)
+        futuro = Future()
+        try:
+            futuro.set_result(self._assinar(mensagem))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+
+    def close(self):
+        """Encerra o pool de processos depois das assinaturas em andamento
+
+        Quem ainda tiver uma referência ao assinador passa a assinar no
+        próprio processo, em vez de submeter a um pool encerrado.
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Assinador do processo worker (a chave é decodificada uma vez por processo)
+_signer_worker = None
+
+
+def _iniciar_worker(private_key, selector, domain, include_headers, canonicalize):
+    global _signer_worker
+    _signer_worker = DKIMSigner(private_key, selector, domain, include_headers, canonicalize)
+    logging.getLogger(__name__).debug(f"Worker DKIM iniciado (pid {os.getpid()})")
+
+
+def _assinar_no_worker(mensagem):
+    return _signer_worker._assinar(mensagem)
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from list_reader import COLUNAS_PADRAO, TAMANHO_BLOCO, ListaCSV
+from recipients import MOTIVOS_REJEICAO, RegistroVistos, preparar_destinatarios
+
+
+# Diretório do cache, criado ao lado da lista de origem
+DIR_CACHE = '.cache'
+
+# Listas menores que isso são lidas direto do CSV (importar não compensa)
+TAMANHO_MINIMO_CACHE = 256 * 1024
+
+VERSAO_FORMATO = 1
+
+# Terminador de cada valor no arquivo de dados de uma coluna
+SEPARADOR = '\x00'
+
+logger = logging.getLogger(__name__)
+
+_locks = {}
+_lock_locks = threading.Lock()
+
+
+def _lock_da_lista(path):
+    with _lock_locks:
+        return _locks.setdefault(str(path), threading.Lock())
+
+
+def hash_arquivo(path, bloco=1024 * 1024):
+    """blake2b do conteúdo do arquivo, lido em blocos"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for dados in iter(lambda: f.read(bloco), b''):
+            digest.update(dados)
+    return digest.hexdigest()
+
+
+class ColunaTexto:
+    """Coluna de strings no disco: dados UTF-8 terminados por NUL, offsets int64 e máscara de nulos
+
+    Os três arquivos são mapeados em memória; uma fatia decodifica apenas o
+    trecho de bytes correspondente às linhas pedidas.
+    """
+
+    def __init__(self, base):
+        self.offsets = np.load(f'{base}.offsets.npy', mmap_mode='r')
+        self.nulos = np.load(f'{base}.nulos.npy', mmap_mode='r')
+        self._arquivo = open(f'{base}.dados', 'rb')
+        tamanho = os.fstat(self._arquivo.fileno()).st_size
+        self.dados = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ) if tamanho else b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def fatia(self, inicio, fim):
+        """Série de strings (pd.NA para nulos) das linhas [inicio, fim)"""
+        fim = min(fim, len(self))
+        a, b = int(self.offsets[inicio]), int(self.offsets[fim])
+        valores = str(memoryview(self.dados)[a:b], 'utf-8').split(SEPARADOR)[:-1]
+        serie = pd.Series(valores, index=pd.RangeIndex(inicio, fim), dtype=pd.StringDtype())
+        nulos = np.asarray(self.nulos[inicio:fim])
+        if nulos.any():
+            serie[nulos] = pd.NA
+        return serie
+
+    def close(self):
+        if isinstance(self.dados, mmap.mmap):
+            self.dados.close()
+        self._arquivo.close()
+
+
+class _EscritorColuna:
+    def __init__(self, base):
+        self.base = base
+        self._arquivo = open(f'{base}.dados', 'wb')
+        self._tamanhos = []
+        self._nulos = []
+
+    def escrever(self, serie):
+        nulos = serie.isna().to_numpy(dtype=bool)
+        valores = serie.fillna('').str.replace(SEPARADOR, '', regex=False).tolist()
+        codificados = [valor.encode('utf-8') for valor in valores]
+        self._arquivo.write(b'\x00'.join(codificados) + b'\x00' if codificados else b'')
+        self._tamanhos.append(np.fromiter(map(len, codificados), dtype=np.int64, count=len(codificados)) + 1)
+        self._nulos.append(nulos)
+
+    def fechar(self):
+        self._arquivo.close()
+        tamanhos = np.concatenate(self._tamanhos) if self._tamanhos else np.empty(0, dtype=np.int64)
+        offsets = np.zeros(len(tamanhos) + 1, dtype=np.int64)
+        np.cumsum(tamanhos, out=offsets[1:])
+        np.save(f'{self.base}.offsets.npy', offsets)
+        nulos = np.concatenate(self._nulos) if self._nulos else np.empty(0, dtype=bool)
+        np.save(f'{self.base}.nulos.npy', nulos)
+
+
+class ListaImportada:
+    """Lista já convertida para o formato colunar, com a mesma interface de leitura de ListaCSV"""
+
+    def __init__(self, diretorio, meta, chunksize=TAMANHO_BLOCO):
+        self.diretorio = Path(diretorio)
+        self.meta = meta
+        self.path = Path(meta['origem'])
+        self.chunksize = chunksize
+        self.encoding = meta['encoding']
+        self.colunas = dict(meta['colunas'])
+        self._abertas = {}
+        # Todas as colunas são abertas já: uma importação nova apaga esta
+        # versão do disco, e só os arquivos abertos continuam acessíveis
+        try:
+            for posicao, nome in enumerate(self.colunas):
+                self._abertas[nome] = ColunaTexto(self.diretorio / f'coluna_{posicao}')
+        except Exception:
+            self.close()
+            raise
+
+    def coluna(self, nome):
+        """Coluna mapeada em memória"""
+        return self._abertas[nome]
+
+    def colunas_ausentes(self, obrigatorias=('EMAIL',)):
+        return set(obrigatorias) - set(self.colunas)
+
+    def contar(self):
+        return self.meta['linhas']
+
+    def linhas(self, inicio, fim, colunas=None):
+        """DataFrame com as linhas [inicio, fim) das colunas pedidas (todas por padrão)"""
+        nomes = [nome for nome in self.colunas if colunas is None or nome in colunas]
+        fim = min(fim, self.meta['linhas'])
+        df = pd.DataFrame({nome: self.coluna(nome).fatia(inicio, fim) for nome in nomes})
+        if colunas is not None and 'NOME' in colunas and 'NOME' not in df.columns:
+            df['NOME'] = pd.Series('', index=df.index, dtype=pd.StringDtype())
+        return df
+
+    def blocos(self, colunas=COLUNAS_PADRAO):
+        desejadas = {coluna.upper() for coluna in colunas} | {'EMAIL'}
+        for inicio in range(0, self.meta['linhas'], self.chunksize):
+            yield self.linhas(inicio, inicio + self.chunksize, desejadas)
+
+    def close(self):
+        """Fecha os arquivos e mapeamentos das colunas abertas"""
+        for coluna in self._abertas.values():
+            coluna.close()
+        self._abertas = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.close()
+
+
+def diretorio_cache(path):
+    path = Path(path)
+    return path.parent / DIR_CACHE / path.name
+
+
+def _ler_meta(diretorio):
+    try:
+        with open(diretorio / 'atual.json', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('versao_formato') != VERSAO_FORMATO:
+        return None
+    return meta
+
+
+def _gravar_meta(diretorio, meta):
+    temporario = diretorio / f'atual.json.{os.getpid()}.{threading.get_ident()}'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, diretorio / 'atual.json')
+
+
+def importar_lista(path, chunksize=TAMANHO_BLOCO, digest=None):
+    """Converte o CSV para o formato colunar e grava o registro de metadados
+
+    Cada importação vai para um subdiretório próprio (pelo hash do conteúdo) e
+    `atual.json` é trocado atomicamente no fim, de modo que leitores da versão
+    anterior não são afetados.
+    """
+    path = Path(path)
+    estado = path.stat()
+    digest = digest or hash_arquivo(path)
+    diretorio = diretorio_cache(path)
+    versao = diretorio / digest
+    temporario = diretorio / f'{digest}.tmp-{os.getpid()}-{threading.get_ident()}'
+    temporario.mkdir(parents=True, exist_ok=True)
+
+    try:
+        lista = ListaCSV(path, chunksize=chunksize)
+        nomes = list(lista.colunas)
+        escritores = {nome: _EscritorColuna(temporario / f'coluna_{i}') for i, nome in enumerate(nomes)}
+        vistos = RegistroVistos()
+        rejeicoes = dict.fromkeys(MOTIVOS_REJEICAO, 0)
+        linhas = aptos = 0
+        for bloco in lista.blocos(nomes):
+            for nome, escritor in escritores.items():
+                escritor.escrever(bloco[nome])
+            destinatarios = preparar_destinatarios(bloco, vistos=vistos)
+            for motivo, quantidade in destinatarios.rejeicoes.items():
+                rejeicoes[motivo] += quantidade
+            aptos += len(destinatarios)
+            linhas += len(bloco)
+        for escritor in escritores.values():
+            escritor.fechar()
+
+        if versao.exists():
+            shutil.rmtree(versao)
+        os.replace(temporario, versao)
+    except Exception:
+        shutil.rmtree(temporario, ignore_errors=True)
+        raise
+
+    meta = {
+        'versao_formato': VERSAO_FORMATO,
+        'origem': str(path),
+        'tamanho': estado.st_size,
+        'mtime_ns': estado.st_mtime_ns,
+        'hash': digest,
+        'linhas': linhas,
+        'encoding': lista.encoding,
+        'colunas': [[nome, str(original)] for nome, original in lista.colunas.items()],
+        'validade': dict(rejeicoes, aptos=aptos),
+        'importado_em': datetime.now().isoformat()
+    }
+    _gravar_meta(diretorio, meta)
+
+    # Remove versões antigas (ListaImportada abre todas as colunas, e os mapeamentos continuam válidos)
+    for antigo in diretorio.iterdir():
+        if antigo.is_dir() and antigo.name != digest and '.tmp-' not in antigo.name:
+            shutil.rmtree(antigo, ignore_errors=True)
+
+    logger.info(f"Lista {path.name} importada: {linhas} linhas, {aptos} aptas")
+    return meta
+
+
+def abrir_lista(path, chunksize=TAMANHO_BLOCO):
+    """Abre a lista pelo cache colunar, importando o CSV só quando ele mudou
+
+    A validade é conferida por tamanho+mtime; se só o mtime mudou, o hash do
+    conteúdo decide. Listas pequenas, ou quando o cache não pode ser gravado,
+    são lidas direto do CSV.
+    """
+    path = Path(path)
+    estado = path.stat()
+    if estado.st_size < TAMANHO_MINIMO_CACHE:
+        return ListaCSV(path, chunksize=chunksize)
+
+    diretorio = diretorio_cache(path)
+    try:
+        with _lock_da_lista(path):
+            meta = _ler_meta(diretorio)
+            if meta and (meta['tamanho'], meta['mtime_ns']) != (estado.st_size, estado.st_mtime_ns):
+                digest = hash_arquivo(path)
+                if meta['tamanho'] == estado.st_size and meta['hash'] == digest:
+                    # Conteúdo igual (arquivo apenas tocado): atualiza a impressão digital
+                    meta.update(mtime_ns=estado.st_mtime_ns)
+                    _gravar_meta(diretorio, meta)
+                else:
+                    meta = importar_lista(path, chunksize, digest)
+            elif meta is None:
+                meta = importar_lista(path, chunksize)
+            # Aberta sob o lock: outra importação da mesma lista não apaga a versão antes disso
+            return ListaImportada(diretorio / meta['hash'], meta, chunksize)
+    except OSError as e:
+        logger.warning(f"Cache colunar indisponível para {path.name} ({e}), lendo o CSV")
+        return ListaCSV(path, chunksize=chunksize)
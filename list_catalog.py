@@ -0,0 +1,129 @@
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from list_reader import ListaCSV, contar_linhas
+
+
+# Intervalo entre varreduras do diretório de listas (segundos)
+INTERVALO_VARREDURA = 2
+
+
+def chave_arquivo(estado):
+    """Identidade de uma versão do arquivo: (inode, tamanho, mtime)"""
+    return (estado.st_ino, estado.st_size, estado.st_mtime_ns)
+
+
+class ListCatalog:
+    """Catálogo incremental das listas em `lists_dir`
+
+    Cada arquivo tem sua própria entrada, chaveada por (inode, tamanho,
+    mtime); apenas arquivos novos ou alterados são reprocessados (cabeçalho
+    e contagem de linhas por varredura do arquivo mapeado em memória). Com
+    `iniciar()`, uma thread observa o diretório por polling e `listar()`
+    responde direto do catálogo.
+    """
+
+    def __init__(self, lists_dir='lists', intervalo=INTERVALO_VARREDURA):
+        self.lists_dir = Path(lists_dir)
+        self.intervalo = intervalo
+        self._entradas = {}  # nome -> {'chave': ..., 'info': dict ou None se inválida}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._varrido = False
+
+    def iniciar(self):
+        """Faz a primeira varredura e passa a observar o diretório em segundo plano"""
+        self.atualizar()
+        if self._thread is None:
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._observar, name='catalogo-listas', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _observar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.atualizar()
+            except Exception as e:
+                print(f"Erro ao atualizar catálogo de listas: {str(e)}")
+
+    def atualizar(self):
+        """Varre o diretório e reprocessa só os arquivos novos ou alterados"""
+        self.lists_dir.mkdir(exist_ok=True)
+        presentes = set()
+        with os.scandir(self.lists_dir) as entradas:
+            for entrada in entradas:
+                if not entrada.name.endswith('.csv') or not entrada.is_file():
+                    continue
+                presentes.add(entrada.name)
+                self._atualizar_arquivo(Path(entrada.path), entrada.stat())
+
+        with self._lock:
+            for nome in set(self._entradas) - presentes:
+                del self._entradas[nome]
+            self._varrido = True
+
+    def _atualizar_arquivo(self, file_path, estado):
+        chave = chave_arquivo(estado)
+        with self._lock:
+            entrada = self._entradas.get(file_path.name)
+        if entrada and entrada['chave'] == chave:
+            return entrada['info']
+
+        info = self._processar(file_path, estado)
+        with self._lock:
+            self._entradas[file_path.name] = {'chave': chave, 'info': info}
+        return info
+
+    def _processar(self, file_path, estado):
+        print(f"Lendo arquivo {file_path.name}")
+        try:
+            # Apenas o cabeçalho (e uma amostra para o encoding) é decodificado
+            lista = ListaCSV(file_path)
+            missing = lista.colunas_ausentes({'EMAIL', 'NOME'})
+            if missing:
+                print(f"Colunas ausentes em {file_path.name}: {missing}")
+                return None
+            return {
+                'name': file_path.name,
+                'count': contar_linhas(file_path),
+                'modified': datetime.fromtimestamp(estado.st_mtime).isoformat(),
+                'columns': list(lista.colunas.values()),
+                'encoding': lista.encoding
+            }
+        except Exception as e:
+            print(f"Erro ao processar {file_path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _resumo(info):
+        return {'name': info['name'], 'count': info['count'], 'modified': info['modified']}
+
+    def info(self, file_path):
+        """Nome, quantidade de linhas e data de modificação de uma lista (None se inválida)"""
+        try:
+            info = self._atualizar_arquivo(Path(file_path), os.stat(file_path))
+        except FileNotFoundError:
+            print(f"Arquivo não encontrado: {file_path}")
+            return None
+        return self._resumo(info) if info else None
+
+    def listar(self):
+        """Listas válidas, ordenadas por nome
+
+        Com o observador ativo a resposta vem direto do catálogo; sem ele, o
+        diretório é varrido antes (só arquivos alterados são reprocessados).
+        """
+        if self._thread is None or not self._varrido:
+            self.atualizar()
+        with self._lock:
+            infos = [entrada['info'] for _, entrada in sorted(self._entradas.items()) if entrada['info']]
+        return [self._resumo(info) for info in infos]
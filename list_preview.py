@@ -0,0 +1,121 @@
+import io
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from list_catalog import chave_arquivo
+from list_reader import BLOCO_VARREDURA, detectar_encoding
+
+
+# Uma entrada no índice a cada PASSO_INDICE linhas
+PASSO_INDICE = 1024
+
+# Limites da paginação do preview
+LIMITE_PADRAO = 5
+LIMITE_MAXIMO = 1000
+
+
+class LineIndex:
+    """Índice esparso de linhas de um CSV, construído em uma única varredura do arquivo mapeado
+
+    Guarda o offset em bytes de cada PASSO-ésima linha de dados e o total de
+    linhas; ler a partir da linha N custa um seek mais no máximo PASSO-1
+    linhas puladas, independente do tamanho do arquivo. Quebras de linha
+    dentro de campos entre aspas contam como novas linhas.
+    """
+
+    def __init__(self, path, passo=PASSO_INDICE):
+        self.path = Path(path)
+        self.passo = passo
+        self.encoding = detectar_encoding(self.path)
+        self.cabecalho = b''
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.linhas = 0
+        self._construir()
+
+    def _construir(self):
+        with open(self.path, 'rb') as f:
+            tamanho = os.fstat(f.fileno()).st_size
+            if not tamanho:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                dados = np.frombuffer(mapa, dtype=np.uint8)
+                quebras = [
+                    np.flatnonzero(dados[inicio:inicio + BLOCO_VARREDURA] == 10) + inicio
+                    for inicio in range(0, tamanho, BLOCO_VARREDURA)
+                ]
+                termina_com_quebra = dados[-1] == 10
+                del dados
+                quebras = np.concatenate(quebras)
+                fim_cabecalho = int(quebras[0]) + 1 if len(quebras) else tamanho
+                self.cabecalho = mapa[:fim_cabecalho]
+
+        # Início de cada linha de dados = posição após cada '\n' (exceto um '\n' final)
+        inicios = quebras + 1
+        if termina_com_quebra:
+            inicios = inicios[:-1]
+        self.linhas = len(inicios)
+        self.offsets = inicios[::self.passo].astype(np.int64)
+
+    def trecho(self, offset, limit):
+        """Bytes das linhas de dados [offset, offset + limit)"""
+        if offset >= self.linhas or limit <= 0:
+            return b''
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.offsets[offset // self.passo]))
+            for _ in range(offset % self.passo):
+                f.readline()
+            return b''.join(f.readline() for _ in range(min(limit, self.linhas - offset)))
+
+
+class ListPreview:
+    """Preview paginado das listas, com um LineIndex por arquivo reaproveitado até o arquivo mudar"""
+
+    def __init__(self, max_arquivos=32):
+        self.max_arquivos = max_arquivos
+        self._indices = OrderedDict()  # caminho -> (chave do arquivo, LineIndex)
+        self._lock = threading.Lock()
+
+    def indice(self, file_path):
+        """LineIndex atual do arquivo (reconstruído só quando inode/tamanho/mtime mudam)"""
+        chave = chave_arquivo(os.stat(file_path))
+        caminho = str(file_path)
+        with self._lock:
+            atual = self._indices.get(caminho)
+            if atual and atual[0] == chave:
+                self._indices.move_to_end(caminho)
+                return atual[1]
+
+        indice = LineIndex(file_path)
+        with self._lock:
+            self._indices[caminho] = (chave, indice)
+            self._indices.move_to_end(caminho)
+            while len(self._indices) > self.max_arquivos:
+                self._indices.popitem(last=False)
+        return indice
+
+    def preview(self, file_path, offset=0, limit=LIMITE_PADRAO):
+        """Linhas [offset, offset + limit) como registros, mais o total de linhas de dados"""
+        offset = max(0, int(offset))
+        limit = max(0, min(int(limit), LIMITE_MAXIMO))
+        indice = self.indice(file_path)
+        df = pd.read_csv(
+            io.BytesIO(indice.cabecalho + indice.trecho(offset, limit)),
+            encoding=indice.encoding,
+            encoding_errors='replace',
+            dtype=pd.StringDtype(),
+            keep_default_na=False,
+            na_values=['']
+        )
+        df.columns = [str(coluna).strip().upper() for coluna in df.columns]
+        return {
+            'preview': df.astype(object).where(df.notna(), None).to_dict('records'),
+            'total_rows': indice.linhas,
+            'offset': offset,
+            'limit': limit
+        }
@@ -0,0 +1,146 @@
+import logging
+import mmap
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Linhas por bloco na leitura em streaming
+TAMANHO_BLOCO = 50_000
+
+# Bytes do início do arquivo usados na detecção de encoding
+AMOSTRA_ENCODING = 64 * 1024
+
+# Colunas lidas por padrão; as demais só entram quando o template as usa
+COLUNAS_PADRAO = ('EMAIL', 'NOME')
+
+logger = logging.getLogger(__name__)
+
+# Bytes examinados por vez na contagem de quebras de linha
+BLOCO_VARREDURA = 64 * 1024 * 1024
+
+
+def detectar_encoding(path, amostra=AMOSTRA_ENCODING):
+    """Detecta o encoding pelo início do arquivo (chardet), com fallback para UTF-8/latin1"""
+    with open(path, 'rb') as f:
+        dados = f.read(amostra)
+    # Não corta um caractere multibyte ao meio
+    if len(dados) == amostra and b'\n' in dados:
+        dados = dados[:dados.rindex(b'\n') + 1]
+
+    encoding = 'utf-8'
+    try:
+        import chardet
+        detectado = chardet.detect(dados)
+        if detectado['encoding'] and detectado['confidence'] > 0.7:
+            encoding = detectado['encoding']
+    except ImportError:
+        logger.warning("Módulo chardet não encontrado, usando UTF-8")
+
+    try:
+        dados.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        encoding = 'latin1'
+    return encoding
+
+
+def contar_linhas(path, bloco=BLOCO_VARREDURA):
+    """Linhas de dados (sem o cabeçalho), contando '\n' no arquivo mapeado em memória
+
+    A contagem é feita pelo numpy sobre o mapeamento, sem decodificar o texto.
+    Quebras de linha dentro de campos entre aspas também são contadas.
+    """
+    with open(path, 'rb') as f:
+        tamanho = os.fstat(f.fileno()).st_size
+        if not tamanho:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            dados = np.frombuffer(mapa, dtype=np.uint8)
+            quebras = sum(
+                int(np.count_nonzero(dados[inicio:inicio + bloco] == 10))
+                for inicio in range(0, tamanho, bloco)
+            )
+            termina_com_quebra = dados[-1] == 10
+            # Libera o buffer antes de fechar o mapeamento
+            del dados
+    linhas = quebras + (0 if termina_com_quebra else 1)
+    return max(0, linhas - 1)
+
+
+class ListaCSV:
+    """Lista de destinatários lida em blocos de tamanho fixo
+
+    Apenas o cabeçalho é lido na criação. `blocos()` percorre o arquivo com
+    `chunksize`, carregando só as colunas pedidas como strings (arrow quando
+    o pyarrow está instalado), e entrega cada bloco com os nomes de coluna em
+    maiúsculas e a coluna NOME garantida. A memória fica limitada ao tamanho
+    do bloco, independente do tamanho da lista.
+    """
+
+    def __init__(self, path, chunksize=TAMANHO_BLOCO, encoding=None):
+        self.path = Path(path)
+        self.chunksize = chunksize
+        self.encoding = encoding or detectar_encoding(self.path)
+        cabecalho = pd.read_csv(self.path, encoding=self.encoding, nrows=0, encoding_errors='replace')
+        # Nome padronizado -> nome original no arquivo
+        self.colunas = {}
+        for coluna in cabecalho.columns:
+            self.colunas.setdefault(str(coluna).strip().upper(), coluna)
+
+    def colunas_ausentes(self, obrigatorias=('EMAIL',)):
+        """Colunas obrigatórias que não existem no cabeçalho"""
+        return set(obrigatorias) - set(self.colunas)
+
+    def blocos(self, colunas=COLUNAS_PADRAO):
+        """Gera DataFrames de até `chunksize` linhas com as colunas pedidas que existirem"""
+        desejadas = {coluna.upper() for coluna in colunas} | {'EMAIL'}
+        usecols = [original for nome, original in self.colunas.items() if nome in desejadas]
+        leitor = pd.read_csv(
+            self.path,
+            encoding=self.encoding,
+            encoding_errors='replace',
+            usecols=usecols,
+            dtype=pd.StringDtype(),
+            keep_default_na=False,
+            na_values=[''],
+            chunksize=self.chunksize
+        )
+        with leitor:
+            for bloco in leitor:
+                bloco.columns = [str(coluna).strip().upper() for coluna in bloco.columns]
+                if 'NOME' in desejadas and 'NOME' not in bloco.columns:
+                    bloco['NOME'] = pd.Series('', index=bloco.index, dtype=pd.StringDtype())
+                yield bloco
+
+    def linhas(self, inicio, fim, colunas=None):
+        """DataFrame com as linhas de dados [inicio, fim) das colunas pedidas (todas por padrão)"""
+        desejadas = None if colunas is None else {coluna.upper() for coluna in colunas}
+        df = pd.read_csv(
+            self.path,
+            encoding=self.encoding,
+            encoding_errors='replace',
+            usecols=[original for nome, original in self.colunas.items() if desejadas is None or nome in desejadas],
+            dtype=pd.StringDtype(),
+            keep_default_na=False,
+            na_values=[''],
+            skiprows=range(1, inicio + 1),
+            nrows=max(0, fim - inicio)
+        )
+        df.columns = [str(coluna).strip().upper() for coluna in df.columns]
+        df.index = pd.RangeIndex(inicio, inicio + len(df))
+        return df
+
+    def contar(self):
+        """Número de linhas de dados, lendo apenas a coluna EMAIL em blocos"""
+        return sum(len(bloco) for bloco in self.blocos(('EMAIL',)))
+
+    def close(self):
+        """Nada fica aberto entre as leituras (mesma interface de ListaImportada)"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.close()
@@ -0,0 +1,190 @@
+import binascii
+import re
+import sys
+import time
+import uuid
+from email.header import Header
+from email.utils import formatdate, make_msgid, parseaddr, formataddr
+
+from template_engine import compilar_template
+
+
+CRLF = b'\r\n'
+
+# Linhas acima de 998 octetos não podem ir em 7bit/8bit (RFC 5322)
+LINHA_LONGA = re.compile(rb'^[^\r\n]{999}', re.MULTILINE)
+
+X_MAILER = f"Python/{'.'.join(map(str, sys.version_info[:3]))}"
+
+URL_UNSUBSCRIBE = 'https://email.blazee.com.br/unsubscribe?email='
+
+
+def _cabecalho(nome, valor):
+    return f"{nome}: {valor}\r\n".encode('utf-8')
+
+
+def _cabecalho_codificado(nome, valor):
+    """Cabeçalho com o valor em encoded-word quando não é ASCII, é longo demais ou tem CR/LF
+
+    Uma quebra de linha crua no valor (ex.: assunto com campos do CSV)
+    injetaria novos cabeçalhos; codificada, vira só espaço dobrado.
+    """
+    if valor.isascii() and len(valor) < 900 and '\n' not in valor and '\r' not in valor:
+        return _cabecalho(nome, valor)
+    codificado = Header(valor, 'utf-8', header_name=nome).encode(linesep='\r\n')
+    return f"{nome}: {codificado}\r\n".encode('ascii')
+
+
+def _endereco(endereco):
+    """'Nome <email>' com o nome em encoded-word se necessário"""
+    nome, email = parseaddr(endereco)
+    if nome and not nome.isascii():
+        return formataddr((nome, email), charset='utf-8')
+    return endereco
+
+
+class MessageFactory:
+    """Monta os bytes finais (wire format) das mensagens de uma campanha
+
+    A estrutura MIME (multipart/alternative com text/plain e text/html), o
+    boundary e os cabeçalhos fixos são codificados uma vez na criação. Por
+    destinatário só os campos variáveis são gerados (To, Subject, Date,
+    Message-ID, List-Unsubscribe e os dois corpos renderizados direto em
+    bytes) e tudo é unido em um único join, sem objetos email.message.
+
+    Os corpos saem em 7bit quando são ASCII, em 8bit quando o servidor
+    anuncia 8BITMIME (`oito_bits`; o envio deve usar `mail_options`) e em
+    quoted-printable nos demais casos ou quando alguma linha passa de 998
+    octetos. Base64 não é usado: o HTML é quase todo ASCII e QP/8bit
+    mantêm o tamanho da mensagem próximo ao do template.
+
+    Templates sem placeholders (`coletiva`) também geram, com
+    `montar_coletiva`, uma única mensagem para envelopes com vários
+    destinatários — sem o descadastro de um clique, por isso o envio
+    coletivo é opt-in (PipelineDispatchEngine.destinatarios_por_envelope).
+    """
+
+    def __init__(self, template, assunto, remetente, hostname, oito_bits=False):
+        if isinstance(template, str):
+            template = compilar_template(template)
+        if isinstance(assunto, str):
+            assunto = compilar_template(assunto)
+        self.assunto = assunto
+        self.hostname = hostname
+        # Sem placeholders a mensagem é igual para todos e pode ir para vários RCPT de uma vez
+        self.coletiva = not (template.placeholders | template.texto_alternativo.placeholders | assunto.placeholders)
+        self.oito_bits = oito_bits
+        self.mail_options = ('BODY=8BITMIME',) if oito_bits else ()
+
+        self.html = template.codificado()
+        self.texto = template.texto_alternativo.codificado()
+
+        # Um boundary por campanha; o hex aleatório não aparece em texto comum
+        boundary = f"=============={uuid.uuid4().hex}=="
+        separador = f"--{boundary}".encode('ascii')
+
+        self.inicio = (
+            f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n'
+            'MIME-Version: 1.0\r\n'
+        ).encode('ascii') + _cabecalho('From', _endereco(remetente))
+        self.fixos_meio = _cabecalho('X-Mailer', X_MAILER) + _cabecalho('X-Sender', remetente)
+        self.fixos_fim = (
+            b'Precedence: bulk\r\n'
+            b'Auto-Submitted: auto-generated\r\n' +
+            _cabecalho('Authentication-Results', f"spf=pass smtp.mailfrom={remetente}")
+        )
+        self.unsubscribe_post = b'List-Unsubscribe-Post: List-Unsubscribe=One-Click\r\n'
+        self.mailto_unsubscribe = f"<mailto:unsubscribe@{hostname}?subject=unsubscribe>"
+
+        # Cabeçalhos de cada parte, um por codificação possível
+        self.partes = {}
+        for subtipo in ('plain', 'html'):
+            for codificacao in ('7bit', '8bit', 'quoted-printable'):
+                charset = 'us-ascii' if codificacao == '7bit' else 'utf-8'
+                self.partes[subtipo, codificacao] = (
+                    CRLF + separador + CRLF +
+                    f'Content-Type: text/{subtipo}; charset="{charset}"\r\n'
+                    'MIME-Version: 1.0\r\n'
+                    f'Content-Transfer-Encoding: {codificacao}\r\n\r\n'.encode('ascii')
+                )
+        self.fim = CRLF + separador + b'--' + CRLF
+
+        self._data = (0, None)
+
+    def _data_atual(self):
+        """Cabeçalho Date, refeito no máximo uma vez por segundo"""
+        segundo = int(time.time())
+        if self._data[0] != segundo:
+            self._data = (segundo, _cabecalho('Date', formatdate(segundo, localtime=True)))
+        return self._data[1]
+
+    def _corpo(self, template, corpo):
+        """Escolhe a codificação do corpo renderizado; retorna (codificação, bytes)"""
+        # O limite calculado sobre o template evita varrer o corpo na maioria das mensagens
+        longa = (template.linha_maxima + len(corpo) - template.tamanho_literal > 998
+                 and LINHA_LONGA.search(corpo) is not None)
+        if not longa:
+            if corpo.isascii():
+                return '7bit', corpo
+            if self.oito_bits:
+                return '8bit', corpo
+        # Sem CRLF no corpo, o b2a_qp quebra as linhas com '=\n'; o DATA (e a
+        # assinatura DKIM) precisam de CRLF em todas as quebras
+        return 'quoted-printable', binascii.b2a_qp(corpo).replace(b'=\n', b'=\r\n')
+
+    def montar(self, destinatario, nome, primeiro_nome, campos=None):
+        """Bytes prontos para o DATA (sem assinatura DKIM)"""
+        unsubscribe_url = URL_UNSUBSCRIBE + destinatario
+        valores = {
+            'nome': nome,
+            'primeiro_nome': primeiro_nome,
+            'unsubscribe': unsubscribe_url,
+            'EMAIL': destinatario,
+            'NOME': nome
+        }
+        codificacao_texto, texto = self._corpo(self.texto, self.texto.render(valores, campos))
+        codificacao_html, html = self._corpo(self.html, self.html.render(valores, campos))
+        return b''.join((
+            self.inicio,
+            _cabecalho('To', destinatario),
+            _cabecalho_codificado('Subject', self.assunto.render(valores, campos)),
+            self._data_atual(),
+            _cabecalho('Message-ID', make_msgid(domain=self.hostname)),
+            self.fixos_meio,
+            _cabecalho('X-Receiver', destinatario),
+            self.fixos_fim,
+            f"List-Unsubscribe: <{unsubscribe_url}>,\r\n {self.mailto_unsubscribe}\r\n".encode('utf-8'),
+            self.unsubscribe_post,
+            CRLF,
+            self.partes['plain', codificacao_texto],
+            texto,
+            self.partes['html', codificacao_html],
+            html,
+            self.fim
+        ))
+
+    def montar_coletiva(self):
+        """Bytes de uma mensagem sem campos do destinatário, para um envelope com vários RCPT
+
+        O To: vira 'undisclosed-recipients:;' e o descadastro fica só no
+        mailto: o link de um clique (RFC 8058) depende do email do
+        destinatário, então a mensagem não leva List-Unsubscribe-Post.
+        """
+        codificacao_texto, texto = self._corpo(self.texto, self.texto.render({}))
+        codificacao_html, html = self._corpo(self.html, self.html.render({}))
+        return b''.join((
+            self.inicio,
+            b'To: undisclosed-recipients:;\r\n',
+            _cabecalho_codificado('Subject', self.assunto.render({})),
+            self._data_atual(),
+            _cabecalho('Message-ID', make_msgid(domain=self.hostname)),
+            self.fixos_meio,
+            self.fixos_fim,
+            f"List-Unsubscribe: {self.mailto_unsubscribe}\r\n".encode('ascii'),
+            CRLF,
+            self.partes['plain', codificacao_texto],
+            texto,
+            self.partes['html', codificacao_html],
+            html,
+            self.fim
+        ))
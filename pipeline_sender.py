@@ -0,0 +1,127 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parseaddr
+from itertools import islice
+
+from rate_limiter import dominio_do_email
+
+
+class PipelineDispatchEngine:
+    """Envio com PIPELINING: várias transações em voo por conexão SMTP
+
+    Os destinatários liberados pelo limitador são agrupados em lotes de
+    `transacoes_por_lote` transações; cada lote vai inteiro por uma sessão
+    do pool (ClienteSMTP.enviar_pipeline), com uma ida e volta por
+    transação em vez de uma por comando. `conexoes` lotes são enviados em
+    paralelo, cada um em uma sessão.
+
+    Com `destinatarios_por_envelope` > 1 e um template sem placeholders
+    (MessageFactory.coletiva), a mensagem é montada e assinada uma única vez
+    e cada transação leva até `destinatarios_por_envelope` RCPT com um único
+    DATA. É opt-in: a mensagem coletiva não tem o link de descadastro de um
+    clique (List-Unsubscribe-Post), que depende do email do destinatário.
+    """
+
+    def __init__(self, dispatcher, conexoes=4, transacoes_por_lote=20, destinatarios_por_envelope=1,
+                 rate_limiter=None):
+        self.dispatcher = dispatcher
+        self.logger = dispatcher.logger
+        self.rate_limiter = rate_limiter or dispatcher.rate_limiter
+        self.conexoes = conexoes
+        self.transacoes_por_lote = transacoes_por_lote
+        self.destinatarios_por_envelope = destinatarios_por_envelope
+
+    def _transacoes(self, liberados, fabrica):
+        """Gera ([destinatario], bytes, erro) por transação; `erro` quando a mensagem não pôde ser montada"""
+        if self._coletiva(fabrica):
+            dados = self.dispatcher.montar_bytes_coletiva(fabrica)
+            while True:
+                grupo = list(islice(liberados, self.destinatarios_por_envelope))
+                if not grupo:
+                    return
+                yield grupo, dados, None
+        for destinatario in liberados:
+            email, nome, primeiro_nome, campos, _ = destinatario
+            try:
+                dados = self.dispatcher.montar_bytes(
+                    fabrica, self.dispatcher.dkim_signer, email, nome, primeiro_nome, campos
+                )
+                yield [destinatario], dados, None
+            except Exception as e:
+                yield [destinatario], None, e
+
+    def _coletiva(self, fabrica):
+        return fabrica.coletiva and self.destinatarios_por_envelope > 1
+
+    def _enviar_lote(self, pool, envelope, lote, mail_options):
+        """Executado em uma thread do executor; retorna [(destinatario, resposta, erro)]"""
+        transacoes = [(envelope, [destinatario[0] for destinatario in destinatarios], dados)
+                      for destinatarios, dados in lote]
+        resultados = []
+        try:
+            respostas = pool.enviar_pipeline(transacoes, mail_options)
+        except Exception as e:
+            respostas = [[(destinatario[0], None, e) for destinatario in destinatarios] for destinatarios, _ in lote]
+        for (destinatarios, _), resposta in zip(lote, respostas):
+            for destinatario, (_, texto, erro) in zip(destinatarios, resposta):
+                resultados.append((destinatario, texto, erro))
+        return resultados
+
+    def run(self, destinatarios, template, assunto, remetente, stats, checkpoint=None, retentativas=None):
+        """Executa a campanha e bloqueia até o fim"""
+        fabrica = self.dispatcher.fabrica_mensagens(template, assunto, remetente)
+        envelope = parseaddr(remetente)[1]
+        pool = self.dispatcher.obter_pool_smtp()
+        conexoes = min(self.conexoes, pool.size)
+        em_andamento = set()
+
+        self.logger.info(
+            f"Envio com pipelining: {conexoes} conexões, {self.transacoes_por_lote} transações por lote"
+            + (f", até {self.destinatarios_por_envelope} destinatários por envelope" if self._coletiva(fabrica) else "")
+        )
+
+        def consolidar(concluidos):
+            for futuro in concluidos:
+                for destinatario, resposta, erro in futuro.result():
+                    dominio = dominio_do_email(destinatario[0])
+                    if erro is None:
+                        self.dispatcher.registrar_envio(destinatario[-1], resposta, stats, checkpoint)
+                        self.rate_limiter.registrar_sucesso(dominio)
+                    else:
+                        self.rate_limiter.registrar_resultado(dominio, erro)
+                        self.dispatcher.tratar_falha(destinatario, erro, stats, checkpoint, retentativas)
+                    self.dispatcher.registrar_progresso(stats)
+
+        with ThreadPoolExecutor(max_workers=conexoes, thread_name_prefix='pipeline') as executor, \
+                self.dispatcher.sessao_campanha():
+            fonte = destinatarios if retentativas is None else retentativas.intercalar(destinatarios)
+            while fonte is not None:
+                liberados = self.rate_limiter.liberar(
+                    self.dispatcher.destinatarios_validos(fonte, stats),
+                    dominio=lambda destinatario: dominio_do_email(destinatario[0])
+                )
+                transacoes = self._transacoes(liberados, fabrica)
+                while True:
+                    bloco = list(islice(transacoes, self.transacoes_por_lote))
+                    if not bloco:
+                        break
+                    lote = []
+                    for destinatarios_tx, dados, erro in bloco:
+                        if erro is None:
+                            lote.append((destinatarios_tx, dados))
+                            continue
+                        # Mensagem que não pôde ser montada (ex.: email inválido)
+                        for email, _, _, _, linha in destinatarios_tx:
+                            self.dispatcher.registrar_falha(email, erro, stats, checkpoint, linha)
+                            self.dispatcher.registrar_progresso(stats)
+                    if not lote:
+                        continue
+                    if len(em_andamento) >= 2 * conexoes:
+                        concluidos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                        consolidar(concluidos)
+                    em_andamento.add(executor.submit(
+                        self._enviar_lote, pool, envelope, lote, fabrica.mail_options
+                    ))
+                consolidar(wait(em_andamento).done)
+                em_andamento = set()
+                # Novas tentativas que sobraram, enviadas à medida que vencem
+                fonte = retentativas.rodada() if retentativas is not None else None
@@ -0,0 +1,340 @@
+import asyncio
+import smtplib
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+# Limites por domínio de destino (emails por segundo)
+LIMITES_DOMINIO_PADRAO = {
+    'gmail.com': 5,
+    'googlemail.com': 5,
+    'hotmail.com': 3,
+    'outlook.com': 3,
+    'live.com': 3,
+    'yahoo.com': 3,
+    'yahoo.com.br': 3,
+    'uol.com.br': 2,
+    'bol.com.br': 2,
+    'terra.com.br': 2
+}
+
+
+def dominio_do_email(email):
+    """Retorna o domínio (minúsculo) de um endereço de email"""
+    return email.rpartition('@')[2].lower()
+
+
+def codigo_smtp(erro):
+    """Extrai o código SMTP de uma exceção do smtplib, se houver"""
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        codigos = [codigo for codigo, _ in erro.recipients.values()]
+        return codigos[0] if codigos else None
+    return getattr(erro, 'smtp_code', None)
+
+
+def erro_temporario(erro):
+    """Indica se o erro é um adiamento temporário (4xx) do servidor de destino"""
+    codigo = codigo_smtp(erro)
+    return codigo is not None and 400 <= codigo < 500
+
+
+class TokenBucket:
+    """Token bucket simples; não é thread-safe por si só (protegido pelo limitador)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.ultimo = time.monotonic()
+        # Taxa configurada, para a qual a taxa volta após adiamentos
+        self.limite = self.rate
+
+    def reabastecer(self, agora):
+        self.tokens = min(self.capacity, self.tokens + (agora - self.ultimo) * self.rate)
+        self.ultimo = agora
+
+    def espera(self, tokens=1):
+        """Segundos até haver `tokens` disponíveis (0 se já houver)"""
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def ajustar_taxa(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(rate))
+        self.tokens = min(self.tokens, self.capacity)
+
+
+class DomainRateLimiter:
+    """Limitador único de envio: teto global adaptativo + token bucket por domínio de destino
+
+    O teto global começa em `global_rate`, cai pela metade a cada adiamento 4xx
+    e volta a subir gradualmente com os envios bem-sucedidos. Cada domínio tem
+    seu próprio bucket, de modo que um domínio estrangulado não bloqueia os demais.
+    """
+
+    def __init__(self, global_rate=8, domain_limits=None, default_domain_rate=None,
+                 min_rate=1, recovery_step=0.1):
+        self.max_global_rate = float(global_rate)
+        self.min_rate = float(min_rate)
+        self.recovery_step = recovery_step
+        self.domain_limits = dict(LIMITES_DOMINIO_PADRAO if domain_limits is None else domain_limits)
+        self.default_domain_rate = float(default_domain_rate or global_rate)
+
+        self._global = TokenBucket(global_rate)
+        self._dominios = {}
+        self._lock = threading.Lock()
+
+        self.metrics = {
+            'liberados': 0,
+            'adiamentos': 0,
+            'espera_total': 0.0
+        }
+
+    def _bucket(self, dominio):
+        bucket = self._dominios.get(dominio)
+        if bucket is None:
+            bucket = TokenBucket(self.domain_limits.get(dominio, self.default_domain_rate))
+            self._dominios[dominio] = bucket
+        return bucket
+
+    def try_acquire(self, dominio):
+        """Consome um token global e um do domínio; retorna 0 ou os segundos a esperar"""
+        with self._lock:
+            agora = time.monotonic()
+            self._global.reabastecer(agora)
+            bucket = self._bucket(dominio)
+            bucket.reabastecer(agora)
+            espera = max(self._global.espera(), bucket.espera())
+            if espera > 0:
+                return espera
+            self._global.tokens -= 1
+            bucket.tokens -= 1
+            self.metrics['liberados'] += 1
+            return 0.0
+
+    def acquire(self, dominio):
+        """Bloqueia até haver orçamento para um envio ao domínio"""
+        while True:
+            espera = self.try_acquire(dominio)
+            if espera == 0:
+                return
+            self._registrar_espera(espera)
+            time.sleep(espera)
+
+    async def acquire_async(self, dominio):
+        """Versão assíncrona de acquire"""
+        while True:
+            espera = self.try_acquire(dominio)
+            if espera == 0:
+                return
+            self._registrar_espera(espera)
+            await asyncio.sleep(espera)
+
+    def _registrar_espera(self, espera):
+        with self._lock:
+            self.metrics['espera_total'] += espera
+
+    def registrar_sucesso(self, dominio):
+        """Recupera gradualmente as taxas reduzidas por adiamentos anteriores"""
+        with self._lock:
+            if self._global.rate < self.max_global_rate:
+                self._global.ajustar_taxa(min(self.max_global_rate, self._global.rate + self.recovery_step))
+            bucket = self._bucket(dominio)
+            if bucket.rate < bucket.limite:
+                bucket.ajustar_taxa(min(bucket.limite, bucket.rate + self.recovery_step))
+
+    def registrar_adiamento(self, dominio):
+        """Reduz pela metade a taxa global e a do domínio após um 4xx"""
+        with self._lock:
+            self.metrics['adiamentos'] += 1
+            self._global.ajustar_taxa(max(self.min_rate, self._global.rate / 2))
+            bucket = self._bucket(dominio)
+            bucket.ajustar_taxa(max(self.min_rate, bucket.rate / 2))
+
+    def registrar_resultado(self, dominio, erro=None):
+        """Atualiza as taxas de acordo com o resultado de um envio"""
+        if erro is None:
+            self.registrar_sucesso(dominio)
+        elif erro_temporario(erro):
+            self.registrar_adiamento(dominio)
+
+    def taxa_global(self):
+        with self._lock:
+            return self._global.rate
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['taxa_global'] = self._global.rate
+            metrics['taxas_dominio'] = {d: b.rate for d, b in self._dominios.items() if b.rate < b.limite}
+        return metrics
+
+    def _proximo(self, filas):
+        """Escolhe o próximo item de um domínio com orçamento (rodízio); retorna (item, espera)"""
+        menor_espera = None
+        for dominio in list(filas):
+            espera = self.try_acquire(dominio)
+            if espera == 0:
+                fila = filas.pop(dominio)
+                item = fila.popleft()
+                if fila:
+                    # Vai para o fim da fila de domínios para intercalar
+                    filas[dominio] = fila
+                return item, 0.0
+            menor_espera = espera if menor_espera is None else min(menor_espera, espera)
+        return None, menor_espera
+
+    def _abastecer(self, filas, fonte, dominio, janela, pendentes):
+        while pendentes[0] < janela:
+            try:
+                item = next(fonte)
+            except StopIteration:
+                return False
+            filas.setdefault(dominio(item), deque()).append(item)
+            pendentes[0] += 1
+        return True
+
+    def liberar(self, itens, dominio=dominio_do_email, janela=1000):
+        """Gera os itens respeitando os limites, intercalando domínios com orçamento disponível
+
+        Mantém no máximo `janela` itens em memória; quando só há domínios
+        estrangulados na janela, dorme até o primeiro ter orçamento.
+        """
+        fonte = iter(itens)
+        filas = OrderedDict()
+        pendentes = [0]
+        while True:
+            self._abastecer(filas, fonte, dominio, janela, pendentes)
+            if not filas:
+                return
+            item, espera = self._proximo(filas)
+            if espera:
+                self._registrar_espera(espera)
+                time.sleep(espera)
+                continue
+            pendentes[0] -= 1
+            yield item
+
+    async def liberar_async(self, itens, dominio=dominio_do_email, janela=1000):
+        """Versão assíncrona de liberar (a fonte continua sendo um iterável comum)"""
+        fonte = iter(itens)
+        filas = OrderedDict()
+        pendentes = [0]
+        while True:
+            self._abastecer(filas, fonte, dominio, janela, pendentes)
+            if not filas:
+                return
+            item, espera = self._proximo(filas)
+            if espera:
+                self._registrar_espera(espera)
+                await asyncio.sleep(espera)
+                continue
+            pendentes[0] -= 1
+            yield item
+
+
+# Quanto uma campanha comum espera enquanto há envios prioritários em andamento
+ESPERA_PRIORIDADE = 0.05
+
+
+class FairShareLimiter:
+    """Divide o orçamento global de um DomainRateLimiter entre campanhas simultâneas
+
+    Cada campanha comum em execução recebe a mesma parcela do teto global
+    (que continua adaptativo), e os limites por domínio seguem
+    compartilhados. Campanhas prioritárias (envios de teste) não têm
+    parcela: enquanto houver alguma ativa, as demais cedem a vez.
+    """
+
+    def __init__(self, limitador):
+        self.limitador = limitador
+        self._lock = threading.Lock()
+        self._comuns = 0
+        self._prioritarias = 0
+
+    def para_campanha(self, prioritaria=False):
+        """Limitador da campanha; devolva com `encerrar` quando ela terminar"""
+        with self._lock:
+            if prioritaria:
+                self._prioritarias += 1
+            else:
+                self._comuns += 1
+        return CampaignRateLimiter(self, prioritaria)
+
+    def encerrar(self, limitador_campanha):
+        with self._lock:
+            if limitador_campanha.prioritaria:
+                self._prioritarias -= 1
+            else:
+                self._comuns -= 1
+
+    def prioritarias_ativas(self):
+        with self._lock:
+            return self._prioritarias
+
+    def parcela(self):
+        """Taxa disponível para cada campanha comum"""
+        with self._lock:
+            comuns = max(1, self._comuns)
+        return self.limitador.taxa_global() / comuns
+
+
+class CampaignRateLimiter(DomainRateLimiter):
+    """Visão de uma campanha sobre o limitador compartilhado (criada por FairShareLimiter)
+
+    O bucket global próprio guarda a parcela da campanha; cada envio consome
+    também um token do limitador compartilhado (teto global e domínio).
+    """
+
+    def __init__(self, divisao, prioritaria=False):
+        compartilhado = divisao.limitador
+        super().__init__(
+            global_rate=compartilhado.max_global_rate,
+            domain_limits=compartilhado.domain_limits,
+            default_domain_rate=compartilhado.default_domain_rate,
+            min_rate=compartilhado.min_rate,
+            recovery_step=compartilhado.recovery_step
+        )
+        self.divisao = divisao
+        self.compartilhado = compartilhado
+        self.prioritaria = prioritaria
+        # Começa já na parcela atual (sem a rajada de um teto inteiro)
+        self._global.ajustar_taxa(divisao.parcela())
+
+    def try_acquire(self, dominio):
+        if not self.prioritaria and self.divisao.prioritarias_ativas():
+            return ESPERA_PRIORIDADE
+        with self._lock:
+            if not self.prioritaria:
+                parcela = self.divisao.parcela()
+                if parcela != self._global.rate:
+                    self._global.ajustar_taxa(parcela)
+                self._global.reabastecer(time.monotonic())
+                espera = self._global.espera()
+                if espera > 0:
+                    return espera
+            espera = self.compartilhado.try_acquire(dominio)
+            if espera > 0:
+                return espera
+            if not self.prioritaria:
+                self._global.tokens -= 1
+            self.metrics['liberados'] += 1
+            return 0.0
+
+    def registrar_sucesso(self, dominio):
+        self.compartilhado.registrar_sucesso(dominio)
+
+    def registrar_adiamento(self, dominio):
+        with self._lock:
+            self.metrics['adiamentos'] += 1
+        self.compartilhado.registrar_adiamento(dominio)
+
+    def taxa_global(self):
+        if self.prioritaria:
+            return self.compartilhado.taxa_global()
+        return self.divisao.parcela()
+
+    def encerrar(self):
+        self.divisao.encerrar(self)
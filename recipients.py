@@ -0,0 +1,172 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Mesmo formato aceito por EmailDispatcher.validar_email
+PADRAO_EMAIL = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+
+# Motivos de rejeição contabilizados pela etapa de preparação
+MOTIVOS_REJEICAO = ('vazio', 'invalido', 'duplicado', 'blacklist')
+
+
+def extrair_primeiro_nome(nome):
+    """Primeiro nome de um nome completo; tolera NaN/None e nomes vazios"""
+    if not isinstance(nome, str):
+        return ''
+    partes = nome.split(None, 1)
+    return partes[0] if partes else ''
+
+
+class Destinatarios:
+    """Destinatários já normalizados e validados, em listas simples (sem linhas do pandas)
+
+    A iteração gera tuplas (email, nome, primeiro_nome, campos, linha), onde
+    `campos` traz as colunas extras do CSV (ou None quando a lista só tem
+    EMAIL/NOME) e `linha` é a posição da linha de dados na lista (usada
+    pelo checkpoint da campanha).
+    """
+
+    def __init__(self, emails, nomes, primeiros_nomes, campos=None, rejeicoes=None, total=None, linhas=None):
+        self.emails = emails
+        self.nomes = nomes
+        self.primeiros_nomes = primeiros_nomes
+        self.campos = campos
+        self.linhas = np.arange(len(emails), dtype=np.int64) if linhas is None else linhas
+        self.rejeicoes = rejeicoes or dict.fromkeys(MOTIVOS_REJEICAO, 0)
+        self.total = len(emails) if total is None else total
+
+    def __len__(self):
+        return len(self.emails)
+
+    def __iter__(self):
+        campos = self.campos if self.campos is not None else [None] * len(self.emails)
+        return zip(self.emails, self.nomes, self.primeiros_nomes, campos, self.linhas.tolist())
+
+    def __getitem__(self, fatia):
+        """Recorte por slice, usado para dividir a campanha em partes"""
+        return Destinatarios(
+            self.emails[fatia],
+            self.nomes[fatia],
+            self.primeiros_nomes[fatia],
+            self.campos[fatia] if self.campos is not None else None,
+            rejeicoes=dict.fromkeys(MOTIVOS_REJEICAO, 0),
+            linhas=self.linhas[fatia]
+        )
+
+    def sem(self, mascara):
+        """Cópia sem os destinatários marcados na máscara booleana (ex.: já enviados)"""
+        manter = np.flatnonzero(~mascara)
+        return Destinatarios(
+            [self.emails[i] for i in manter],
+            [self.nomes[i] for i in manter],
+            [self.primeiros_nomes[i] for i in manter],
+            [self.campos[i] for i in manter] if self.campos is not None else None,
+            rejeicoes=self.rejeicoes,
+            total=self.total,
+            linhas=self.linhas[manter]
+        )
+
+
+class RegistroVistos:
+    """Emails já aceitos em blocos anteriores, guardados como hashes de 64 bits ordenados
+
+    Permite deduplicar uma lista lida em blocos com 8 bytes por destinatário,
+    sem manter as strings em memória.
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @staticmethod
+    def calcular(emails):
+        return pd.util.hash_pandas_object(emails, index=False).to_numpy()
+
+    def contem(self, hashes):
+        """Máscara dos hashes que já foram registrados"""
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        posicoes = np.searchsorted(self.hashes, hashes)
+        posicoes[posicoes == len(self.hashes)] = 0
+        return self.hashes[posicoes] == hashes
+
+    def registrar(self, hashes):
+        self.hashes = np.concatenate([self.hashes, hashes])
+        self.hashes.sort(kind='stable')
+
+
+def colunas_extras(df):
+    """Colunas além de EMAIL/NOME que têm algum valor (ignora as 'Unnamed' vazias)"""
+    extras = []
+    for coluna in df.columns:
+        if coluna in ('EMAIL', 'NOME'):
+            continue
+        if str(coluna).startswith('UNNAMED') and df[coluna].isna().all():
+            continue
+        extras.append(coluna)
+    return extras
+
+
+def preparar_destinatarios(df, blacklist=None, vistos=None, inicio=0):
+    """Normaliza e valida a lista (ou um bloco dela) de uma vez com operações vetorizadas do pandas
+
+    Emails são aparados e convertidos para minúsculas, validados pelo regex
+    compilado, deduplicados e, se houver índice, filtrados pela blacklist.
+    Com `vistos` (RegistroVistos), a deduplicação vale também entre blocos.
+    Nomes ausentes (NaN) viram ''. `inicio` é a posição da primeira linha do
+    bloco na lista, para que `linhas` traga posições absolutas.
+    """
+    total = len(df)
+    emails = df['EMAIL'].astype('string').str.strip().str.lower()
+
+    vazio = (emails.isna() | (emails == '')).to_numpy(dtype=bool)
+    formato_ok = emails.str.match(PADRAO_EMAIL).fillna(False).to_numpy(dtype=bool)
+    invalido = ~vazio & ~formato_ok
+    aceitos = ~vazio & ~invalido
+
+    if vistos is None:
+        duplicado = aceitos & emails.duplicated(keep='first').to_numpy(dtype=bool)
+    else:
+        hashes = RegistroVistos.calcular(emails)
+        repetido = pd.Series(hashes).duplicated(keep='first').to_numpy()
+        duplicado = aceitos & (repetido | vistos.contem(hashes))
+    aceitos &= ~duplicado
+
+    na_blacklist = np.zeros(total, dtype=bool)
+    if blacklist is not None:
+        na_blacklist = aceitos & blacklist.mascara(emails).to_numpy(dtype=bool)
+        aceitos &= ~na_blacklist
+
+    if vistos is not None:
+        vistos.registrar(hashes[aceitos | na_blacklist])
+
+    rejeicoes = {
+        'vazio': int(vazio.sum()),
+        'invalido': int(invalido.sum()),
+        'duplicado': int(duplicado.sum()),
+        'blacklist': int(na_blacklist.sum())
+    }
+
+    selecionados = df[aceitos]
+    if 'NOME' in df.columns:
+        nomes = selecionados['NOME'].astype('string').fillna('').str.strip()
+    else:
+        nomes = pd.Series('', index=selecionados.index, dtype='string')
+    primeiros = nomes.str.split(n=1).str[0].fillna('')
+
+    extras = colunas_extras(df)
+    campos = selecionados[extras].to_dict('records') if extras else None
+
+    return Destinatarios(
+        emails[aceitos].tolist(),
+        nomes.tolist(),
+        primeiros.tolist(),
+        campos,
+        rejeicoes=rejeicoes,
+        total=total,
+        linhas=np.flatnonzero(aceitos) + inicio
+    )
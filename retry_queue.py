@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import smtplib
+import threading
+import time
+
+from rate_limiter import codigo_smtp
+from smtp_pool import erro_de_conexao, resposta_do_erro
+
+
+# Classes de falha de envio
+TEMPORARIO = 'temporario'  # 4xx: adiamento (greylisting, caixa cheia, limite do destino)
+PERMANENTE = 'permanente'  # 5xx: recusa definitiva
+CONEXAO = 'conexao'  # sessão caiu ou o servidor encerrou o serviço (421)
+
+
+def classificar_erro(erro):
+    """Classe da falha (TEMPORARIO, PERMANENTE ou CONEXAO); None se o erro não veio do SMTP
+
+    Aceita também a resposta já formatada ('451 texto'), como chega dos shards.
+    """
+    if isinstance(erro, BaseException):
+        if erro_de_conexao(erro):
+            return CONEXAO
+        codigo = codigo_smtp(erro)
+    else:
+        codigo = str(erro)[:3]
+        codigo = int(codigo) if codigo.isdigit() else None
+    if codigo is None:
+        return None
+    if codigo == 421:
+        return CONEXAO
+    if 400 <= codigo < 500:
+        return TEMPORARIO
+    if 500 <= codigo < 600:
+        return PERMANENTE
+    return None
+
+
+def destinatario_invalido(erro):
+    """Recusa permanente do próprio destinatário (5xx no RCPT), que vai para a blacklist
+
+    Recusas do remetente ou do conteúdo (MAIL/DATA) também são permanentes,
+    mas não dizem nada sobre o endereço.
+    """
+    return isinstance(erro, smtplib.SMTPRecipientsRefused) and classificar_erro(erro) == PERMANENTE
+
+
+class RetryQueue:
+    """Novas tentativas de uma campanha, ordenadas pelo horário da próxima tentativa (heap)
+
+    Falhas temporárias esperam `espera_inicial` segundos, dobrando a cada
+    tentativa até `espera_maxima`; quedas de conexão são repetidas após
+    `espera_conexao` (o pool reconecta). Depois de `tentativas` envios a
+    falha é definitiva. Os vencidos são intercalados na fonte de
+    destinatários (`intercalar`), sem atrasar os demais; quando a fonte
+    acaba, `rodada` espera o próximo vencimento.
+
+    `ao_invalidar(email, motivo)` recebe os destinatários recusados em
+    definitivo (ex.: EmailScheduler.add_invalid_email).
+    """
+
+    def __init__(self, tentativas=3, espera_inicial=30, espera_maxima=300, espera_conexao=2, ao_invalidar=None):
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.espera_conexao = espera_conexao
+        self.ao_invalidar = ao_invalidar
+        self._heap = []
+        self._sequencia = itertools.count()
+        # Tentativas já feitas pelos destinatários que voltaram da fila
+        self._tentativas = {}
+        self._lock = threading.Lock()
+        self.metrics = {
+            'agendadas': 0,
+            'esgotadas': 0,
+            'invalidados': 0
+        }
+
+    def adiar(self, destinatario, erro):
+        """Agenda nova tentativa se a falha for transitória; retorna a espera em segundos ou None"""
+        classe = classificar_erro(erro)
+        with self._lock:
+            tentativa = self._tentativas.pop(destinatario[0], 1)
+            if classe not in (TEMPORARIO, CONEXAO):
+                return None
+            if tentativa >= self.tentativas:
+                self.metrics['esgotadas'] += 1
+                return None
+            if classe == CONEXAO:
+                espera = self.espera_conexao
+            else:
+                espera = min(self.espera_maxima, self.espera_inicial * 2 ** (tentativa - 1))
+            heapq.heappush(self._heap, (time.monotonic() + espera, next(self._sequencia), tentativa + 1, destinatario))
+            self.metrics['agendadas'] += 1
+        return espera
+
+    def descartar(self, destinatario, erro):
+        """Falha definitiva: repassa a `ao_invalidar` quando o endereço foi recusado"""
+        if self.ao_invalidar is None or not destinatario_invalido(erro):
+            return
+        with self._lock:
+            self.metrics['invalidados'] += 1
+        try:
+            self.ao_invalidar(destinatario[0], resposta_do_erro(erro))
+        except Exception:
+            # A blacklist é opcional: a falha já foi contabilizada
+            pass
+
+    def vencidos(self):
+        """Retira da fila os destinatários cuja próxima tentativa já venceu"""
+        vencidos = []
+        agora = time.monotonic()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= agora:
+                _, _, tentativa, destinatario = heapq.heappop(self._heap)
+                self._tentativas[destinatario[0]] = tentativa
+                vencidos.append(destinatario)
+        return vencidos
+
+    def espera(self):
+        """Segundos até o próximo vencimento (0 se já venceu, None com a fila vazia)"""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def intercalar(self, fonte):
+        """Gera os itens de `fonte` com os vencidos intercalados; não espera por nenhum"""
+        for item in fonte:
+            yield from self.vencidos()
+            yield item
+        yield from self.vencidos()
+
+    def rodada(self):
+        """Bloqueia até o próximo vencimento e retorna os vencidos; None com a fila vazia"""
+        espera = self.espera()
+        if espera is None:
+            return None
+        time.sleep(espera)
+        return self.vencidos()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
@@ -1,31 +1,46 @@
 import time
-from datetime import datetime
 import pytz
 import threading
 from sender import EmailDispatcher
-import pandas as pd
 import os
 import psutil
-import sqlite3
 from pathlib import Path
+from blacklist import BlacklistIndex, BlacklistStore
+from campaign_store import CampaignStore
+from campaign_executor import CampaignExecutor
+from retry_queue import destinatario_invalido
+from smtp_pool import resposta_do_erro
 
 class EmailScheduler:
-    def __init__(self, schedules=None):
-        self.schedules = schedules if schedules is not None else []
-        self.dispatcher = EmailDispatcher()
+    def __init__(self, campanhas=None, dispatcher=None):
+        self.campanhas = campanhas or CampaignStore()
+        self.dispatcher = dispatcher or EmailDispatcher()
         self.timezone = pytz.timezone('America/Sao_Paulo')
         self.running = False
         self.thread = None
+        # Teto da espera entre consultas (protege contra ajustes no relógio)
+        self.espera_maxima = 60
         
         # Configurações de otimização
         self.batch_size = 250  # Lotes menores para melhor controle
-        self.pause_between_emails = 0.05  # 50ms entre cada email do lote
-        self.pause_between_batches = 10  # 10 segundos entre lotes
+        # O ritmo de envio é controlado pelo rate_limiter do dispatcher
         self.memory_threshold = 75  # Limite mais conservador de memória
         
+        # Campanhas simultâneas: até max_massa envios em massa, testes sempre
+        # têm uma thread livre; concorrência de envio por campanha, por tipo
+        self.max_massa = 2
+        self.concorrencia_por_tipo = {'test': 1, 'mass': 4}
+        self.executor = CampaignExecutor(
+            self._executar_campanha,
+            self.dispatcher.rate_limiter,
+            max_massa=self.max_massa
+        )
+        # O pool SMTP é compartilhado: dimensiona para todas as campanhas simultâneas
+        sessoes = self.max_massa * self.concorrencia_por_tipo['mass'] + self.concorrencia_por_tipo['test']
+        self.dispatcher.smtp_pool_config['size'] = max(self.dispatcher.smtp_pool_config['size'], sessoes)
+        
         # Banco de dados é opcional
         self.db_enabled = False
-        self.conn = None
         try:
             self.init_database()
             self.db_enabled = True
@@ -37,18 +52,11 @@ class EmailScheduler:
         """Inicializa o banco de dados SQLite"""
         try:
             db_path = Path('email_blacklist.db')
-            self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
-            cursor = self.conn.cursor()
+            # Escritas agrupadas pela thread escritora (WAL, um commit por grupo)
+            self.blacklist_store = BlacklistStore.compartilhado(str(db_path))
             
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS invalid_emails (
-                    email TEXT PRIMARY KEY,
-                    reason TEXT,
-                    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    campaign_id TEXT
-                )
-            ''')
-            self.conn.commit()
+            # Consultas usam o índice em memória compartilhado com o dispatcher
+            self.blacklist = BlacklistIndex.compartilhado(str(db_path))
         except Exception as e:
             raise Exception(f"Erro ao inicializar banco de dados: {e}")
     
@@ -58,12 +66,8 @@ class EmailScheduler:
             return
             
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(
-                'INSERT OR REPLACE INTO invalid_emails (email, reason, campaign_id) VALUES (?, ?, ?)',
-                (email, reason, campaign_id)
-            )
-            self.conn.commit()
+            # Publicado no índice na hora; o commit sai junto com o do grupo
+            self.blacklist_store.adicionar(email, reason, campaign_id)
             print(f"Email {email} adicionado à blacklist: {reason}")
         except Exception as e:
             print(f"Aviso: Não foi possível adicionar email à blacklist - {e}")
@@ -74,9 +78,7 @@ class EmailScheduler:
             return False
             
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT 1 FROM invalid_emails WHERE email = ?', (email,))
-            return cursor.fetchone() is not None
+            return self.blacklist.contem(email)
         except Exception as e:
             print(f"Aviso: Erro ao verificar email na blacklist - {e}")
             return False
@@ -87,16 +89,7 @@ class EmailScheduler:
             return df
             
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT email FROM invalid_emails')
-            invalid_emails = {row[0] for row in cursor.fetchall()}
-            
-            if not invalid_emails:
-                return df
-            
-            initial_count = len(df)
-            df = df[~df['EMAIL'].isin(invalid_emails)]
-            filtered_count = initial_count - len(df)
+            df, filtered_count = self.blacklist.filtrar(df)
             
             if filtered_count > 0:
                 print(f"Removidos {filtered_count} emails inválidos da lista")
@@ -112,60 +105,44 @@ class EmailScheduler:
         memory_percent = psutil.virtual_memory().percent
         return memory_percent < self.memory_threshold
     
-    def process_with_rate_limit(self, batch_df, template_path, horario_envio, assunto, remetente, campaign_id=None):
-        """Processa um lote com controle de taxa"""
-        batch_file = f'temp_batch_{threading.get_ident()}.csv'
-        try:
-            if not self.check_system_resources():
-                print("Sistema sobrecarregado, aguardando recursos...")
-                time.sleep(60)
-                return False
-            
-            for idx, row in batch_df.iterrows():
-                email = row['EMAIL']
-                
-                # Tenta verificar se o email é inválido, mas continua mesmo se falhar
-                try:
-                    if self.is_email_invalid(email):
-                        print(f"Pulando email inválido: {email}")
-                        continue
-                except Exception:
-                    pass
-                
-                single_email_df = pd.DataFrame([row])
-                single_email_df.to_csv(batch_file, index=False)
-                
-                result = self.dispatcher.enviar_emails(
-                    lista_emails_path=batch_file,
-                    template_path=template_path,
-                    horario_envio=horario_envio,
-                    assunto=assunto,
-                    remetente=remetente
-                )
-                
-                if not result:
-                    print(f"Falha ao enviar email para {email}")
-                    # Tenta adicionar à blacklist, mas continua mesmo se falhar
-                    try:
-                        if hasattr(self.dispatcher, 'last_error') and 'invalid' in str(self.dispatcher.last_error).lower():
-                            self.add_invalid_email(email, str(self.dispatcher.last_error), campaign_id)
-                    except Exception:
-                        pass
-                    return False
-                
-                time.sleep(self.pause_between_emails)
-            
-            time.sleep(self.pause_between_batches)
-            return True
-            
-        finally:
-            if os.path.exists(batch_file):
-                os.remove(batch_file)
+    def process_with_rate_limit(self, batch_df, contexto, campaign_id=None):
+        """Processa um lote com controle de taxa
+        
+        `contexto` vem de dispatcher.preparar_campanha(..., campanha_id=campaign_id),
+        para que as estatísticas fiquem na campanha: template, DKIM e pool
+        SMTP são carregados uma vez por campanha e o lote é enviado direto da
+        memória, sem arquivos temporários. Falhas temporárias voltam nos
+        próximos lotes; depois do último, chame finish_rate_limited.
+        """
+        if not self.check_system_resources():
+            print("Sistema sobrecarregado, aguardando recursos...")
+            time.sleep(60)
+            return False
+        
+        return self._registrar_resultados(self.dispatcher.enviar_lote(batch_df, contexto), campaign_id)
+    
+    def finish_rate_limited(self, contexto, campaign_id=None):
+        """Depois do último lote: envia as retentativas que ainda aguardam vencimento"""
+        return self._registrar_resultados(self.dispatcher.concluir_campanha(contexto), campaign_id)
+    
+    def _registrar_resultados(self, resultados, campaign_id):
+        falhas = [(email, erro) for email, _, erro in resultados if erro is not None]
+        for email, erro in falhas:
+            print(f"Falha ao enviar email para {email}")
+            # Recusas definitivas do endereço vão para a blacklist (continua mesmo se falhar)
+            try:
+                if destinatario_invalido(erro):
+                    self.add_invalid_email(email, resposta_do_erro(erro), campaign_id)
+            except Exception:
+                pass
+        
+        return not falhas
     
     def start(self):
         """Inicia o scheduler em uma thread separada"""
         if not self.running:
             self.running = True
+            self.executor.iniciar()
             self.thread = threading.Thread(target=self._run)
             self.thread.daemon = True
             self.thread.start()
@@ -173,91 +150,93 @@ class EmailScheduler:
     def stop(self):
         """Para o scheduler"""
         self.running = False
+        self.campanhas.acordar()
         if self.thread:
             self.thread.join()
+        # Campanhas em andamento terminam em segundo plano
+        self.executor.close()
     
     def _run(self):
-        """Loop principal do scheduler"""
+        """Loop principal do scheduler
+        
+        Busca só as campanhas pendentes já vencidas (consulta pelo índice
+        status/due_at), entrega ao executor — que as roda em paralelo, por
+        prioridade — e depois dorme até o próximo vencimento, acordando
+        antes se uma campanha for criada ou cancelada.
+        """
+        interrompidas = self.campanhas.recuperar_interrompidas()
+        if interrompidas:
+            print(f"{interrompidas} campanha(s) interrompida(s) serão retomadas do checkpoint")
+        
         while self.running:
-            now = datetime.now(self.timezone)
-            
-            # Verifica todos os agendamentos pendentes
-            for schedule in self.schedules:
-                if schedule['status'] != 'pendente':
-                    continue
+            try:
+                for campanha in self.campanhas.vencidas(ignorar=self.executor.ids()):
+                    if not self.running:
+                        break
+                    self.executor.submeter(campanha)
                 
-                try:
-                    schedule_time = datetime.fromisoformat(schedule['datetime'].replace(' ', 'T'))
-                    if schedule_time.tzinfo is None:
-                        schedule_time = self.timezone.localize(schedule_time)
-                    else:
-                        schedule_time = schedule_time.astimezone(self.timezone)
-                    
-                    if schedule_time <= now:
-                        self._process_schedule(schedule)
-                except Exception as e:
-                    print(f"Erro ao processar data do agendamento: {e}")
-                    schedule['status'] = 'erro'
-                    schedule['error'] = str(e)
+                proximo = self.campanhas.proximo_vencimento(ignorar=self.executor.ids())
+            except Exception as e:
+                print(f"Erro ao consultar agendamentos: {e}")
+                proximo = None
             
-            time.sleep(60)
+            espera = self.espera_maxima if proximo is None else min(proximo - time.time(), self.espera_maxima)
+            if espera > 0:
+                self.campanhas.aguardar(espera)
+    
+    def _executar_campanha(self, campanha, rate_limiter):
+        """Executada pelo CampaignExecutor quando a campanha sai da fila"""
+        # A transição é atômica: só uma thread/processo assume a campanha, e
+        # uma campanha cancelada enquanto esperava na fila é descartada
+        if self.campanhas.transicionar(campanha['id'], 'enviando'):
+            self._process_schedule(campanha, rate_limiter)
     
-    def _process_schedule(self, schedule):
+    def _process_schedule(self, schedule, rate_limiter=None):
+        """Envia uma campanha já em 'enviando' e registra o status final"""
+        result = False
+        erro = None
         try:
             print(f"\n=== Processando agendamento ===")
             print(f"Tipo: {schedule['type']}")
             print(f"Template: {schedule['template']}")
             
-            if schedule['type'] == 'test':
-                # Processa email de teste
-                print("Enviando email de teste...")
-                result = self.dispatcher.enviar_emails(
-                    lista_emails_path='teste_email.csv',
-                    template_path=os.path.join('templates', schedule['template']),
-                    horario_envio=schedule['datetime'],
-                    assunto=schedule['subject'],
-                    remetente='Blazee <contato@useblazee.com.br>'
-                )
-                return result
-            elif schedule['type'] == 'mass':
-                print(f"Processando envio em massa...")
-                print(f"Lista: {schedule['list_path']}")
-                
-                # Processa lista de emails em massa
-                try:
-                    result = self.dispatcher.enviar_emails(
-                        lista_emails_path=schedule['list_path'],
-                        template_path=os.path.join('templates', schedule['template']),
-                        horario_envio=schedule['datetime'],
-                        assunto=schedule['subject'],
-                        remetente='Blazee <contato@useblazee.com.br>'
-                    )
-                    
-                    if result:
-                        schedule['status'] = 'concluido'
-                        print("Envio em massa concluído com sucesso")
-                    else:
-                        schedule['status'] = 'erro'
-                        schedule['error'] = 'Falha ao enviar emails'
-                        print("Erro no envio em massa")
-                    
-                except Exception as e:
-                    print(f"Erro ao processar envio em massa: {str(e)}")
-                    schedule['status'] = 'erro'
-                    schedule['error'] = str(e)
-                
-                return result
+            print(f"Lista: {schedule['list_path']}")
+            print(f"Modo: {schedule.get('mode') or self.dispatcher.modo_envio}")
+            
+            result = self.dispatcher.enviar_emails(
+                lista_emails_path=schedule['list_path'],
+                template_path=os.path.join('templates', schedule['template']),
+                horario_envio=schedule['datetime'],
+                assunto=schedule['subject'],
+                remetente='Blazee <contato@useblazee.com.br>',
+                modo=schedule.get('mode'),
+                campanha_id=schedule['id'],
+                rate_limiter=rate_limiter,
+                concorrencia=self.concorrencia_por_tipo.get(schedule['type']),
+                # 5xx no RCPT: o endereço vai direto para a blacklist
+                ao_invalidar=lambda email, motivo: self.add_invalid_email(email, motivo, schedule['id'])
+            )
+            
+            if result:
+                print("Envio concluído com sucesso")
+            else:
+                erro = 'Falha ao enviar emails'
+                print("Erro no envio")
                 
         except Exception as e:
             print(f"Erro ao processar agendamento: {str(e)}")
-            schedule['status'] = 'erro'
-            schedule['error'] = str(e)
-            return False
-    
-    def __del__(self):
-        """Tenta fechar a conexão com o banco de dados ao destruir o objeto"""
-        if self.db_enabled and self.conn:
+            result = False
+            erro = str(e)
+        
+        try:
+            self.campanhas.transicionar(schedule['id'], 'concluido' if result else 'erro', error=erro)
+        except Exception as e:
+            print(f"Erro ao atualizar status do agendamento {schedule['id']}: {e}")
+        
+        if schedule['type'] == 'test':
+            # A lista do teste é um CSV temporário criado pelo servidor
             try:
-                self.conn.close()
-            except Exception:
-                pass 
\ No newline at end of file
+                os.remove(schedule['list_path'])
+            except OSError:
+                pass
+        return result
@@ -1,22 +1,69 @@
 import pandas as pd
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import pytz
-import time
 import csv
 import logging
-import re
 from pathlib import Path
-from tenacity import retry, stop_after_attempt, wait_exponential
 import socket
-import dkim
-import uuid
-from email.utils import formatdate, make_msgid
+from email.utils import formatdate, make_msgid, parseaddr
+from email import policy
 import os
-import json
-import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import chain
+from smtp_pool import SMTPConnectionPool, resposta_do_erro
+from async_sender import AsyncDispatchEngine
+from sharded_sender import ShardedDispatchEngine
+from pipeline_sender import PipelineDispatchEngine
+from rate_limiter import DomainRateLimiter, dominio_do_email
+from template_engine import compilar_template, html_para_texto
+from dkim_signer import DKIMSigner
+from blacklist import BlacklistIndex
+from recipients import (
+    MOTIVOS_REJEICAO, PADRAO_EMAIL, RegistroVistos, extrair_primeiro_nome, preparar_destinatarios
+)
+from list_reader import COLUNAS_PADRAO
+from list_cache import abrir_lista
+from checkpoint import ENVIADO, FALHA, CheckpointLog
+from mime_factory import MessageFactory
+from stats import StatsRecorder, novas_estatisticas, registrar_erro
+from retry_queue import RetryQueue
+
+# Modos de envio suportados pelo EmailDispatcher
+MODOS_ENVIO = ('sequencial', 'async', 'processos', 'pipeline')
+
+# Serialização usada no envio e na assinatura DKIM (CRLF, como no DATA)
+POLITICA_SMTP = policy.compat32.clone(linesep='\r\n')
+
+class CampaignContext:
+    """Recursos de uma campanha carregados uma única vez e reutilizados a cada lote
+
+    Criado por EmailDispatcher.preparar_campanha: template e assunto
+    compilados, fábrica de mensagens (MessageFactory), assinador DKIM, pool SMTP, índice da blacklist e limitador
+    de taxa. `vistos` deduplica os destinatários entre lotes, `stats`
+    acumula as estatísticas da campanha inteira e `retentativas` guarda as
+    novas tentativas entre um lote e outro (ver concluir_campanha).
+    """
+
+    def __init__(self, template, assunto, remetente, fabrica, dkim_signer, smtp_pool, blacklist, rate_limiter, stats,
+                 retentativas, campanha_id=None):
+        self.template = template
+        self.assunto = assunto
+        self.remetente = remetente
+        self.fabrica = fabrica
+        self.envelope = parseaddr(remetente)[1]
+        self.dkim_signer = dkim_signer
+        self.smtp_pool = smtp_pool
+        self.blacklist = blacklist
+        self.rate_limiter = rate_limiter
+        self.stats = stats
+        self.retentativas = retentativas
+        self.campanha_id = campanha_id
+        self.vistos = RegistroVistos()
+
 
 class EmailDispatcher:
     def __init__(self):
@@ -24,9 +71,31 @@ class EmailDispatcher:
         self.timezone = pytz.timezone('America/Sao_Paulo')
         
         # Configurações anti-spam
-        self.rate_limit = 8  # 8 emails por segundo
-        self.batch_size = 250  # Lotes de 250 emails
-        self.batch_interval = 1  # 1 segundo entre lotes
+        self.rate_limit = 8  # teto global de 8 emails por segundo
+        self.batch_size = 250  # Registra o progresso a cada 250 emails
+        self.chunk_size = 50_000  # Linhas por bloco na leitura da lista
+        
+        # Limitador único: teto global adaptativo + limites por domínio de destino
+        self.rate_limiter = DomainRateLimiter(global_rate=self.rate_limit)
+        
+        # Modo de envio padrão e configuração do motor assíncrono
+        self.modo_envio = 'sequencial'
+        self.async_config = {
+            'concurrency': 8  # transações SMTP simultâneas
+        }
+        # Modo 'processos': campanha dividida em shards, um por processo
+        self.processos_config = {
+            'processos': os.cpu_count() or 1,
+            'tamanho_lote': 100
+        }
+        # Modo 'pipeline': transações encadeadas com PIPELINING em cada conexão
+        self.pipeline_config = {
+            'conexoes': 4,
+            'transacoes_por_lote': 20,
+            # Vários RCPT por envelope (só templates sem placeholders) tira o
+            # List-Unsubscribe de um clique (RFC 8058): 1 mantém um por destinatário
+            'destinatarios_por_envelope': 1
+        }
         
         # Configuração do servidor SMTP
         self.smtp_config = {
@@ -35,6 +104,33 @@ class EmailDispatcher:
             'timeout': 30
         }
         
+        # Pool de conexões SMTP persistentes (RSET entre mensagens)
+        self.smtp_pool_config = {
+            'size': 4,
+            'max_messages_per_connection': 100,
+            'idle_timeout': 30
+        }
+        self.smtp_pool = None
+        
+        # Novas tentativas: 4xx esperam espera_inicial (dobrando até espera_maxima),
+        # quedas de conexão espera_conexao; 5xx não são repetidos (ver RetryQueue)
+        self.retry_config = {
+            'tentativas': 3,
+            'espera_inicial': 30,
+            'espera_maxima': 300,
+            'espera_conexao': 2
+        }
+        
+        # Mensagens montadas sobre um esqueleto MIME pré-codificado por campanha
+        self.mime_config = {
+            '8bitmime': True,  # corpo em 8bit quando o servidor anuncia 8BITMIME
+            'fabricas': 8  # fábricas (template/assunto/remetente) mantidas em cache
+        }
+        self._fabricas = OrderedDict()
+        
+        # Protege pool e assinador DKIM quando o dispatcher é compartilhado entre threads
+        self._lock = threading.RLock()
+        
         self.domain = 'useblazee.com.br'
         self.hostname = self.domain
         
@@ -42,9 +138,16 @@ class EmailDispatcher:
         self.dkim_config = {
             'domain': self.domain,
             'selector': 'default',
-            'private_key_path': '/etc/dkim/private.key'
+            'private_key_path': '/etc/dkim/private.key',
+            'processes': 0  # > 0 assina em um pool de processos
         }
         
+        # Índice em memória da blacklist (compartilhado no processo)
+        self.blacklist = BlacklistIndex.compartilhado()
+        
+        # Estatísticas ao vivo, snapshot JSON e histórico por campanha
+        self.estatisticas = StatsRecorder.compartilhado()
+        
         # Email padrão para unsubscribe
         self.unsubscribe_email = 'unsubscribe@useblazee.com.br'
         
@@ -60,14 +163,9 @@ class EmailDispatcher:
             'erros': []
         }
         
-        # Carrega a chave privada DKIM
-        try:
-            with open(self.dkim_config['private_key_path'], 'rb') as f:
-                self.dkim_key = f.read()
-            self.logger.info("Chave DKIM carregada com sucesso")
-        except FileNotFoundError:
-            self.logger.warning("Chave DKIM não encontrada. Emails serão enviados sem assinatura DKIM.")
-            self.dkim_key = None
+        # Carrega e decodifica a chave privada DKIM uma única vez
+        self.dkim_signer = None
+        self.carregar_dkim()
 
     def setup_logging(self):
         logging.basicConfig(
@@ -85,9 +183,8 @@ class EmailDispatcher:
         if not email:
             return False
         
-        # Validação básica de formato
-        pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-        return re.match(pattern, email) is not None
+        # Validação básica de formato (regex compilado uma vez)
+        return PADRAO_EMAIL.match(email) is not None
 
     def validar_arquivos(self, lista_emails_path, template_path):
         for arquivo in [lista_emails_path, template_path]:
@@ -113,7 +210,7 @@ class EmailDispatcher:
 
     def extrair_primeiro_nome(self, nome_completo):
         """Extrai o primeiro nome de um nome completo."""
-        return nome_completo.split()[0]
+        return extrair_primeiro_nome(nome_completo)
 
     def adicionar_headers_anti_spam(self, msg, destinatario):
         """Adiciona headers anti-spam ao email"""
@@ -134,71 +231,125 @@ class EmailDispatcher:
         
         return msg
 
-    def preparar_email(self, destinatario, nome, assunto, template, remetente):
+    def montar_email(self, destinatario, nome, assunto, template, remetente, campos=None, primeiro_nome=None):
+        """Monta a mensagem sem assinatura; template e assunto podem ser texto ou CompiledTemplate"""
         if not self.validar_email(destinatario):
             raise ValueError(f"Email inválido: {destinatario}")
 
+        # Templates em texto são compilados uma única vez (cache por conteúdo)
+        if isinstance(template, str):
+            template = compilar_template(template)
+        if isinstance(assunto, str):
+            assunto = compilar_template(assunto)
+        
+        if primeiro_nome is None:
+            primeiro_nome = self.extrair_primeiro_nome(nome)
+        unsubscribe_url = f'https://email.blazee.com.br/unsubscribe?email={destinatario}'
+        valores = {
+            'nome': nome,
+            'primeiro_nome': primeiro_nome,
+            'unsubscribe': unsubscribe_url,
+            'EMAIL': destinatario,
+            'NOME': nome
+        }
+
         msg = MIMEMultipart('alternative')
         
         # Headers básicos
         msg['From'] = remetente
         msg['To'] = destinatario
-        msg['Subject'] = assunto.replace('{primeiro_nome}', self.extrair_primeiro_nome(nome))
+        msg['Subject'] = assunto.render(valores, campos)
         
         # Adiciona headers anti-spam
         msg = self.adicionar_headers_anti_spam(msg, destinatario)
         
         # Headers de conformidade para unsubscribe
-        unsubscribe_id = str(uuid.uuid4())
-        unsubscribe_url = f'https://email.blazee.com.br/unsubscribe?email={destinatario}'
         msg['List-Unsubscribe'] = f'<{unsubscribe_url}>, <mailto:unsubscribe@{self.hostname}?subject=unsubscribe>'
         msg['List-Unsubscribe-Post'] = 'List-Unsubscribe=One-Click'
         
-        # Prepara o corpo do email
-        primeiro_nome = self.extrair_primeiro_nome(nome)
-        corpo_email = template.replace('{nome}', nome)\
-                             .replace('{primeiro_nome}', primeiro_nome)\
-                             .replace('{{ unsubscribe }}', unsubscribe_url)
+        # Prepara o corpo do email em uma única passada
+        corpo_email = template.render(valores, campos)
         
-        # Adiciona versão texto e HTML
-        msg.attach(MIMEText(self.strip_tags(corpo_email), 'plain'))
+        # Adiciona versão texto (pré-convertida por template) e HTML
+        msg.attach(MIMEText(template.texto_alternativo.render(valores, campos), 'plain'))
         msg.attach(MIMEText(corpo_email, 'html'))
 
-        # Assina com DKIM se disponível
-        if self.dkim_key:
-            headers = [
-                'From', 'To', 'Subject', 'Date', 'Message-ID',
-                'X-Mailer', 'List-Unsubscribe', 'List-Unsubscribe-Post'
-            ]
+        return msg
+
+    def serializar_email(self, msg):
+        """Serializa a mensagem nos bytes enviados no DATA"""
+        return msg.as_bytes(policy=POLITICA_SMTP)
+
+    def assinar_dkim(self, dados, destinatario):
+        """Retorna o cabeçalho DKIM-Signature para os bytes da mensagem (ou None)"""
+        if not self.dkim_signer:
+            return None
+        try:
+            assinatura = self.dkim_signer.sign(dados)
+            self.logger.debug(f"Email assinado com DKIM para {destinatario}")
+            return assinatura
+        except Exception as e:
+            self.logger.error(f"Erro ao assinar email com DKIM: {str(e)}")
+            return None
+
+    def preparar_email(self, destinatario, nome, assunto, template, remetente, campos=None, primeiro_nome=None):
+        """Monta a mensagem e adiciona o cabeçalho DKIM-Signature"""
+        msg = self.montar_email(destinatario, nome, assunto, template, remetente, campos, primeiro_nome)
+        if self.dkim_signer:
+            assinatura = self.assinar_dkim(self.serializar_email(msg), destinatario)
+            if assinatura:
+                msg['DKIM-Signature'] = assinatura[len('DKIM-Signature: '):].decode()
+        return msg
+
+    def preparar_email_bytes(self, destinatario, nome, assunto, template, remetente, campos=None, primeiro_nome=None):
+        """Bytes finais da mensagem (esqueleto MIME da campanha), assinando os próprios bytes enviados"""
+        fabrica = self.fabrica_mensagens(template, assunto, remetente)
+        return self.montar_bytes(fabrica, self.dkim_signer, destinatario, nome, primeiro_nome, campos)
+
+    def fabrica_mensagens(self, template, assunto, remetente):
+        """MessageFactory da campanha, criada uma vez por template/assunto/remetente"""
+        if isinstance(template, str):
+            template = compilar_template(template)
+        if isinstance(assunto, str):
+            assunto = compilar_template(assunto)
+        chave = (template, assunto, remetente)
+        with self._lock:
+            fabrica = self._fabricas.get(chave)
+            if fabrica is not None:
+                return fabrica
+        # 8bit só quando o servidor anuncia 8BITMIME (consulta feita uma vez pelo pool)
+        oito_bits = self.mime_config['8bitmime'] and self.obter_pool_smtp().suporta_8bitmime()
+        fabrica = MessageFactory(template, assunto, remetente, self.hostname, oito_bits=oito_bits)
+        with self._lock:
+            fabrica = self._fabricas.setdefault(chave, fabrica)
+            while len(self._fabricas) > self.mime_config['fabricas']:
+                self._fabricas.popitem(last=False)
+        return fabrica
+
+    def montar_bytes(self, fabrica, dkim_signer, destinatario, nome, primeiro_nome=None, campos=None):
+        """Monta a mensagem pela fábrica e acrescenta o cabeçalho DKIM-Signature"""
+        if not self.validar_email(destinatario):
+            raise ValueError(f"Email inválido: {destinatario}")
+        if primeiro_nome is None:
+            primeiro_nome = self.extrair_primeiro_nome(nome)
+        return self.assinar_bytes(dkim_signer, fabrica.montar(destinatario, nome, primeiro_nome, campos))
+
+    def montar_bytes_coletiva(self, fabrica):
+        """Mensagem única (assinada) de um template sem placeholders, para envelopes com vários RCPT"""
+        return self.assinar_bytes(self.dkim_signer, fabrica.montar_coletiva())
+
+    def assinar_bytes(self, dkim_signer, dados):
+        """Acrescenta o cabeçalho DKIM-Signature aos bytes da mensagem (sem assinador, devolve como estão)"""
+        if dkim_signer:
             try:
-                sig = dkim.sign(
-                    message=msg.as_bytes(),
-                    selector=self.dkim_config['selector'].encode(),
-                    domain=self.dkim_config['domain'].encode(),
-                    privkey=self.dkim_key,
-                    include_headers=headers
-                )
-                msg['DKIM-Signature'] = sig[len('DKIM-Signature: '):].decode()
-                self.logger.debug(f"Email assinado com DKIM para {destinatario}")
+                dados = dkim_signer.sign(dados) + dados
             except Exception as e:
                 self.logger.error(f"Erro ao assinar email com DKIM: {str(e)}")
-
-        return msg
+        return dados
 
     def strip_tags(self, html):
         """Remove tags HTML para criar versão texto do email"""
-        clean = re.compile('<.*?>')
-        return re.sub(clean, '', html)
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def enviar_email_com_retry(self, server, msg, destinatario):
-        try:
-            server.send_message(msg)
-            self.logger.info(f"Email enviado com sucesso para {destinatario}")
-            time.sleep(1 / self.rate_limit)
-        except Exception as e:
-            self.logger.error(f"Erro ao enviar para {destinatario}: {str(e)}")
-            raise
+        return html_para_texto(html)
 
     def atualizar_estatisticas(self, tipo, erro=None):
         """Atualiza as estatísticas de envio"""
@@ -215,25 +366,35 @@ class EmailDispatcher:
         self.salvar_estatisticas()
 
     def salvar_estatisticas(self, stats):
-        """Salva as estatísticas de envio em um arquivo JSON"""
-        try:
-            with open('email_stats.json', 'w') as f:
-                json.dump(stats, f)
-        except Exception as e:
-            self.logger.error(f"Erro ao salvar estatísticas: {str(e)}")
+        """Publica as estatísticas ao vivo (o snapshot em disco é periódico, ver StatsRecorder)"""
+        self.estatisticas.publicar(stats)
 
     def dividir_em_lotes(self, df, tamanho_lote):
         """Divide um DataFrame em lotes de tamanho especificado"""
         for i in range(0, len(df), tamanho_lote):
             yield df.iloc[i:i+tamanho_lote]
 
-    def enviar_emails(self, lista_emails_path, template_path, horario_envio, assunto, remetente):
-        """Envia emails para uma lista de destinatários"""
+    def enviar_emails(self, lista_emails_path, template_path, horario_envio, assunto, remetente, modo=None,
+                      campanha_id=None, rate_limiter=None, concorrencia=None, ao_invalidar=None):
+        """Envia emails para uma lista de destinatários (modo 'sequencial', 'async', 'processos' ou 'pipeline')
+        
+        Com `campanha_id`, cada envio é registrado no log de checkpoint da
+        campanha e uma campanha interrompida é retomada pulando as linhas já
+        enviadas; o log é apagado quando a campanha termina. `rate_limiter` substitui o limitador do dispatcher (ex.: a
+        parcela da campanha quando várias rodam juntas) e `concorrencia`
+        limita as transações SMTP (ou processos) simultâneas da campanha.
+        
+        Falhas temporárias voltam para a fila de novas tentativas da campanha
+        (RetryQueue) e os destinatários recusados em definitivo são
+        repassados a `ao_invalidar(email, motivo)`.
+        """
+        checkpoint = None
+        stats = None
+        lista = None
         try:
-            # Carrega a lista de emails
-            df = self.carregar_lista_emails(lista_emails_path)
-            if df is None or len(df) == 0:
-                self.logger.error("Lista de emails vazia ou inválida")
+            # Abre a lista para leitura em blocos (aqui só o cabeçalho é lido)
+            lista = self.abrir_lista_emails(lista_emails_path)
+            if lista is None:
                 return False
             
             # Carrega o template
@@ -242,6 +403,10 @@ class EmailDispatcher:
                 self.logger.error(f"Falha ao carregar template: {template_path}")
                 return False
             
+            # Compila template e assunto uma vez para toda a campanha
+            template = compilar_template(template)
+            assunto = compilar_template(assunto)
+            
             # Verifica se o horário de envio já passou
             horario = datetime.strptime(horario_envio, '%Y-%m-%d %H:%M:%S')
             horario = self.timezone.localize(horario)
@@ -251,173 +416,435 @@ class EmailDispatcher:
                 self.logger.info(f"Agendamento para {horario_envio}, aguardando...")
                 return True
             
+            # Lê só EMAIL/NOME e as colunas que o template ou o assunto usam
+            colunas = set(COLUNAS_PADRAO) | {nome.upper() for nome in template.placeholders | assunto.placeholders}
+            blocos = lista.blocos(colunas)
+            primeiro_bloco = next(blocos, None)
+            if primeiro_bloco is None:
+                self.logger.error("Lista de emails vazia ou inválida")
+                return False
+            
             # Inicializa estatísticas
-            stats = {
-                'total': len(df),
-                'enviados': 0,
-                'falhas': 0,
-                'invalidos': 0,
-                'blacklist': 0,
-                'status': 'enviando',
-                'inicio': datetime.now().isoformat(),
-                'fim': None,
-                'erros': []
-            }
+            # (total e rejeições são acumulados à medida que os blocos são lidos)
+            stats = novas_estatisticas(campanha_id)
             self.salvar_estatisticas(stats)
             
             # Carrega a chave DKIM
             self.carregar_dkim()
             
-            # Conecta ao servidor SMTP
-            with smtplib.SMTP(self.smtp_config['host'], self.smtp_config['port'], timeout=self.smtp_config['timeout']) as servidor:
-                # Processa em lotes para evitar sobrecarga
-                for i, chunk in enumerate(self.dividir_em_lotes(df, self.batch_size)):
-                    if i > 0:
-                        self.logger.info(f"Aguardando {self.batch_interval}s antes do próximo lote...")
-                        time.sleep(self.batch_interval)
-                    
-                    self.logger.info(f"Processando lote {i+1}/{(len(df) // self.batch_size) + 1} ({len(chunk)} emails)")
-                    
-                    for idx, row in chunk.iterrows():
-                        try:
-                            email = row['EMAIL'].strip()
-                            nome = row.get('NOME', '').strip()
-                            
-                            # Verifica se o email é válido
-                            if not self.validar_email(email):
-                                self.logger.warning(f"Email inválido: {email}")
-                                stats['invalidos'] += 1
-                                continue
-                            
-                            # Verifica se o email está na blacklist
-                            conn = sqlite3.connect('email_blacklist.db')
-                            cursor = conn.cursor()
-                            cursor.execute("SELECT email FROM invalid_emails WHERE email = ?", (email,))
-                            if cursor.fetchone():
-                                conn.close()
-                                self.logger.info(f"Email na blacklist: {email}")
-                                stats['blacklist'] += 1
-                                continue
-                            conn.close()
-                            
-                            # Envia o email
-                            self.enviar_email(email, nome, assunto, template, remetente)
-                            stats['enviados'] += 1
-                            
-                            # Controle de taxa para evitar bloqueios anti-spam
-                            time.sleep(1 / self.rate_limit)
-                            
-                        except Exception as e:
-                            self.logger.error(f"Erro ao enviar para {email}: {str(e)}")
-                            stats['falhas'] += 1
-                            stats['erros'].append(f"{email}: {str(e)}")
-                        
-                        # Atualiza estatísticas a cada 10 emails
-                        if (stats['enviados'] + stats['falhas'] + stats['invalidos'] + stats['blacklist']) % 10 == 0:
-                            self.salvar_estatisticas(stats)
+            # Log de checkpoint da campanha (retoma de onde parou se já existir)
+            concluidos = None
+            if campanha_id is not None:
+                checkpoint = CheckpointLog.da_campanha(campanha_id, lista_emails_path)
+                concluidos = checkpoint.concluidos
+                if checkpoint.registros_anteriores:
+                    self.logger.info(
+                        f"Retomando campanha {campanha_id}: {len(concluidos)} destinatários já enviados "
+                        f"({checkpoint.registros_anteriores} registros no checkpoint)"
+                    )
+            
+            # Validação, blacklist e envio consomem a lista bloco a bloco
+            destinatarios = self.fluxo_destinatarios(chain([primeiro_bloco], blocos), stats, concluidos)
+            
+            # Envia pelo modo selecionado (sequencial, assíncrono ou em processos)
+            modo = modo or self.modo_envio
+            limitador = rate_limiter or self.rate_limiter
+            retentativas = RetryQueue(ao_invalidar=ao_invalidar, **self.retry_config)
+            if modo == 'async':
+                engine = AsyncDispatchEngine(
+                    self,
+                    concurrency=min(self.async_config['concurrency'], concorrencia or self.async_config['concurrency']),
+                    rate_limiter=limitador
+                )
+                engine.run(destinatarios, template, assunto, remetente, stats, checkpoint, retentativas)
+            elif modo == 'processos':
+                engine = ShardedDispatchEngine(
+                    self,
+                    processos=min(self.processos_config['processos'], concorrencia or self.processos_config['processos']),
+                    tamanho_lote=self.processos_config['tamanho_lote'],
+                    rate_limiter=limitador
+                )
+                engine.run(destinatarios, template, assunto, remetente, stats, checkpoint, retentativas)
+            elif modo == 'pipeline':
+                engine = PipelineDispatchEngine(
+                    self,
+                    conexoes=min(self.pipeline_config['conexoes'], concorrencia or self.pipeline_config['conexoes']),
+                    transacoes_por_lote=self.pipeline_config['transacoes_por_lote'],
+                    destinatarios_por_envelope=self.pipeline_config['destinatarios_por_envelope'],
+                    rate_limiter=limitador
+                )
+                engine.run(destinatarios, template, assunto, remetente, stats, checkpoint, retentativas)
+            elif modo == 'sequencial':
+                self.enviar_sequencial(destinatarios, template, assunto, remetente, stats, checkpoint, limitador,
+                                       retentativas)
+            else:
+                raise ValueError(f"Modo de envio desconhecido: {modo}")
             
             # Finaliza estatísticas
             stats['status'] = 'concluido'
             stats['fim'] = datetime.now().isoformat()
-            self.salvar_estatisticas(stats)
+            self.estatisticas.finalizar(stats, campanha_id)
+            # Campanha concluída: um id reaproveitado não retoma deste log
+            if checkpoint is not None:
+                checkpoint.remover()
             
-            self.logger.info(f"Envio concluído: {stats['enviados']} enviados, {stats['falhas']} falhas, {stats['invalidos']} inválidos, {stats['blacklist']} na blacklist")
+            self.logger.info(f"Envio concluído: {stats['enviados']} enviados, {stats['falhas']} falhas, {stats['invalidos']} inválidos, {stats['blacklist']} na blacklist, {stats['retomados']} já enviados antes, {stats['retentativas']} novas tentativas")
             return True
             
         except Exception as e:
             self.logger.error(f"Erro no processo de envio: {str(e)}")
             
             # Atualiza estatísticas com erro
-            try:
-                with open('email_stats.json', 'r') as f:
-                    stats = json.load(f)
-                
+            if stats is not None:
                 stats['status'] = 'erro'
                 stats['fim'] = datetime.now().isoformat()
-                stats['erros'].append(str(e))
-                
-                with open('email_stats.json', 'w') as f:
-                    json.dump(stats, f)
-            except:
-                pass
+                registrar_erro(stats, str(e), e)
+                self.estatisticas.finalizar(stats, campanha_id)
                 
             return False
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            if lista is not None:
+                # Libera os arquivos e mapeamentos do cache colunar
+                lista.close()
+
+    def registrar_progresso(self, stats):
+        """Publica o progresso (o snapshot em disco é limitado por tempo, não por email)"""
+        self.salvar_estatisticas(stats)
+
+    def registrar_envio(self, linha, resposta, stats, checkpoint=None):
+        """Contabiliza um envio aceito pelo servidor"""
+        stats['enviados'] += 1
+        if checkpoint is not None:
+            checkpoint.registrar(linha, ENVIADO, resposta)
+
+    def registrar_falha(self, email, erro, stats, checkpoint=None, linha=None):
+        """Contabiliza uma falha de envio"""
+        self.logger.error(f"Erro ao enviar para {email}: {str(erro)}")
+        stats['falhas'] += 1
+        registrar_erro(stats, f"{email}: {str(erro)}", erro)
+        if checkpoint is not None:
+            checkpoint.registrar(linha, FALHA, resposta_do_erro(erro))
+
+    def tratar_falha(self, destinatario, erro, stats, checkpoint=None, retentativas=None):
+        """Adia o destinatário se a falha for transitória; senão contabiliza a falha
+
+        Retorna True quando a falha é definitiva.
+        """
+        email, linha = destinatario[0], destinatario[-1]
+        if retentativas is not None:
+            espera = retentativas.adiar(destinatario, erro)
+            if espera is not None:
+                stats['retentativas'] += 1
+                self.logger.warning(f"Envio para {email} adiado ({resposta_do_erro(erro)}), nova tentativa em {espera:.0f}s")
+                return False
+        self.registrar_falha(email, erro, stats, checkpoint, linha)
+        if retentativas is not None:
+            retentativas.descartar(destinatario, erro)
+        return True
+
+    def fluxo_destinatarios(self, blocos, stats, concluidos=None):
+        """Prepara cada bloco da lista à medida que é lido e gera os destinatários aptos
+        
+        `concluidos` (Bitmap do checkpoint) traz as linhas já enviadas em uma
+        execução anterior da campanha, que são puladas.
+        """
+        vistos = RegistroVistos()
+        rejeicoes = dict.fromkeys(MOTIVOS_REJEICAO, 0)
+        aptos = 0
+        inicio = 0
+        for bloco in blocos:
+            destinatarios = preparar_destinatarios(bloco, self.blacklist, vistos, inicio=inicio)
+            inicio += len(bloco)
+            for motivo, quantidade in destinatarios.rejeicoes.items():
+                rejeicoes[motivo] += quantidade
+            aptos += len(destinatarios)
+            if concluidos is not None:
+                enviados = concluidos.contem(destinatarios.linhas)
+                if enviados.any():
+                    stats['retomados'] += int(enviados.sum())
+                    destinatarios = destinatarios.sem(enviados)
+            stats['total'] += destinatarios.total
+            stats['invalidos'] += destinatarios.rejeicoes['vazio'] + destinatarios.rejeicoes['invalido']
+            stats['duplicados'] += destinatarios.rejeicoes['duplicado']
+            stats['blacklist'] += destinatarios.rejeicoes['blacklist']
+            self.salvar_estatisticas(stats)
+            yield from destinatarios
+        
+        self.logger.info(
+            f"{aptos} destinatários aptos de {stats['total']} "
+            f"(vazios: {rejeicoes['vazio']}, inválidos: {rejeicoes['invalido']}, "
+            f"duplicados: {rejeicoes['duplicado']}, blacklist: {rejeicoes['blacklist']})"
+        )
+
+    def destinatarios_validos(self, destinatarios, stats):
+        """Gera os destinatários já preparados, pulando descadastros ocorridos durante a campanha"""
+        for destinatario in destinatarios:
+            email = destinatario[0]
+            if self.blacklist.contem(email):
+                self.logger.info(f"Email na blacklist: {email}")
+                stats['blacklist'] += 1
+                self.registrar_progresso(stats)
+                continue
+            yield destinatario
 
-    def enviar_email(self, email, nome, assunto, template, remetente):
-        """Envia um único email"""
+    def enviar_sequencial(self, destinatarios, template, assunto, remetente, stats, checkpoint=None, rate_limiter=None,
+                          retentativas=None):
+        """Envia os emails um a um, no ritmo liberado pelo limitador de taxa
+        
+        As novas tentativas vencidas entram no meio da lista; as que sobram
+        no fim são enviadas em rodadas, à medida que vencem.
+        """
+        limitador = rate_limiter or self.rate_limiter
+        fonte = destinatarios if retentativas is None else retentativas.intercalar(destinatarios)
+        n = 0
+        # Usa as sessões persistentes do pool SMTP
+        with self.sessao_campanha():
+            while fonte is not None:
+                liberados = limitador.liberar(
+                    self.destinatarios_validos(fonte, stats),
+                    dominio=lambda destinatario: dominio_do_email(destinatario[0])
+                )
+                for destinatario in liberados:
+                    email, nome, primeiro_nome, campos, linha = destinatario
+                    dominio = dominio_do_email(email)
+                    try:
+                        resposta = self.enviar_email(email, nome, assunto, template, remetente, campos, primeiro_nome)
+                        self.registrar_envio(linha, resposta, stats, checkpoint)
+                        limitador.registrar_sucesso(dominio)
+                    except Exception as e:
+                        # Adiamentos 4xx reduzem a taxa global e a do domínio
+                        limitador.registrar_resultado(dominio, e)
+                        self.tratar_falha(destinatario, e, stats, checkpoint, retentativas)
+                    
+                    self.registrar_progresso(stats)
+                    
+                    n += 1
+                    if n % self.batch_size == 0:
+                        self.logger.info(f"{n} emails enviados (taxa global {limitador.taxa_global():.1f}/s)")
+                fonte = retentativas.rodada() if retentativas is not None else None
+
+    def preparar_campanha(self, template_path, assunto, remetente, rate_limiter=None, campanha_id=None):
+        """Carrega template, DKIM e pool SMTP uma vez para envios em lote (ver enviar_lote)
+
+        As estatísticas da campanha são publicadas desde já e encerradas
+        por concluir_campanha.
+        """
+        template = self.carregar_template(template_path)
+        if not template:
+            raise FileNotFoundError(f"Falha ao carregar template: {template_path}")
+        self.carregar_dkim()
+        template = compilar_template(template)
+        assunto = compilar_template(assunto)
+        stats = novas_estatisticas(campanha_id)
+        self.salvar_estatisticas(stats)
+        return CampaignContext(
+            template,
+            assunto,
+            remetente,
+            self.fabrica_mensagens(template, assunto, remetente),
+            self.dkim_signer,
+            self.obter_pool_smtp(),
+            self.blacklist,
+            rate_limiter or self.rate_limiter,
+            stats,
+            RetryQueue(**self.retry_config),
+            campanha_id
+        )
+
+    def enviar_lote(self, registros, contexto):
+        """Envia um lote de destinatários em memória usando uma campanha já preparada
+
+        `registros` é um DataFrame ou um iterável de dicts com EMAIL, NOME e
+        as colunas extras usadas no template. Nada é lido do disco: a
+        validação, a deduplicação (também entre lotes) e a blacklist são
+        vetorizadas, e o envio reaproveita o pool e o assinador do
+        contexto. Falhas temporárias ficam na fila de retentativas do
+        contexto: as já vencidas são intercaladas neste lote e as demais
+        esperam os próximos lotes ou concluir_campanha, sem bloquear.
+        Retorna [(email, resposta, erro)] com o resultado final de cada
+        envio concluído no lote.
+        """
+        df = registros if isinstance(registros, pd.DataFrame) else pd.DataFrame.from_records(list(registros))
+        if df.empty:
+            return self._enviar_do_contexto(contexto.retentativas.vencidos(), contexto)
+        df = df.rename(columns=lambda coluna: str(coluna).strip().upper())
+        
+        stats = contexto.stats
+        destinatarios = preparar_destinatarios(df, contexto.blacklist, contexto.vistos)
+        stats['total'] += destinatarios.total
+        stats['invalidos'] += destinatarios.rejeicoes['vazio'] + destinatarios.rejeicoes['invalido']
+        stats['duplicados'] += destinatarios.rejeicoes['duplicado']
+        stats['blacklist'] += destinatarios.rejeicoes['blacklist']
+        
+        return self._enviar_do_contexto(contexto.retentativas.intercalar(destinatarios), contexto)
+
+    def concluir_campanha(self, contexto):
+        """Fim da campanha em lotes: envia as retentativas pendentes, esperando cada vencimento
+
+        Encerra as estatísticas (status, fim e a linha no histórico) como
+        enviar_emails. Retorna [(email, resposta, erro)] como enviar_lote.
+        """
+        stats = contexto.stats
+        resultados = []
         try:
-            # Prepara o email
-            msg = self.preparar_email(
-                destinatario=email,
-                nome=nome,
-                assunto=assunto,
-                template=template,
-                remetente=remetente
-            )
+            fonte = contexto.retentativas.rodada()
+            while fonte is not None:
+                resultados.extend(self._enviar_do_contexto(fonte, contexto))
+                fonte = contexto.retentativas.rodada()
+        except Exception as e:
+            self.logger.error(f"Erro ao concluir a campanha: {str(e)}")
+            stats['status'] = 'erro'
+            stats['fim'] = datetime.now().isoformat()
+            registrar_erro(stats, str(e), e)
+            self.estatisticas.finalizar(stats, contexto.campanha_id)
+            raise
+        
+        stats['status'] = 'concluido'
+        stats['fim'] = datetime.now().isoformat()
+        self.estatisticas.finalizar(stats, contexto.campanha_id)
+        self.logger.info(f"Envio em lotes concluído: {stats['enviados']} enviados, {stats['falhas']} falhas, {stats['retentativas']} novas tentativas")
+        return resultados
+
+    def _enviar_do_contexto(self, fonte, contexto):
+        stats = contexto.stats
+        limitador = contexto.rate_limiter
+        resultados = []
+        liberados = limitador.liberar(
+            self.destinatarios_validos(fonte, stats),
+            dominio=lambda destinatario: dominio_do_email(destinatario[0])
+        )
+        for destinatario in liberados:
+            email, nome, primeiro_nome, campos, linha = destinatario
+            dominio = dominio_do_email(email)
+            try:
+                dados = self.montar_bytes(contexto.fabrica, contexto.dkim_signer, email, nome, primeiro_nome, campos)
+                resposta = contexto.smtp_pool.enviar_bytes(
+                    contexto.envelope, [email], dados, contexto.fabrica.mail_options
+                )
+                self.logger.info(f"Email enviado com sucesso para {email}")
+                self.registrar_envio(linha, resposta, stats)
+                limitador.registrar_sucesso(dominio)
+                resultados.append((email, resposta, None))
+            except Exception as e:
+                limitador.registrar_resultado(dominio, e)
+                if self.tratar_falha(destinatario, e, stats, retentativas=contexto.retentativas):
+                    resultados.append((email, None, e))
+            self.registrar_progresso(stats)
+        return resultados
+
+    def enviar_email(self, email, nome, assunto, template, remetente, campos=None, primeiro_nome=None):
+        """Envia um único email; retorna a resposta do servidor ao DATA"""
+        try:
+            # Bytes finais montados sobre o esqueleto MIME da campanha e assinados uma única vez
+            fabrica = self.fabrica_mensagens(template, assunto, remetente)
+            dados = self.montar_bytes(fabrica, self.dkim_signer, email, nome, primeiro_nome, campos)
             
-            # Envia o email
-            with smtplib.SMTP(self.smtp_config['host'], self.smtp_config['port'], timeout=self.smtp_config['timeout']) as servidor:
-                servidor.send_message(msg)
+            # Envia os bytes prontos reutilizando uma sessão do pool
+            resposta = self.obter_pool_smtp().enviar_bytes(
+                parseaddr(remetente)[1], [email], dados, fabrica.mail_options
+            )
             
             self.logger.info(f"Email enviado com sucesso para {email}")
-            return True
+            return resposta
         except Exception as e:
             self.logger.error(f"Erro ao enviar email para {email}: {str(e)}")
             raise
 
-    def carregar_dkim(self):
-        """Carrega a chave DKIM para assinatura de emails"""
+    def obter_pool_smtp(self):
+        """Retorna o pool de conexões SMTP, criando-o na primeira utilização"""
+        with self._lock:
+            if self.smtp_pool is None:
+                self.smtp_pool = SMTPConnectionPool.from_config(
+                    self.smtp_config,
+                    self.smtp_pool_config,
+                    local_hostname=self.hostname
+                )
+            return self.smtp_pool
+
+    def fechar_pool_smtp(self):
+        """Encerra todas as sessões do pool SMTP"""
+        with self._lock:
+            if self.smtp_pool is not None:
+                self.smtp_pool.close()
+                self.smtp_pool = None
+
+    @contextmanager
+    def sessao_campanha(self):
+        """Mantém o pool aberto durante a campanha e registra suas métricas ao final"""
+        pool = self.obter_pool_smtp()
         try:
-            if os.path.exists(self.dkim_config['private_key_path']):
-                with open(self.dkim_config['private_key_path'], 'rb') as f:
-                    self.dkim_key = f.read()
-                self.logger.info("Chave DKIM carregada com sucesso")
-            else:
-                self.logger.warning(f"Arquivo de chave DKIM não encontrado: {self.dkim_config['private_key_path']}")
-                self.dkim_key = None
-        except Exception as e:
-            self.logger.error(f"Erro ao carregar chave DKIM: {str(e)}")
-            self.dkim_key = None
+            yield pool
+        finally:
+            metrics = pool.get_metrics()
+            self.logger.info(
+                f"Pool SMTP: {metrics['mensagens']} mensagens, {metrics['conexoes_criadas']} conexões, "
+                f"{metrics['reutilizacoes']} reutilizações, {metrics['reconexoes']} reconexões, "
+                f"handshake médio {metrics['tempo_handshake_medio'] * 1000:.1f}ms"
+            )
+
+    def carregar_dkim(self):
+        """Carrega a chave DKIM para assinatura de emails (só relê o arquivo se ele mudou)"""
+        with self._lock:
+            caminho = self.dkim_config['private_key_path']
+            try:
+                if self.dkim_signer and not self.dkim_signer.chave_alterada():
+                    return
+                anterior = self.dkim_signer
+                if os.path.exists(caminho):
+                    # Cria o novo assinador antes de trocar: quem ainda usa o
+                    # anterior (campanhas em andamento) não fica sem assinatura
+                    self.dkim_signer = DKIMSigner.from_file(
+                        caminho,
+                        selector=self.dkim_config['selector'],
+                        domain=self.dkim_config['domain'],
+                        processes=self.dkim_config['processes']
+                    )
+                    self.logger.info("Chave DKIM carregada com sucesso")
+                else:
+                    self.logger.warning(f"Arquivo de chave DKIM não encontrado: {caminho}. Emails serão enviados sem assinatura DKIM.")
+                    self.dkim_signer = None
+                if anterior is not None:
+                    anterior.close()
+            except Exception as e:
+                self.logger.error(f"Erro ao carregar chave DKIM: {str(e)}")
+                anterior, self.dkim_signer = self.dkim_signer, None
+                if anterior is not None:
+                    anterior.close()
     
-    def carregar_lista_emails(self, lista_emails_path):
-        """Carrega e valida a lista de emails"""
+    def abrir_lista_emails(self, lista_emails_path):
+        """Abre a lista para leitura em blocos, validando o cabeçalho"""
         try:
             if not os.path.exists(lista_emails_path):
                 self.logger.error(f"Lista de emails não encontrada: {lista_emails_path}")
                 return None
             
-            # Detecta o encoding do arquivo
-            encoding = 'utf-8'
-            try:
-                import chardet
-                with open(lista_emails_path, 'rb') as f:
-                    raw_data = f.read(1024)  # Lê apenas o início do arquivo
-                    detected = chardet.detect(raw_data)
-                    if detected['confidence'] > 0.7:
-                        encoding = detected['encoding']
-                        self.logger.info(f"Encoding detectado: {encoding}")
-            except ImportError:
-                self.logger.warning("Módulo chardet não encontrado, usando UTF-8")
-            except Exception as e:
-                self.logger.warning(f"Erro ao detectar encoding: {str(e)}, usando UTF-8")
-            
-            # Carrega o CSV
-            df = pd.read_csv(lista_emails_path, encoding=encoding)
+            # Lê pelo cache colunar (o CSV só é importado de novo quando muda)
+            lista = abrir_lista(lista_emails_path, chunksize=self.chunk_size)
+            self.logger.info(f"Encoding detectado: {lista.encoding}")
             
             # Verifica se as colunas necessárias existem
-            required_columns = {'EMAIL'}
-            columns = {col.upper() for col in df.columns}
-            if not required_columns.issubset(columns):
-                missing = required_columns - columns
+            missing = lista.colunas_ausentes({'EMAIL'})
+            if missing:
                 self.logger.error(f"Colunas obrigatórias ausentes: {missing}")
+                lista.close()
                 return None
             
-            # Padroniza os nomes das colunas
-            df.columns = [col.upper() for col in df.columns]
+            return lista
+        except Exception as e:
+            self.logger.error(f"Erro ao abrir lista de emails: {str(e)}")
+            return None
+
+    def carregar_lista_emails(self, lista_emails_path):
+        """Carrega a lista de emails inteira em um DataFrame (todas as colunas)"""
+        try:
+            lista = self.abrir_lista_emails(lista_emails_path)
+            if lista is None:
+                return None
             
-            # Garante que a coluna NOME existe
-            if 'NOME' not in df.columns:
-                df['NOME'] = ''
+            with lista:
+                df = pd.concat(lista.blocos(lista.colunas), ignore_index=True)
             
             # Remove linhas com emails vazios
             df = df[df['EMAIL'].notna() & (df['EMAIL'] != '')]
@@ -1,52 +1,46 @@
 from http.server import HTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import csv
 import json
 import os
+import tempfile
+import threading
 from datetime import datetime
-from urllib.parse import parse_qs, urlparse
-from sender import EmailDispatcher
-from scheduler import EmailScheduler
-import pandas as pd
+from urllib.parse import parse_qs, unquote, urlparse
+from sender import MODOS_ENVIO
+from blacklist import BlacklistIndex
+from list_cache import abrir_lista
+from app_context import AppContext
+from campaign_store import LIMITE_PAGINA
 from pathlib import Path
 import re
 
 class WebHandler(SimpleHTTPRequestHandler):
-    # Atributos de classe
-    schedules = []
-    lists_dir = Path('lists')
-    _lists_cache = {}
-    _last_cache_update = 0
-    cache_ttl = 30  # tempo em segundos
-    
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, contexto=None, **kwargs):
+        # Serviços compartilhados, criados uma vez em run_server (AppContext).
+        # Precisam existir antes de super().__init__, que já atende a requisição.
+        self.contexto = contexto
+        self.dispatcher = contexto.dispatcher
+        self.scheduler = contexto.scheduler
+        self.blacklist = contexto.blacklist
+        self.blacklist_store = contexto.blacklist_store
+        self.catalogo = contexto.catalogo
+        self.previews = contexto.previews
+        self.tarefas = contexto.tarefas
+        self.campanhas = contexto.campanhas
+        self.lists_dir = contexto.lists_dir
         super().__init__(*args, **kwargs)
-        self.dispatcher = EmailDispatcher()
-        self.scheduler = EmailScheduler(self.schedules)
-        
-        # Garante que o diretório lists existe
-        self.lists_dir.mkdir(exist_ok=True)
-
-    @classmethod
-    def init_scheduler(cls):
-        """Inicializa o scheduler de emails"""
-        cls.scheduler = EmailScheduler(cls.schedules)
-        cls.scheduler.start()
-        
-        # Garante que o diretório lists existe
-        cls.lists_dir.mkdir(exist_ok=True)
-        print(f"Diretório de listas inicializado em: {cls.lists_dir.absolute()}")
     
     def do_GET(self):
         try:
             if self.path == '/api/lists':
-                print("Requisição recebida para /api/lists")
-                print(f"Diretório de listas: {self.lists_dir.absolute()}")
                 response = self.handle_request(self.path)
                 if response:
                     self.send_response(200)
                     self.send_header('Content-type', 'application/json')
                     self.send_header('Access-Control-Allow-Origin', '*')
                     self.end_headers()
-                    print(f"Enviando listas: {json.dumps(response)}")
                     self.wfile.write(json.dumps(response).encode())
                 return
             elif self.path.startswith('/unsubscribe'):
@@ -54,35 +48,103 @@ class WebHandler(SimpleHTTPRequestHandler):
                 return
             elif self.path.startswith('/api/preview_list/'):
                 response = self.handle_request(self.path)
-            elif self.path == '/api/stats':
-                self.send_response(200)
+            elif urlparse(self.path).path == '/api/stats':
+                # Contadores ao vivo (sem leitura de disco): ?campanha_id= para uma
+                # campanha; sem ele, o agregado das campanhas em andamento
+                query = parse_qs(urlparse(self.path).query)
+                try:
+                    stats = self.dispatcher.estatisticas.atual(query.get('campanha_id', [None])[0])
+                except ValueError:
+                    self.send_error_response('campanha_id inválido')
+                    return
+                self.send_response(200 if stats else 404)
                 self.send_header('Content-type', 'application/json')
                 self.send_header('Cache-Control', 'no-cache')
                 self.end_headers()
-                
+                self.wfile.write(json.dumps(stats or {'status': 'error', 'message': 'Campanha não encontrada'}).encode())
+                return
+            elif self.path.startswith('/api/stats/history'):
+                # Histórico por campanha: ?limit=&offset=&campanha_id= (mais recentes primeiro)
+                query = parse_qs(urlparse(self.path).query)
                 try:
-                    with open('email_stats.json', 'r') as f:
-                        stats = json.load(f)
-                except FileNotFoundError:
-                    stats = {
-                        'total': 0,
-                        'enviados': 0,
-                        'falhas': 0,
-                        'invalidos': 0,
-                        'status': 'aguardando',
-                        'inicio': None,
-                        'fim': None,
-                        'erros': []
-                    }
-                
-                self.wfile.write(json.dumps(stats).encode())
+                    historico, total = self.dispatcher.estatisticas.historico(
+                        limit=query.get('limit', [LIMITE_PAGINA])[0],
+                        offset=query.get('offset', [0])[0],
+                        campanha_id=query.get('campanha_id', [None])[0]
+                    )
+                except ValueError:
+                    self.send_error_response('Parâmetros de paginação inválidos')
+                    return
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Access-Control-Expose-Headers', 'X-Total-Count')
+                self.send_header('X-Total-Count', str(total))
+                self.end_headers()
+                self.wfile.write(json.dumps(historico).encode())
+                return
+            elif self.path == '/schedules' or self.path.startswith('/schedules?'):
+                # Paginado: ?limit=&offset=&status= (mais recentes primeiro); total no X-Total-Count
+                query = parse_qs(urlparse(self.path).query)
+                try:
+                    schedules, total = self.campanhas.listar(
+                        limit=query.get('limit', [LIMITE_PAGINA])[0],
+                        offset=query.get('offset', [0])[0],
+                        status=query.get('status', [None])[0]
+                    )
+                except ValueError:
+                    self.send_error_response('Parâmetros de paginação inválidos')
+                    return
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Access-Control-Expose-Headers', 'X-Total-Count')
+                self.send_header('X-Total-Count', str(total))
+                self.end_headers()
+                self.wfile.write(json.dumps(schedules).encode())
                 return
-            elif self.path == '/schedules':
+            elif self.path == '/api/campaign_queue':
+                # Fila do executor de campanhas: profundidade, em execução e tempos de espera
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                self.wfile.write(json.dumps(self.scheduler.executor.get_metrics()).encode())
+                return
+            elif self.path.startswith('/api/campaigns/'):
+                # Status de uma campanha (ex.: o teste enfileirado por /api/send_test)
+                try:
+                    campanha = self.campanhas.obter(int(self.path.split('/')[-1]))
+                except ValueError:
+                    campanha = None
+                self.send_response(200 if campanha else 404)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                self.wfile.write(json.dumps(campanha or {'status': 'error', 'message': 'Campanha não encontrada'}).encode())
+                return
+            elif self.path.startswith('/api/jobs/'):
+                try:
+                    tarefa = self.tarefas.obter(int(self.path.split('/')[-1]))
+                except ValueError:
+                    tarefa = None
+                self.send_response(200 if tarefa else 404)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
                 self.end_headers()
-                self.wfile.write(json.dumps(self.schedules).encode())
+                self.wfile.write(json.dumps(tarefa or {'status': 'error', 'message': 'Tarefa não encontrada'}).encode())
+                return
+            elif self.path == '/api/blacklist/export':
+                # Gerado em blocos direto do SQLite, sem montar o arquivo em memória
+                self.send_response(200)
+                self.send_header('Content-type', 'text/csv; charset=utf-8')
+                self.send_header('Content-Disposition', f'attachment; filename="blacklist_{datetime.now():%Y%m%d}.csv"')
+                # Sem Access-Control-Allow-Origin: a lista de emails não fica legível por outras origens
+                self.end_headers()
+                for bloco in self.blacklist_store.exportar_csv():
+                    self.wfile.write(bloco.encode('utf-8'))
                 return
             elif self.path == '/list_templates':
                 self.send_response(200)
@@ -118,9 +180,15 @@ class WebHandler(SimpleHTTPRequestHandler):
     
     def do_POST(self):
         try:
-            content_length = int(self.headers['Content-Length'])
+            if urlparse(self.path).path == '/api/blacklist/import':
+                # O corpo é o CSV (não JSON), lido em streaming
+                self.importar_blacklist()
+                return
+            
+            content_length = int(self.headers.get('Content-Length', 0))
             post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            # /cancel_schedule/<id> é enviado sem corpo pelo painel
+            data = json.loads(post_data.decode('utf-8')) if post_data else {}
             
             response = None
             
@@ -143,16 +211,10 @@ class WebHandler(SimpleHTTPRequestHandler):
                         }).encode())
                         return
                     
-                    # Adiciona o email à blacklist
-                    import sqlite3
-                    conn = sqlite3.connect('email_blacklist.db')
-                    cursor = conn.cursor()
-                    
-                    # Verifica se o email já está na blacklist
-                    cursor.execute("SELECT email FROM invalid_emails WHERE email = ?", (email,))
-                    if cursor.fetchone():
+                    # Verifica se o email já está na blacklist (índice em memória)
+                    blacklist = self.blacklist
+                    if blacklist.contem(email):
                         # Email já está na blacklist
-                        conn.close()
                         self.send_response(200)
                         self.send_header('Content-type', 'application/json')
                         self.send_header('Access-Control-Allow-Origin', '*')
@@ -163,13 +225,9 @@ class WebHandler(SimpleHTTPRequestHandler):
                         }).encode())
                         return
                     
-                    # Adiciona o email à blacklist
-                    cursor.execute(
-                        "INSERT INTO invalid_emails (email, reason) VALUES (?, ?)",
-                        (email, "Descadastro voluntário via API")
-                    )
-                    conn.commit()
-                    conn.close()
+                    # Adiciona o email à blacklist: campanhas em andamento deixam de
+                    # enviar na hora e a resposta espera o commit (agrupado com os demais)
+                    self.blacklist_store.adicionar(email, "Descadastro voluntário via API", aguardar=True)
                     
                     # Retorna uma resposta de sucesso
                     self.send_response(200)
@@ -192,36 +250,36 @@ class WebHandler(SimpleHTTPRequestHandler):
                     }).encode())
                     return
             elif self.path == '/api/send_test':
+                # Corpo: email, name, template, subject[, preview, mode, datetime]
+                # Resposta 202: {'success': True, 'status': 'enfileirado', 'campanha': {...}}
+                # O resultado sai em GET /api/campaigns/<id>: status 'concluido' ou
+                # 'erro' (motivo em 'error'). Com `datetime` o teste é agendado.
                 try:
-                    dispatcher = EmailDispatcher()
+                    mode = data.get('mode')
+                    if mode is not None and mode not in MODOS_ENVIO:
+                        self.send_error_response(f"Modo de envio inválido: {mode}")
+                        return
                     
-                    # Cria arquivo CSV temporário
-                    with open('teste_email.csv', 'w') as f:
-                        f.write("EMAIL,NOME\n")
-                        f.write(f"{data['email']},{data['name']}")
+                    template_path = Path('templates') / data['template']
+                    if not template_path.exists():
+                        self.send_error_response('Template não encontrado')
+                        return
                     
-                    # Envia o email
-                    result = dispatcher.enviar_emails(
-                        lista_emails_path='teste_email.csv',
-                        template_path=os.path.join('templates', data['template']),
-                        horario_envio=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        assunto=data['subject'],
-                        remetente='Blazee <contato@useblazee.com.br>'
+                    # O teste vira uma campanha 'test': entra na vaga prioritária do
+                    # executor, à frente das campanhas em massa na fila
+                    horario = data.get('datetime')
+                    campanha = self.criar_campanha_teste(
+                        self.campanhas, data, mode,
+                        horario or datetime.now(self.scheduler.timezone).strftime('%Y-%m-%d %H:%M:%S')
                     )
+                    if not horario:
+                        self.scheduler.executor.submeter(campanha)
                     
-                    # Remove o arquivo temporário
-                    os.remove('teste_email.csv')
-                    
-                    self.send_response(200)
+                    self.send_response(202)
                     self.send_header('Content-type', 'application/json')
                     self.send_header('Access-Control-Allow-Origin', '*')
                     self.end_headers()
-                    
-                    response = {'success': result}
-                    if not result:
-                        response['error'] = 'Erro ao enviar email'
-                    
-                    self.wfile.write(json.dumps(response).encode())
+                    self.wfile.write(json.dumps({'success': True, 'status': 'enfileirado', 'campanha': campanha}).encode())
                     return
                 
                 except Exception as e:
@@ -252,40 +310,36 @@ class WebHandler(SimpleHTTPRequestHandler):
                     
                     print(f"Verificando lista: {file_path}")
                     
-                    # Lê a lista selecionada
+                    # Valida a lista pelo catálogo: cabeçalho (EMAIL e NOME) e a contagem de
+                    # linhas exibida em /api/lists e no preview
                     try:
-                        # Verifica encoding do arquivo
-                        with open(file_path, 'rb') as f:
-                            raw_data = f.read(1024)
-                            encoding = 'utf-8'
-                            try:
-                                import chardet
-                                detected = chardet.detect(raw_data)
-                                if detected['confidence'] > 0.7:
-                                    encoding = detected['encoding']
-                                    print(f"Encoding detectado: {encoding}")
-                            except ImportError:
-                                print("Módulo chardet não encontrado, usando UTF-8")
-                        
-                        df = pd.read_csv(file_path, encoding=encoding)
-                        print(f"Lista carregada com sucesso: {len(df)} emails")
-                        
-                        # Valida as colunas necessárias
-                        required_columns = {'EMAIL', 'NOME'}
-                        columns = {col.upper() for col in df.columns}
-                        if not required_columns.issubset(columns):
-                            missing = required_columns - columns
-                            error_msg = f"Colunas obrigatórias ausentes: {missing}"
+                        info = self.catalogo.info(file_path)
+                        if info is None:
+                            error_msg = "Lista inválida: colunas obrigatórias EMAIL e NOME ausentes ou arquivo ilegível"
                             print(f"Erro: {error_msg}")
                             self.send_error_response(error_msg)
                             return
                         
+                        total_emails = info['count']
+                        print(f"Lista verificada: {total_emails} emails")
+                        
+                        # O cache colunar é importado em segundo plano, não na thread HTTP
+                        self.tarefas.submeter('importar_lista', self.preparar_cache_lista, file_path)
+                        
                     except Exception as e:
                         error_msg = f"Erro ao ler lista: {str(e)}"
                         print(f"Erro: {error_msg}")
                         self.send_error_response(error_msg)
                         return
                     
+                    # Valida o modo de envio
+                    mode = data.get('mode', 'sequencial')
+                    if mode not in MODOS_ENVIO:
+                        error_msg = f"Modo de envio inválido: {mode}"
+                        print(f"Erro: {error_msg}")
+                        self.send_error_response(error_msg)
+                        return
+                    
                     # Valida o template
                     template_path = Path('templates') / data['template']
                     if not template_path.exists():
@@ -295,23 +349,18 @@ class WebHandler(SimpleHTTPRequestHandler):
                         return
                     
                     # Cria o agendamento
-                    schedule_id = len(self.schedules) + 1
-                    schedule = {
-                        'id': schedule_id,
-                        'type': 'mass',
-                        'template': data['template'],
-                        'subject': data['subject'],
-                        'preview': data.get('preview', ''),
-                        'datetime': data['datetime'],
-                        'status': 'pendente',
-                        'list_path': str(file_path),
-                        'total_emails': len(df),
-                        'created_at': datetime.now().isoformat()
-                    }
-                    
-                    self.schedules.append(schedule)
-                    print(f"Agendamento criado com sucesso: ID {schedule_id}")
-                    print(f"Total de emails: {len(df)}")
+                    schedule = self.campanhas.criar(
+                        tipo='mass',
+                        template=data['template'],
+                        subject=data['subject'],
+                        horario=data['datetime'],
+                        preview=data.get('preview', ''),
+                        list_path=str(file_path),
+                        mode=mode,
+                        total_emails=total_emails
+                    )
+                    print(f"Agendamento criado com sucesso: ID {schedule['id']}")
+                    print(f"Total de emails: {total_emails}")
                     print(f"Data/Hora agendada: {data['datetime']}")
                     
                     # Envia resposta de sucesso
@@ -334,16 +383,14 @@ class WebHandler(SimpleHTTPRequestHandler):
             elif self.path.startswith('/cancel_schedule/'):
                 try:
                     schedule_id = int(self.path.split('/')[-1])
-                    for schedule in self.schedules:
-                        if schedule['id'] == schedule_id and schedule['status'] == 'pendente':
-                            schedule['status'] = 'cancelado'
-                            break
+                    # Só campanhas ainda pendentes podem ser canceladas
+                    cancelado = self.campanhas.cancelar(schedule_id)
                     
                     self.send_response(200)
                     self.send_header('Content-type', 'application/json')
                     self.send_header('Access-Control-Allow-Origin', '*')
                     self.end_headers()
-                    self.wfile.write(json.dumps({'success': True}).encode())
+                    self.wfile.write(json.dumps({'success': cancelado}).encode())
                     return
                 
                 except Exception as e:
@@ -367,117 +414,13 @@ class WebHandler(SimpleHTTPRequestHandler):
             self.send_error(500)
 
     def get_list_info(self, file_path):
-        try:
-            current_time = datetime.now().timestamp()
-            cache_key = str(file_path)
-            
-            # Verifica se tem no cache e se ainda é válido
-            if (cache_key in self._lists_cache and 
-                current_time - self._last_cache_update < self.cache_ttl):
-                print(f"Usando cache para {file_path.name}")
-                cached_info = self._lists_cache[cache_key]
-                # Retorna apenas informações essenciais do cache
-                return {
-                    'name': cached_info['name'],
-                    'count': cached_info['count'],
-                    'modified': cached_info['modified']
-                }
-            
-            print(f"Lendo arquivo {file_path.name}")
-            
-            # Verifica se o arquivo existe
-            if not file_path.exists():
-                print(f"Arquivo não encontrado: {file_path}")
-                return None
-            
-            # Lê o arquivo CSV com detecção de encoding
-            with open(file_path, 'rb') as f:
-                raw_data = f.read()
-                encoding = 'utf-8'
-                try:
-                    import chardet
-                    detected = chardet.detect(raw_data)
-                    if detected['confidence'] > 0.7:
-                        encoding = detected['encoding']
-                        print(f"Encoding detectado para {file_path.name}: {encoding}")
-                except ImportError:
-                    print("Módulo chardet não encontrado, usando UTF-8")
-                except Exception as e:
-                    print(f"Erro ao detectar encoding: {str(e)}, usando UTF-8")
-
-            # Tenta ler o CSV
-            try:
-                df = pd.read_csv(file_path, encoding=encoding)
-            except UnicodeDecodeError:
-                print(f"Erro de encoding, tentando com latin1 para {file_path.name}")
-                df = pd.read_csv(file_path, encoding='latin1')
-            except Exception as e:
-                print(f"Erro ao ler CSV {file_path.name}: {str(e)}")
-                return None
-            
-            # Verifica e padroniza as colunas
-            required_columns = {'EMAIL', 'NOME'}
-            columns = {col.upper() for col in df.columns}
-            
-            if not required_columns.issubset(columns):
-                missing = required_columns - columns
-                print(f"Colunas ausentes em {file_path.name}: {missing}")
-                return None
-            
-            # Cria o objeto de informações (versão completa para cache)
-            full_info = {
-                'name': file_path.name,
-                'count': len(df),
-                'modified': datetime.fromtimestamp(file_path.stat().st_mtime).isoformat(),
-                'columns': list(df.columns),
-                'encoding': encoding
-            }
-            
-            # Atualiza o cache da classe com informações completas
-            self.__class__._lists_cache[cache_key] = full_info
-            self.__class__._last_cache_update = current_time
-            
-            # Retorna apenas informações essenciais
-            info = {
-                'name': full_info['name'],
-                'count': full_info['count'],
-                'modified': full_info['modified']
-            }
-            
-            print(f"Arquivo {file_path.name} processado com sucesso")
-            return info
-            
-        except Exception as e:
-            print(f"Erro ao processar {file_path}: {str(e)}")
-            return None
+        return self.catalogo.info(file_path)
 
     def handle_request(self, path, method='GET', data=None):
         if path == '/api/lists' and method == 'GET':
             try:
-                lists = []
-                print(f"Buscando arquivos CSV em: {self.lists_dir.absolute()}")
-                
-                # Verifica se o diretório existe
-                if not self.lists_dir.exists():
-                    print("Diretório de listas não encontrado. Criando...")
-                    self.lists_dir.mkdir(exist_ok=True)
-                
-                # Lista todos os arquivos CSV
-                csv_files = sorted(self.lists_dir.glob('*.csv'))
-                print(f"Arquivos CSV encontrados: {[f.name for f in csv_files]}")
-                
-                for file in csv_files:
-                    print(f"Processando arquivo: {file}")
-                    try:
-                        info = self.get_list_info(file)
-                        if info:
-                            lists.append(info)
-                            print(f"Lista processada com sucesso: {info['name']}")
-                        else:
-                            print(f"Arquivo ignorado (formato inválido): {file}")
-                    except Exception as e:
-                        print(f"Erro ao processar arquivo {file}: {str(e)}")
-                        continue
+                # Responde direto do catálogo (arquivos novos ou alterados são reprocessados em segundo plano)
+                lists = self.catalogo.listar()
                 
                 print(f"Total de listas válidas encontradas: {len(lists)}")
                 return {'status': 'success', 'data': lists}
@@ -488,37 +431,25 @@ class WebHandler(SimpleHTTPRequestHandler):
 
         elif path.startswith('/api/preview_list/') and method == 'GET':
             try:
-                list_name = path.split('/')[-1]
+                # /api/preview_list/<nome>?offset=0&limit=5
+                url = urlparse(path)
+                params = parse_qs(url.query)
+                list_name = unquote(url.path.split('/')[-1])
                 file_path = self.lists_dir / list_name
                 if not file_path.exists():
                     return {'status': 'error', 'message': 'Lista não encontrada'}
                 
-                # Verifica se tem no cache
-                cache_key = str(file_path)
-                if cache_key in self._lists_cache:
-                    encoding = self._lists_cache[cache_key].get('encoding', 'utf-8')
-                else:
-                    # Detecta encoding se não estiver em cache
-                    with open(file_path, 'rb') as f:
-                        raw_data = f.read(1024)  # Lê apenas o início do arquivo
-                        encoding = 'utf-8'
-                        try:
-                            import chardet
-                            detected = chardet.detect(raw_data)
-                            if detected['confidence'] > 0.7:
-                                encoding = detected['encoding']
-                        except:
-                            pass
-
-                # Lê apenas as primeiras linhas do arquivo
-                df = pd.read_csv(file_path, encoding=encoding, nrows=5)
-                preview_rows = df.to_dict('records')
-                
-                return {
-                    'status': 'success',
-                    'preview': preview_rows,
-                    'total_rows': sum(1 for _ in open(file_path, encoding=encoding))
-                }
+                # Lê só as linhas pedidas, pelo índice esparso de linhas do arquivo
+                preview = self.previews.preview(
+                    file_path,
+                    offset=params.get('offset', ['0'])[0],
+                    limit=params.get('limit', ['5'])[0]
+                )
+                # O total vem do catálogo, como em /api/lists e nos agendamentos
+                info = self.catalogo.info(file_path)
+                if info is not None:
+                    preview['total_rows'] = info['count']
+                return {'status': 'success', **preview}
             except Exception as e:
                 error_msg = f"Erro ao gerar preview: {str(e)}"
                 print(error_msg)
@@ -562,40 +493,36 @@ class WebHandler(SimpleHTTPRequestHandler):
                 
                 print(f"Verificando lista: {file_path}")
                 
-                # Lê a lista selecionada
+                # Valida a lista pelo catálogo: cabeçalho (EMAIL e NOME) e a contagem de
+                # linhas exibida em /api/lists e no preview
                 try:
-                    # Verifica encoding do arquivo
-                    with open(file_path, 'rb') as f:
-                        raw_data = f.read(1024)
-                        encoding = 'utf-8'
-                        try:
-                            import chardet
-                            detected = chardet.detect(raw_data)
-                            if detected['confidence'] > 0.7:
-                                encoding = detected['encoding']
-                                print(f"Encoding detectado: {encoding}")
-                        except ImportError:
-                            print("Módulo chardet não encontrado, usando UTF-8")
-                    
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    print(f"Lista carregada com sucesso: {len(df)} emails")
-                    
-                    # Valida as colunas necessárias
-                    required_columns = {'EMAIL', 'NOME'}
-                    columns = {col.upper() for col in df.columns}
-                    if not required_columns.issubset(columns):
-                        missing = required_columns - columns
-                        error_msg = f"Colunas obrigatórias ausentes: {missing}"
+                    info = self.catalogo.info(file_path)
+                    if info is None:
+                        error_msg = "Lista inválida: colunas obrigatórias EMAIL e NOME ausentes ou arquivo ilegível"
                         print(f"Erro: {error_msg}")
                         self.send_error_response(error_msg)
                         return
                     
+                    total_emails = info['count']
+                    print(f"Lista verificada: {total_emails} emails")
+                    
+                    # O cache colunar é importado em segundo plano, não na thread HTTP
+                    self.tarefas.submeter('importar_lista', self.preparar_cache_lista, file_path)
+                    
                 except Exception as e:
                     error_msg = f"Erro ao ler lista: {str(e)}"
                     print(f"Erro: {error_msg}")
                     self.send_error_response(error_msg)
                     return
                 
+                # Valida o modo de envio
+                mode = data.get('mode', 'sequencial')
+                if mode not in MODOS_ENVIO:
+                    error_msg = f"Modo de envio inválido: {mode}"
+                    print(f"Erro: {error_msg}")
+                    self.send_error_response(error_msg)
+                    return
+                
                 # Valida o template
                 template_path = Path('templates') / data['template']
                 if not template_path.exists():
@@ -605,23 +532,18 @@ class WebHandler(SimpleHTTPRequestHandler):
                     return
                 
                 # Cria o agendamento
-                schedule_id = len(self.schedules) + 1
-                schedule = {
-                    'id': schedule_id,
-                    'type': 'mass',
-                    'template': data['template'],
-                    'subject': data['subject'],
-                    'preview': data.get('preview', ''),
-                    'datetime': data['datetime'],
-                    'status': 'pendente',
-                    'list_path': str(file_path),
-                    'total_emails': len(df),
-                    'created_at': datetime.now().isoformat()
-                }
-                
-                self.schedules.append(schedule)
-                print(f"Agendamento criado com sucesso: ID {schedule_id}")
-                print(f"Total de emails: {len(df)}")
+                schedule = self.campanhas.criar(
+                    tipo='mass',
+                    template=data['template'],
+                    subject=data['subject'],
+                    horario=data['datetime'],
+                    preview=data.get('preview', ''),
+                    list_path=str(file_path),
+                    mode=mode,
+                    total_emails=total_emails
+                )
+                print(f"Agendamento criado com sucesso: ID {schedule['id']}")
+                print(f"Total de emails: {total_emails}")
                 print(f"Data/Hora agendada: {data['datetime']}")
                 
                 # Envia resposta de sucesso
@@ -642,6 +564,55 @@ class WebHandler(SimpleHTTPRequestHandler):
                 self.send_error_response(error_msg)
                 return
 
+    def importar_blacklist(self):
+        """POST /api/blacklist/import?motivo=&coluna=: corpo CSV gravado em disco aos poucos e importado em segundo plano"""
+        query = parse_qs(urlparse(self.path).query)
+        motivo = query.get('motivo', ['Lista de supressão importada'])[0]
+        coluna = query.get('coluna', ['EMAIL'])[0]
+        restante = int(self.headers.get('Content-Length', 0))
+        if restante <= 0:
+            self.send_error_response('Arquivo CSV não enviado')
+            return
+        
+        fd, caminho = tempfile.mkstemp(prefix='blacklist_import_', suffix='.csv')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while restante > 0:
+                    bloco = self.rfile.read(min(restante, 1 << 16))
+                    if not bloco:
+                        raise ConnectionError('Upload interrompido')
+                    f.write(bloco)
+                    restante -= len(bloco)
+        except Exception:
+            os.remove(caminho)
+            raise
+        
+        # Coluna inexistente é erro do pedido (400), não da tarefa em segundo plano
+        try:
+            self.blacklist_store.coluna_csv(caminho, coluna)
+        except ValueError as e:
+            os.remove(caminho)
+            self.send_error_response(str(e))
+            return
+        
+        # A importação roda em segundo plano; contagens parciais em /api/jobs/<id> (progresso)
+        tarefa = self.tarefas.submeter_com_progresso(
+            'blacklist_import', self.importar_csv_blacklist, self.blacklist_store, caminho, motivo, coluna
+        )
+        self.send_response(202)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps({'success': True, 'status': 'enfileirado', 'job': tarefa}).encode())
+
+    @staticmethod
+    def importar_csv_blacklist(blacklist_store, caminho, motivo, coluna, progresso=None):
+        """Importa o CSV recebido (executado por BackgroundWorkers) e remove o arquivo temporário"""
+        try:
+            return blacklist_store.importar_csv(caminho, motivo, coluna=coluna, progresso=progresso)
+        finally:
+            os.remove(caminho)
+
     def send_error_response(self, message):
         self.send_response(400)
         self.send_header('Content-type', 'application/json')
@@ -668,29 +639,19 @@ class WebHandler(SimpleHTTPRequestHandler):
                     self.wfile.write(self.get_unsubscribe_error_page("Email inválido").encode())
                     return
                 
-                # Adiciona o email à blacklist
-                import sqlite3
-                conn = sqlite3.connect('email_blacklist.db')
-                cursor = conn.cursor()
-                
-                # Verifica se o email já está na blacklist
-                cursor.execute("SELECT email FROM invalid_emails WHERE email = ?", (email,))
-                if cursor.fetchone():
+                # Verifica se o email já está na blacklist (índice em memória)
+                blacklist = self.blacklist
+                if blacklist.contem(email):
                     # Email já está na blacklist
-                    conn.close()
                     self.send_response(200)
                     self.send_header('Content-type', 'text/html')
                     self.end_headers()
                     self.wfile.write(self.get_unsubscribe_success_page(email).encode())
                     return
                 
-                # Adiciona o email à blacklist
-                cursor.execute(
-                    "INSERT INTO invalid_emails (email, reason) VALUES (?, ?)",
-                    (email, "Descadastro voluntário")
-                )
-                conn.commit()
-                conn.close()
+                # Adiciona o email à blacklist: campanhas em andamento deixam de
+                # enviar na hora e a resposta espera o commit (agrupado com os demais)
+                self.blacklist_store.adicionar(email, "Descadastro voluntário", aguardar=True)
                 
                 # Retorna uma página de sucesso
                 self.send_response(200)
@@ -943,37 +904,110 @@ class WebHandler(SimpleHTTPRequestHandler):
         </html>
         """
 
+    @staticmethod
+    def preparar_cache_lista(file_path):
+        """Importa a lista para o cache colunar, se preciso (executado por BackgroundWorkers)"""
+        with abrir_lista(file_path) as lista:
+            return {'lista': Path(file_path).name, 'encoding': lista.encoding}
+
+    @staticmethod
+    def criar_campanha_teste(campanhas, data, mode, horario):
+        """Grava a lista do teste e cria a campanha 'test' correspondente
+
+        O CSV temporário é removido pelo scheduler quando a campanha termina.
+        """
+        fd, caminho = tempfile.mkstemp(prefix='teste_email_', suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['EMAIL', 'NOME'])
+                writer.writerow([data['email'], data['name']])
+            
+            return campanhas.criar(
+                tipo='test',
+                template=data['template'],
+                subject=data['subject'],
+                horario=horario,
+                preview=data.get('preview', ''),
+                list_path=caminho,
+                mode=mode,
+                total_emails=1
+            )
+        except Exception:
+            os.remove(caminho)
+            raise
+
     @staticmethod
     def check_email_blacklist(email):
         """Verifica se um email está na blacklist"""
         try:
-            import sqlite3
-            conn = sqlite3.connect('email_blacklist.db')
-            cursor = conn.cursor()
-            
-            # Verifica se o email está na blacklist
-            cursor.execute("SELECT email FROM invalid_emails WHERE email = ?", (email,))
-            result = cursor.fetchone() is not None
-            conn.close()
-            
-            return result
+            return BlacklistIndex.compartilhado().contem(email)
         except Exception as e:
             print(f"Erro ao verificar blacklist: {str(e)}")
             return False
 
-def run_server(port=8000):
+class ServidorHTTP(HTTPServer):
+    """HTTPServer que atende as conexões em um pool fixo de threads
+
+    Até `workers` requisições rodam ao mesmo tempo e outras `fila_maxima`
+    aguardam na fila; acima disso a conexão recebe 503 imediatamente, em vez
+    de acumular threads.
+    """
+
+    request_queue_size = 128
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, workers=16, fila_maxima=128):
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+        self._vagas = threading.BoundedSemaphore(workers + fila_maxima)
+
+    def process_request(self, request, client_address):
+        if not self._vagas.acquire(blocking=False):
+            self._recusar(request)
+            return
+        self._executor.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._vagas.release()
+
+    def _recusar(self, request):
+        try:
+            request.sendall(b'HTTP/1.0 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\n\r\n')
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+def run_server(port=8000, workers=16):
     server_address = ('', port)
     print(f"\n=== Iniciando servidor em http://localhost:{port} ===")
     
-    # Inicializa o scheduler
-    print("Inicializando scheduler...")
-    WebHandler.init_scheduler()
+    # Serviços compartilhados por todas as requisições
+    print("Inicializando serviços e scheduler...")
+    contexto = AppContext()
+    contexto.iniciar()
     
     # Cria e inicia o servidor
-    print("Criando servidor HTTP...")
-    httpd = HTTPServer(server_address, WebHandler)
+    print(f"Criando servidor HTTP ({workers} threads)...")
+    httpd = ServidorHTTP(server_address, partial(WebHandler, contexto=contexto), workers=workers)
     print(f"Servidor pronto! Acesse http://localhost:{port}")
-    httpd.serve_forever()
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        contexto.close()
 
 if __name__ == '__main__':
-    run_server() 
\ No newline at end of file
+    run_server()
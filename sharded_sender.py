@@ -0,0 +1,250 @@
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from rate_limiter import DomainRateLimiter, dominio_do_email, erro_temporario
+from retry_queue import classificar_erro
+from smtp_pool import resposta_do_erro
+
+
+# Processos são criados com spawn: o servidor tem várias threads e um fork
+# poderia herdar locks (logging, pools) presos por elas
+CONTEXTO_PROCESSOS = multiprocessing.get_context('spawn')
+
+
+class RateCoordinator:
+    """Teto global de envio compartilhado entre processos (token bucket em memória compartilhada)
+
+    Mesmo comportamento do teto global do DomainRateLimiter: cai pela metade
+    a cada adiamento 4xx, em qualquer processo, e volta a subir aos poucos
+    com os envios bem-sucedidos.
+    """
+
+    # Posições no array compartilhado
+    TOKENS, ULTIMO, TAXA, TAXA_MAXIMA = range(4)
+
+    def __init__(self, rate, min_rate=1, recovery_step=0.1, contexto=CONTEXTO_PROCESSOS):
+        self.min_rate = float(min_rate)
+        self.recovery_step = recovery_step
+        self._estado = contexto.Array('d', [float(max(1, rate)), time.monotonic(), float(rate), float(rate)])
+
+    def _reabastecer(self, estado, agora):
+        capacidade = max(1.0, estado[self.TAXA])
+        estado[self.TOKENS] = min(capacidade, estado[self.TOKENS] + (agora - estado[self.ULTIMO]) * estado[self.TAXA])
+        estado[self.ULTIMO] = agora
+
+    def try_acquire(self):
+        """Consome um token global; retorna 0 ou os segundos a esperar"""
+        with self._estado.get_lock():
+            estado = self._estado.get_obj()
+            self._reabastecer(estado, time.monotonic())
+            if estado[self.TOKENS] >= 1:
+                estado[self.TOKENS] -= 1
+                return 0.0
+            return (1 - estado[self.TOKENS]) / estado[self.TAXA]
+
+    def _ajustar(self, taxa):
+        estado = self._estado.get_obj()
+        self._reabastecer(estado, time.monotonic())
+        estado[self.TAXA] = taxa
+        estado[self.TOKENS] = min(estado[self.TOKENS], max(1.0, taxa))
+
+    def registrar_sucesso(self):
+        with self._estado.get_lock():
+            estado = self._estado.get_obj()
+            if estado[self.TAXA] < estado[self.TAXA_MAXIMA]:
+                self._ajustar(min(estado[self.TAXA_MAXIMA], estado[self.TAXA] + self.recovery_step))
+
+    def registrar_adiamento(self):
+        with self._estado.get_lock():
+            self._ajustar(max(self.min_rate, self._estado.get_obj()[self.TAXA] / 2))
+
+    def taxa(self):
+        with self._estado.get_lock():
+            return self._estado.get_obj()[self.TAXA]
+
+
+class ShardRateLimiter(DomainRateLimiter):
+    """Limitador de um processo do envio em shards
+
+    O teto global vem do RateCoordinator compartilhado; os limites por
+    domínio ficam locais, com a taxa de cada domínio dividida pelo número de
+    shards (a soma dos processos respeita o limite do domínio).
+    """
+
+    def __init__(self, coordenador, shards, global_rate, domain_limits=None, default_domain_rate=None, **kwargs):
+        super().__init__(global_rate=global_rate, domain_limits=domain_limits,
+                         default_domain_rate=default_domain_rate, **kwargs)
+        self.coordenador = coordenador
+        self.domain_limits = {dominio: taxa / shards for dominio, taxa in self.domain_limits.items()}
+        self.default_domain_rate /= shards
+
+    def try_acquire(self, dominio):
+        with self._lock:
+            bucket = self._bucket(dominio)
+            bucket.reabastecer(time.monotonic())
+            espera = bucket.espera()
+            if espera > 0:
+                return espera
+            # O token global só é consumido quando o domínio tem orçamento
+            espera = self.coordenador.try_acquire()
+            if espera > 0:
+                return espera
+            bucket.tokens -= 1
+            self.metrics['liberados'] += 1
+            return 0.0
+
+    def registrar_sucesso(self, dominio):
+        super().registrar_sucesso(dominio)
+        self.coordenador.registrar_sucesso()
+
+    def registrar_adiamento(self, dominio):
+        super().registrar_adiamento(dominio)
+        self.coordenador.registrar_adiamento()
+
+    def taxa_global(self):
+        return self.coordenador.taxa()
+
+
+class ShardedDispatchEngine:
+    """Envio de uma campanha dividido entre processos (um shard por processo)
+
+    O processo principal prepara os destinatários (validação, deduplicação e
+    blacklist já são vetorizadas) e distribui lotes para um
+    ProcessPoolExecutor. Cada processo tem o próprio EmailDispatcher, com
+    pool SMTP e assinador DKIM próprios, e faz a parte que consome CPU
+    (render, MIME, assinatura) e o envio. O teto global de envio é
+    coordenado entre os processos pelo RateCoordinator, e os resultados são
+    consolidados no processo principal em um único registro de estatísticas
+    (e no checkpoint da campanha).
+    """
+
+    def __init__(self, dispatcher, processos=None, tamanho_lote=100, rate_limiter=None):
+        self.dispatcher = dispatcher
+        self.logger = dispatcher.logger
+        self.rate_limiter = rate_limiter or dispatcher.rate_limiter
+        self.processos = processos or os.cpu_count() or 1
+        self.tamanho_lote = tamanho_lote
+
+    def _configuracao(self):
+        """Configuração copiada para o dispatcher de cada processo"""
+        dispatcher = self.dispatcher
+        limitador = self.rate_limiter
+        return {
+            'smtp_config': dict(dispatcher.smtp_config),
+            'smtp_pool_config': dict(dispatcher.smtp_pool_config),
+            # A assinatura já roda em paralelo entre os shards
+            'dkim_config': dict(dispatcher.dkim_config, processes=0),
+            'domain': dispatcher.domain,
+            'hostname': dispatcher.hostname,
+            'unsubscribe_email': dispatcher.unsubscribe_email,
+            # Teto da campanha: a parcela atual quando divide o orçamento com outras
+            'global_rate': limitador.taxa_global(),
+            'domain_limits': dict(limitador.domain_limits),
+            'default_domain_rate': limitador.default_domain_rate,
+            'nivel_log': dispatcher.logger.level
+        }
+
+    def run(self, destinatarios, template, assunto, remetente, stats, checkpoint=None, retentativas=None):
+        """Executa a campanha e bloqueia até o fim"""
+        coordenador = RateCoordinator(self.rate_limiter.taxa_global())
+        por_processo = Counter()
+        em_andamento = set()
+
+        self.logger.info(
+            f"Envio em {self.processos} processos, lotes de {self.tamanho_lote}, "
+            f"até {coordenador.taxa():.1f} emails/s no total"
+        )
+
+        def consolidar(concluidos):
+            for futuro in concluidos:
+                pid, resultados = futuro.result()
+                por_processo[pid] += len(resultados)
+                for destinatario, resposta, erro in resultados:
+                    if erro is None:
+                        self.dispatcher.registrar_envio(destinatario[-1], resposta, stats, checkpoint)
+                    else:
+                        self.dispatcher.tratar_falha(destinatario, erro, stats, checkpoint, retentativas)
+                    self.dispatcher.registrar_progresso(stats)
+
+        with ProcessPoolExecutor(
+            max_workers=self.processos,
+            mp_context=CONTEXTO_PROCESSOS,
+            initializer=_iniciar_shard,
+            initargs=(self._configuracao(), coordenador, self.processos, template.texto, assunto.texto, remetente)
+        ) as executor:
+            pendentes = destinatarios if retentativas is None else retentativas.intercalar(destinatarios)
+            while pendentes is not None:
+                fonte = iter(self.dispatcher.destinatarios_validos(pendentes, stats))
+                while True:
+                    lote = list(islice(fonte, self.tamanho_lote))
+                    if not lote:
+                        break
+                    # Poucos lotes em voo por processo: a lista continua sendo lida sob demanda
+                    if len(em_andamento) >= 2 * self.processos:
+                        concluidos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                        consolidar(concluidos)
+                    em_andamento.add(executor.submit(_enviar_lote, lote))
+                consolidar(wait(em_andamento).done)
+                em_andamento = set()
+                # Novas tentativas que sobraram, enviadas à medida que vencem
+                pendentes = retentativas.rodada() if retentativas is not None else None
+
+        self.logger.info(
+            "Envios por processo: " + ', '.join(f"{pid}: {total}" for pid, total in sorted(por_processo.items()))
+        )
+
+
+# Estado do processo worker, criado uma vez pelo initializer
+_shard = None
+
+
+def _iniciar_shard(configuracao, coordenador, shards, template, assunto, remetente):
+    global _shard
+    from sender import EmailDispatcher
+    from template_engine import compilar_template
+
+    dispatcher = EmailDispatcher()
+    dispatcher.logger.setLevel(configuracao['nivel_log'])
+    for nome in ('smtp_config', 'smtp_pool_config', 'dkim_config', 'domain', 'hostname', 'unsubscribe_email'):
+        setattr(dispatcher, nome, configuracao[nome])
+    dispatcher.rate_limiter = ShardRateLimiter(
+        coordenador,
+        shards,
+        global_rate=configuracao['global_rate'],
+        domain_limits=configuracao['domain_limits'],
+        default_domain_rate=configuracao['default_domain_rate']
+    )
+    # Recarrega o assinador com a configuração do processo principal
+    dispatcher.dkim_signer = None
+    dispatcher.carregar_dkim()
+    # Encerra as sessões SMTP do processo quando o executor é desligado
+    multiprocessing.util.Finalize(None, dispatcher.fechar_pool_smtp, exitpriority=10)
+    _shard = (dispatcher, compilar_template(template), compilar_template(assunto), remetente)
+    logging.getLogger(__name__).debug(f"Shard de envio iniciado (pid {os.getpid()})")
+
+
+def _enviar_lote(lote):
+    """Envia um lote no processo worker; retorna (pid, [(destinatario, resposta, erro)])"""
+    dispatcher, template, assunto, remetente = _shard
+    limitador = dispatcher.rate_limiter
+    resultados = []
+    liberados = limitador.liberar(lote, dominio=lambda destinatario: dominio_do_email(destinatario[0]))
+    for destinatario in liberados:
+        email, nome, primeiro_nome, campos, _ = destinatario
+        dominio = dominio_do_email(email)
+        try:
+            resposta = dispatcher.enviar_email(email, nome, assunto, template, remetente, campos, primeiro_nome)
+            limitador.registrar_sucesso(dominio)
+            resultados.append((destinatario, resposta, None))
+        except Exception as e:
+            if erro_temporario(e):
+                limitador.registrar_adiamento(dominio)
+            # Erros SMTP e de conexão voltam inteiros (a classificação decide a nova tentativa)
+            resultados.append((destinatario, None, e if classificar_erro(e) else resposta_do_erro(e)))
+    return os.getpid(), resultados
@@ -0,0 +1,425 @@
+import smtplib
+import socket
+import threading
+import time
+import queue
+import logging
+from contextlib import contextmanager
+
+
+# Erros que indicam que a sessão SMTP não pode mais ser usada
+ERROS_CONEXAO = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+
+
+def erro_de_conexao(erro):
+    """Indica se o erro derrubou a sessão (SMTPException também herda de OSError)"""
+    if isinstance(erro, ERROS_CONEXAO):
+        return True
+    return isinstance(erro, (socket.error, OSError)) and not isinstance(erro, smtplib.SMTPException)
+
+
+def resposta_do_erro(erro):
+    """Resposta SMTP ('550 texto') contida no erro, ou a descrição do erro se não houver"""
+    if isinstance(erro, smtplib.SMTPRecipientsRefused) and erro.recipients:
+        codigo, texto = next(iter(erro.recipients.values()))
+    elif isinstance(erro, smtplib.SMTPResponseException):
+        codigo, texto = erro.smtp_code, erro.smtp_error
+    else:
+        return str(erro)
+    if isinstance(texto, bytes):
+        texto = texto.decode('utf-8', 'replace')
+    return f"{codigo} {texto}"
+
+
+def _envelope(remetente, destinatarios, mail_options):
+    """MAIL FROM, RCPT TO e DATA de uma transação, prontos para um único write"""
+    opcoes = ''.join(f" {opcao}" for opcao in mail_options)
+    comandos = [f"MAIL FROM:<{remetente}>{opcoes}\r\n"]
+    comandos.extend(f"RCPT TO:<{destinatario}>\r\n" for destinatario in destinatarios)
+    comandos.append("DATA\r\n")
+    return ''.join(comandos).encode('ascii')
+
+
+def _conteudo(mensagem):
+    """Mensagem (bytes CRLF) com dot-stuffing e o terminador <CRLF>.<CRLF>"""
+    if mensagem.startswith(b'.'):
+        mensagem = b'.' + mensagem
+    if b'\n.' in mensagem:
+        mensagem = mensagem.replace(b'\n.', b'\n..')
+    if not mensagem.endswith(b'\r\n'):
+        mensagem += b'\r\n'
+    return mensagem + b'.\r\n'
+
+
+def _resposta(codigo, texto):
+    return f"{codigo} {texto.decode('utf-8', 'replace')}"
+
+
+class ClienteSMTP(smtplib.SMTP):
+    """smtplib.SMTP que guarda a resposta do servidor ao DATA (descartada por sendmail)"""
+
+    resposta_data = None
+    # O comando DATA já foi enviado na transação atual (zerado a cada transação pela sessão)
+    dados_enviados = False
+
+    def data(self, msg):
+        self.dados_enviados = True
+        self.resposta_data = super().data(msg)
+        return self.resposta_data
+
+    def enviar_pipeline(self, transacoes, mail_options=()):
+        """Envia as transações em sequência com PIPELINING (RFC 2920)
+
+        `transacoes` é uma lista de (remetente, destinatarios, mensagem em
+        bytes CRLF). O envelope (MAIL, RCPTs e DATA) vai em um único write e
+        o conteúdo de cada mensagem segue no mesmo write do envelope da
+        próxima: uma ida e volta por transação em vez de uma por comando.
+
+        Sem PIPELINING no servidor, as transações vão uma a uma (sendmail).
+        Retorna, por transação, [(destinatario, resposta, erro)]. Se a
+        conexão cair no meio, as transações restantes recebem o erro e a
+        conexão é fechada (o pool reconecta no próximo uso).
+        """
+        resultados = []
+        try:
+            if self.has_extn('pipelining'):
+                self._pipeline(transacoes, mail_options, resultados)
+            else:
+                self._uma_a_uma(transacoes, mail_options, resultados)
+        except OSError as e:
+            if not erro_de_conexao(e):
+                raise
+            self.close()
+            for _, destinatarios, _ in transacoes[len(resultados):]:
+                resultados.append([(destinatario, None, e) for destinatario in destinatarios])
+        return resultados
+
+    def _uma_a_uma(self, transacoes, mail_options, resultados):
+        for remetente, destinatarios, mensagem in transacoes:
+            # sendmail já faz RSET quando a transação falha
+            try:
+                recusados = self.sendmail(remetente, destinatarios, mensagem, mail_options)
+                resposta = _resposta(*self.resposta_data)
+            except smtplib.SMTPRecipientsRefused as e:
+                recusados, resposta = e.recipients, None
+            except smtplib.SMTPResponseException as e:
+                if erro_de_conexao(e):
+                    raise
+                resultados.append([(destinatario, None, e) for destinatario in destinatarios])
+                continue
+            resultados.append([
+                (destinatario, None, smtplib.SMTPRecipientsRefused({destinatario: recusados[destinatario]}))
+                if destinatario in recusados else (destinatario, resposta, None)
+                for destinatario in destinatarios
+            ])
+
+    def _pipeline(self, transacoes, mail_options, resultados):
+        self.send(_envelope(*transacoes[0][:2], mail_options))
+        for i, (remetente, destinatarios, mensagem) in enumerate(transacoes):
+            mail = self.getreply()
+            rcpts = [self.getreply() for _ in destinatarios]
+            data = self.getreply()
+
+            envio = _conteudo(mensagem) if data[0] == 354 else b'RSET\r\n'
+            if i + 1 < len(transacoes):
+                envio += _envelope(*transacoes[i + 1][:2], mail_options)
+            self.send(envio)
+            final = self.getreply()
+
+            resultado = []
+            for destinatario, rcpt in zip(destinatarios, rcpts):
+                if mail[0] != 250:
+                    erro = smtplib.SMTPSenderRefused(mail[0], mail[1], remetente)
+                elif rcpt[0] not in (250, 251):
+                    erro = smtplib.SMTPRecipientsRefused({destinatario: rcpt})
+                elif data[0] != 354:
+                    erro = smtplib.SMTPDataError(*data)
+                elif final[0] != 250:
+                    erro = smtplib.SMTPDataError(*final)
+                else:
+                    resultado.append((destinatario, _resposta(*final), None))
+                    continue
+                resultado.append((destinatario, None, erro))
+            resultados.append(resultado)
+
+
+class SessaoSMTP:
+    """Sessão SMTP persistente mantida pelo pool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.smtp = None
+        self.mensagens = 0
+        self.ultimo_uso = 0
+        self.em_transacao = False
+        self.dados_enviados = False
+
+    def conectar(self):
+        """Abre a conexão e executa o EHLO, medindo o tempo do handshake"""
+        inicio = time.perf_counter()
+        smtp = ClienteSMTP(
+            self.pool.host,
+            self.pool.port,
+            local_hostname=self.pool.local_hostname,
+            timeout=self.pool.timeout
+        )
+        smtp.ehlo()
+        self.pool.registrar_handshake(time.perf_counter() - inicio)
+        self.smtp = smtp
+        self.mensagens = 0
+        self.em_transacao = False
+        self.ultimo_uso = time.monotonic()
+
+    def fechar(self):
+        """Encerra a sessão com QUIT, ignorando erros de rede"""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+        self.smtp = None
+
+    def conectada(self):
+        return self.smtp is not None and self.smtp.sock is not None
+
+    def preparar(self):
+        """Garante uma sessão pronta para uma nova transação (RSET ou reconexão)"""
+        if not self.conectada():
+            self.conectar()
+            return
+        if self.mensagens >= self.pool.max_messages_per_connection:
+            self.fechar()
+            self.conectar()
+            return
+        if self.em_transacao or time.monotonic() - self.ultimo_uso > self.pool.idle_timeout:
+            try:
+                codigo = self.smtp.rset()[0]
+                if codigo != 250:
+                    raise smtplib.SMTPServerDisconnected(f"RSET retornou {codigo}")
+            except OSError as e:
+                if not erro_de_conexao(e):
+                    raise
+                self.pool.registrar_reconexao()
+                self.fechar()
+                self.conectar()
+
+    def _transacao(self, envio):
+        """Executa `envio(smtp)`; `dados_enviados` indica depois se o DATA chegou a sair"""
+        self.em_transacao = True
+        self.smtp.dados_enviados = False
+        try:
+            resultado = envio(self.smtp)
+        finally:
+            self.dados_enviados = self.smtp.dados_enviados
+        self.em_transacao = False
+        self.mensagens += 1
+        self.ultimo_uso = time.monotonic()
+        return resultado
+
+    def sendmail(self, remetente, destinatarios, mensagem, mail_options=()):
+        return self._transacao(lambda smtp: smtp.sendmail(remetente, destinatarios, mensagem, mail_options))
+
+    def enviar_pipeline(self, transacoes, mail_options=()):
+        """Várias transações nesta sessão (ver ClienteSMTP.enviar_pipeline)"""
+        self.em_transacao = True
+        resultados = self.smtp.enviar_pipeline(transacoes, mail_options)
+        self.em_transacao = False
+        self.mensagens += len(transacoes)
+        self.ultimo_uso = time.monotonic()
+        return resultados
+
+    def send_message(self, msg, remetente=None, destinatarios=None):
+        return self._transacao(lambda smtp: smtp.send_message(msg, remetente, destinatarios))
+
+
+class SMTPConnectionPool:
+    """Pool de sessões SMTP de longa duração reutilizadas entre mensagens"""
+
+    def __init__(self, host='localhost', port=25, timeout=30, size=4,
+                 max_messages_per_connection=100, idle_timeout=30, local_hostname=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.size = size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.local_hostname = local_hostname
+        self.logger = logging.getLogger(__name__)
+
+        # Sessões livres e limite de sessões abertas simultaneamente
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._sessoes = []
+        self._fechado = False
+        self._oito_bits = None
+
+        # Métricas do pool
+        self.metrics = {
+            'conexoes_criadas': 0,
+            'reutilizacoes': 0,
+            'reconexoes': 0,
+            'mensagens': 0,
+            'handshakes': 0,
+            'tempo_handshake_total': 0.0,
+            'tempo_handshake_max': 0.0
+        }
+
+    @classmethod
+    def from_config(cls, smtp_config, pool_config=None, local_hostname=None):
+        """Cria o pool a partir dos dicionários de configuração do EmailDispatcher"""
+        pool_config = pool_config or {}
+        return cls(
+            host=smtp_config['host'],
+            port=smtp_config['port'],
+            timeout=smtp_config.get('timeout', 30),
+            size=pool_config.get('size', 4),
+            max_messages_per_connection=pool_config.get('max_messages_per_connection', 100),
+            idle_timeout=pool_config.get('idle_timeout', 30),
+            local_hostname=local_hostname
+        )
+
+    def registrar_handshake(self, duracao):
+        with self._lock:
+            self.metrics['handshakes'] += 1
+            self.metrics['tempo_handshake_total'] += duracao
+            self.metrics['tempo_handshake_max'] = max(self.metrics['tempo_handshake_max'], duracao)
+
+    def registrar_reconexao(self):
+        with self._lock:
+            self.metrics['reconexoes'] += 1
+
+    def _obter_sessao(self):
+        """Retorna uma sessão livre ou cria uma nova dentro do limite do pool"""
+        if self._fechado:
+            raise RuntimeError("Pool SMTP fechado")
+        self._vagas.acquire()
+        sessao = None
+        try:
+            try:
+                sessao = self._livres.get_nowait()
+                reutilizada = sessao.conectada()
+            except queue.Empty:
+                sessao = SessaoSMTP(self)
+                reutilizada = False
+                with self._lock:
+                    self._sessoes.append(sessao)
+            if not reutilizada:
+                with self._lock:
+                    self.metrics['conexoes_criadas'] += 1
+            sessao.preparar()
+            if reutilizada:
+                with self._lock:
+                    self.metrics['reutilizacoes'] += 1
+            return sessao
+        except Exception:
+            if sessao is not None:
+                sessao.fechar()
+                self._livres.put(sessao)
+            self._vagas.release()
+            raise
+
+    def _devolver_sessao(self, sessao):
+        if self._fechado:
+            sessao.fechar()
+        else:
+            self._livres.put(sessao)
+        self._vagas.release()
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma sessão do pool durante o bloco with"""
+        sessao = self._obter_sessao()
+        try:
+            yield sessao
+        except OSError as e:
+            # Sessão quebrada: descarta para que o próximo uso reconecte
+            if erro_de_conexao(e):
+                sessao.fechar()
+            raise
+        finally:
+            self._devolver_sessao(sessao)
+
+    def _enviar(self, operacao):
+        """Executa a operação de envio, reconectando uma vez se a sessão cair antes do DATA
+
+        Se a queda vier depois do DATA, o servidor pode ter aceitado a
+        mensagem: o erro sobe sem nova tentativa imediata (a RetryQueue do
+        dispatcher decide), para não entregar a mesma mensagem duas vezes.
+        """
+        for tentativa in range(2):
+            sessao = None
+            try:
+                with self.connection() as sessao:
+                    resultado = operacao(sessao)
+                with self._lock:
+                    self.metrics['mensagens'] += 1
+                return resultado
+            except OSError as e:
+                if tentativa == 1 or not erro_de_conexao(e) or (sessao is not None and sessao.dados_enviados):
+                    raise
+                self.logger.warning(f"Conexão SMTP perdida ({str(e)}), reconectando...")
+                self.registrar_reconexao()
+
+    def send_message(self, msg, remetente=None, destinatarios=None):
+        """Envia um objeto Message usando uma sessão do pool"""
+        return self._enviar(lambda sessao: sessao.send_message(msg, remetente, destinatarios))
+
+    def sendmail(self, remetente, destinatarios, mensagem):
+        """Envia bytes já serializados usando uma sessão do pool"""
+        return self._enviar(lambda sessao: sessao.sendmail(remetente, destinatarios, mensagem))
+
+    def enviar_bytes(self, remetente, destinatarios, mensagem, mail_options=()):
+        """Como sendmail, mas retorna a resposta do servidor ao DATA (ex.: '250 2.0.0 Ok: queued')"""
+        def operacao(sessao):
+            sessao.sendmail(remetente, destinatarios, mensagem, mail_options)
+            codigo, texto = sessao.smtp.resposta_data
+            return f"{codigo} {texto.decode('utf-8', 'replace')}"
+        return self._enviar(operacao)
+
+    def enviar_pipeline(self, transacoes, mail_options=()):
+        """Envia um lote de transações por uma única sessão (ver ClienteSMTP.enviar_pipeline)"""
+        with self.connection() as sessao:
+            resultados = sessao.enviar_pipeline(transacoes, mail_options)
+        with self._lock:
+            self.metrics['mensagens'] += len(transacoes)
+        return resultados
+
+    def suporta_8bitmime(self):
+        """Indica se o servidor anuncia 8BITMIME no EHLO (consultado uma vez; False se não conectar)"""
+        if self._oito_bits is None:
+            try:
+                with self.connection() as sessao:
+                    self._oito_bits = sessao.smtp.has_extn('8bitmime')
+            except OSError as e:
+                self.logger.warning(f"Não foi possível consultar as extensões SMTP: {e}")
+                return False
+        return self._oito_bits
+
+    def get_metrics(self):
+        """Retorna uma cópia das métricas do pool"""
+        with self._lock:
+            metrics = dict(self.metrics)
+        handshakes = metrics['handshakes']
+        metrics['tempo_handshake_medio'] = metrics['tempo_handshake_total'] / handshakes if handshakes else 0.0
+        metrics['sessoes_abertas'] = sum(1 for s in self._sessoes if s.conectada())
+        return metrics
+
+    def close(self):
+        """Fecha todas as sessões do pool"""
+        self._fechado = True
+        with self._lock:
+            sessoes = list(self._sessoes)
+            self._sessoes = []
+        for sessao in sessoes:
+            sessao.fechar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,280 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from rate_limiter import codigo_smtp
+
+
+# Snapshot lido pelo dashboard (servido como arquivo estático)
+ARQUIVO_ESTATISTICAS = 'email_stats.json'
+
+# Histórico das campanhas finalizadas
+DB_ESTATISTICAS = 'email_stats.db'
+
+# Erros recentes guardados por campanha (os mais antigos são descartados)
+LIMITE_ERROS = 100
+
+SCHEMA_ESTATISTICAS = '''
+    CREATE TABLE IF NOT EXISTS campaign_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        campanha_id INTEGER,
+        status TEXT NOT NULL,
+        inicio TEXT,
+        fim TEXT,
+        total INTEGER NOT NULL DEFAULT 0,
+        enviados INTEGER NOT NULL DEFAULT 0,
+        falhas INTEGER NOT NULL DEFAULT 0,
+        invalidos INTEGER NOT NULL DEFAULT 0,
+        duplicados INTEGER NOT NULL DEFAULT 0,
+        blacklist INTEGER NOT NULL DEFAULT 0,
+        retomados INTEGER NOT NULL DEFAULT 0,
+        classes_erro TEXT,
+        erros TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_campaign_stats_campanha ON campaign_stats(campanha_id);
+'''
+
+CONTADORES = ('total', 'enviados', 'falhas', 'invalidos', 'duplicados', 'blacklist', 'retomados')
+
+
+def novas_estatisticas(campanha_id=None, limite_erros=LIMITE_ERROS):
+    """Registro de estatísticas de uma campanha que está começando"""
+    return {
+        'campanha_id': campanha_id,
+        'total': 0,
+        'enviados': 0,
+        'falhas': 0,
+        'invalidos': 0,
+        'duplicados': 0,
+        'blacklist': 0,
+        'retomados': 0,
+        'retentativas': 0,
+        'status': 'enviando',
+        'inicio': datetime.now().isoformat(),
+        'fim': None,
+        'erros': deque(maxlen=limite_erros),
+        'classes_erro': {}
+    }
+
+
+def estatisticas_vazias():
+    """Estatísticas exibidas antes do primeiro envio"""
+    return {
+        'total': 0,
+        'enviados': 0,
+        'falhas': 0,
+        'invalidos': 0,
+        'status': 'aguardando',
+        'inicio': None,
+        'fim': None,
+        'erros': [],
+        'classes_erro': {}
+    }
+
+
+def classe_do_erro(erro):
+    """Agrupa o erro pelo código SMTP ('550') ou, sem código, pelo tipo da exceção
+
+    Aceita também a resposta já formatada ('550 texto'), como chega dos shards.
+    """
+    if isinstance(erro, BaseException):
+        codigo = codigo_smtp(erro)
+        return str(codigo) if codigo is not None else type(erro).__name__
+    codigo = str(erro)[:3]
+    return codigo if codigo.isdigit() else 'outro'
+
+
+def registrar_erro(stats, descricao, erro):
+    """Guarda a descrição no buffer de erros recentes e conta a classe do erro"""
+    stats['erros'].append(descricao)
+    classes = stats['classes_erro']
+    classe = classe_do_erro(erro)
+    classes[classe] = classes.get(classe, 0) + 1
+
+
+def copiar(stats):
+    """Cópia serializável (as listas e contadores não mudam depois de copiados)"""
+    return dict(stats, erros=list(stats.get('erros', ())), classes_erro=dict(stats.get('classes_erro', {})))
+
+
+def agregar(registros, limite_erros=LIMITE_ERROS):
+    """Soma de várias campanhas, no mesmo formato do registro de uma só
+
+    `campanhas` traz a cópia de cada campanha somada; `campanha_id` é None.
+    """
+    registros = [copiar(stats) for stats in registros]
+    if not registros:
+        return dict(estatisticas_vazias(), campanha_id=None, campanhas=[])
+    agregado = {contador: sum(stats.get(contador, 0) for stats in registros) for contador in CONTADORES}
+    agregado['retentativas'] = sum(stats.get('retentativas', 0) for stats in registros)
+    em_andamento = any(stats['status'] == 'enviando' for stats in registros)
+    finais = [stats['fim'] for stats in registros if stats.get('fim')]
+    classes = {}
+    for stats in registros:
+        for classe, quantidade in stats['classes_erro'].items():
+            classes[classe] = classes.get(classe, 0) + quantidade
+    agregado.update(
+        campanha_id=None,
+        status='enviando' if em_andamento else registros[-1]['status'],
+        inicio=min((stats['inicio'] for stats in registros if stats.get('inicio')), default=None),
+        fim=None if em_andamento else max(finais, default=None),
+        erros=[erro for stats in registros for erro in stats['erros']][-limite_erros:],
+        classes_erro=classes,
+        campanhas=registros
+    )
+    return agregado
+
+
+class StatsRecorder:
+    """Estatísticas ao vivo das campanhas, snapshot em disco e histórico em SQLite
+
+    Os contadores ficam só em memória: `publicar` apenas registra as
+    campanhas em andamento (várias ao mesmo tempo, ex.: um teste durante
+    um envio em massa), e o snapshot JSON com o agregado delas é regravado
+    no máximo a cada `intervalo` segundos (write + rename, então quem lê
+    nunca vê um arquivo pela metade). Campanhas encerradas continuam
+    visíveis até a próxima começar. Ao final de cada campanha, `finalizar`
+    grava o snapshot e uma linha no histórico. `/api/stats` lê `atual()`,
+    sem disco.
+    """
+
+    _compartilhados = {}
+    _lock_compartilhados = threading.Lock()
+
+    def __init__(self, arquivo=ARQUIVO_ESTATISTICAS, db_path=DB_ESTATISTICAS, intervalo=2.0):
+        self.arquivo = arquivo
+        self.db_path = db_path
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._lock_arquivo = threading.Lock()
+        self._conn = None
+        # Estatísticas ao vivo por campanha, na ordem em que começaram
+        self._ao_vivo = {}
+        self._snapshot = None
+        self._ultimo_snapshot = 0.0
+
+    @classmethod
+    def compartilhado(cls, arquivo=ARQUIVO_ESTATISTICAS, db_path=DB_ESTATISTICAS):
+        """Instância única por arquivo no processo (dispatcher, scheduler e servidor)"""
+        with cls._lock_compartilhados:
+            gravador = cls._compartilhados.get((arquivo, db_path))
+            if gravador is None:
+                gravador = cls(arquivo, db_path)
+                cls._compartilhados[(arquivo, db_path)] = gravador
+            return gravador
+
+    def _conexao(self):
+        # Chamado com o lock adquirido
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA_ESTATISTICAS)
+            self._conn.commit()
+        return self._conn
+
+    def publicar(self, stats, forcar=False):
+        """Registra `stats` entre as campanhas ao vivo; grava o snapshot se o intervalo venceu"""
+        agora = time.monotonic()
+        with self._lock:
+            if id(stats) not in self._ao_vivo:
+                # Campanha nova: as já encerradas saem do ao vivo (estão no histórico)
+                for chave, registro in list(self._ao_vivo.items()):
+                    if registro['status'] != 'enviando':
+                        del self._ao_vivo[chave]
+                self._ao_vivo[id(stats)] = stats
+            if not forcar and agora - self._ultimo_snapshot < self.intervalo:
+                return
+            self._ultimo_snapshot = agora
+            registros = list(self._ao_vivo.values())
+        self.gravar_snapshot(agregar(registros))
+
+    def gravar_snapshot(self, stats):
+        """Grava o JSON em um arquivo temporário e troca de nome (atômico)"""
+        temporario = f"{self.arquivo}.{os.getpid()}.tmp"
+        try:
+            with self._lock_arquivo:
+                with open(temporario, 'w') as f:
+                    json.dump(copiar(stats), f)
+                os.replace(temporario, self.arquivo)
+        except Exception as e:
+            print(f"Erro ao salvar estatísticas: {e}")
+
+    def finalizar(self, stats, campanha_id=None):
+        """Grava o snapshot final e a linha da campanha no histórico"""
+        self.publicar(stats, forcar=True)
+        registro = copiar(stats)
+        try:
+            with self._lock:
+                conn = self._conexao()
+                conn.execute(
+                    'INSERT INTO campaign_stats (campanha_id, status, inicio, fim, total, enviados, falhas, '
+                    'invalidos, duplicados, blacklist, retomados, classes_erro, erros) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (campanha_id, registro['status'], registro['inicio'], registro['fim'],
+                     *(registro.get(contador, 0) for contador in CONTADORES),
+                     json.dumps(registro['classes_erro']), json.dumps(registro['erros']))
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"Erro ao gravar histórico de estatísticas: {e}")
+
+    def atual(self, campanha_id=None):
+        """Estatísticas ao vivo de uma campanha ou, sem `campanha_id`, o agregado das campanhas ao vivo
+
+        Uma campanha que não está mais ao vivo sai do histórico (None se
+        não existir). Sem campanhas neste processo, o agregado é o último
+        snapshot gravado.
+        """
+        with self._lock:
+            registros = list(self._ao_vivo.values())
+        if campanha_id is not None:
+            campanha_id = int(campanha_id)
+            for stats in reversed(registros):
+                if stats.get('campanha_id') == campanha_id:
+                    return copiar(stats)
+            linhas, _ = self.historico(limit=1, campanha_id=campanha_id)
+            return linhas[0] if linhas else None
+        if registros:
+            return agregar(registros)
+        with self._lock:
+            stats = self._snapshot
+        if stats is None:
+            # Nenhuma campanha neste processo: usa o último snapshot, lido uma vez
+            try:
+                with open(self.arquivo, 'r') as f:
+                    stats = json.load(f)
+            except (FileNotFoundError, ValueError):
+                stats = estatisticas_vazias()
+            stats.setdefault('classes_erro', {})
+            with self._lock:
+                self._snapshot = stats
+        return copiar(stats)
+
+    def historico(self, limit=50, offset=0, campanha_id=None):
+        """Campanhas finalizadas (mais recentes primeiro) e o total, para paginação"""
+        limit = max(0, min(int(limit), 500))
+        offset = max(0, int(offset))
+        filtro, parametros = ('WHERE campanha_id = ?', (int(campanha_id),)) if campanha_id is not None else ('', ())
+        with self._lock:
+            conn = self._conexao()
+            total = conn.execute(f'SELECT COUNT(*) FROM campaign_stats {filtro}', parametros).fetchone()[0]
+            cursor = conn.execute(
+                f'SELECT * FROM campaign_stats {filtro} ORDER BY id DESC LIMIT ? OFFSET ?',
+                (*parametros, limit, offset)
+            )
+            colunas = [descricao[0] for descricao in cursor.description]
+            linhas = [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+        for linha in linhas:
+            linha['classes_erro'] = json.loads(linha['classes_erro'] or '{}')
+            linha['erros'] = json.loads(linha['erros'] or '[]')
+        return linhas, total
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,180 @@
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+import pandas as pd
+
+
+# {nome}, {primeiro_nome}, {COLUNA} ou {{ unsubscribe }}
+PADRAO_PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}|\{(\w+)\}')
+
+# Conversão HTML -> texto
+TAGS_IGNORADAS = {'style', 'script', 'head', 'title'}
+TAGS_BLOCO = {
+    'p', 'div', 'br', 'tr', 'li', 'ul', 'ol', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'blockquote', 'section', 'header', 'footer', 'center'
+}
+ESPACOS = re.compile(r'[ \t\r\f\v\xa0]+')
+LINHAS_VAZIAS = re.compile(r'\n\s*\n\s*(\n\s*)+')
+
+
+class _ConversorTexto(HTMLParser):
+    """Extrai o texto visível do HTML, com links no formato 'texto (url)'"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.partes = []
+        self.ignorando = 0
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in TAGS_IGNORADAS:
+            self.ignorando += 1
+        elif tag in TAGS_BLOCO:
+            self.partes.append('\n')
+        elif tag == 'a':
+            href = dict(attrs).get('href') or ''
+            self.links.append((href, len(self.partes)))
+        elif tag == 'td':
+            self.partes.append(' ')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in TAGS_BLOCO:
+            self.partes.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in TAGS_IGNORADAS:
+            self.ignorando = max(0, self.ignorando - 1)
+        elif tag in TAGS_BLOCO:
+            self.partes.append('\n')
+        elif tag == 'a' and self.links:
+            href, inicio = self.links.pop()
+            texto = ''.join(self.partes[inicio:]).strip()
+            if href and not href.startswith(('#', 'mailto:')) and href != texto:
+                self.partes.append(f' ({href})')
+
+    def handle_data(self, data):
+        if not self.ignorando:
+            self.partes.append(data)
+
+
+def html_para_texto(html):
+    """Converte HTML em texto simples (remove style/script, decodifica entidades e normaliza espaços)"""
+    conversor = _ConversorTexto()
+    conversor.feed(html)
+    conversor.close()
+    texto = ESPACOS.sub(' ', ''.join(conversor.partes))
+    linhas = [linha.strip() for linha in texto.split('\n')]
+    texto = '\n'.join(linhas)
+    return LINHAS_VAZIAS.sub('\n\n', texto).strip()
+
+
+class CompiledTemplate:
+    """Template pré-processado em segmentos literais e posições de placeholders
+
+    A renderização copia a lista de partes, preenche apenas as posições dos
+    placeholders e faz um único join. Placeholders sem valor conhecido são
+    mantidos como estavam no texto original.
+    """
+
+    def __init__(self, texto):
+        self.texto = texto
+        self.partes = []
+        self.slots = []  # (posição em partes, nome, coluna, texto original)
+
+        inicio = 0
+        for match in PADRAO_PLACEHOLDER.finditer(texto):
+            if match.start() > inicio:
+                self.partes.append(texto[inicio:match.start()])
+            nome = match.group(1) or match.group(2)
+            # As colunas da lista chegam em maiúsculas: {cidade} também busca CIDADE
+            self.slots.append((len(self.partes), nome, nome.upper(), match.group(0)))
+            self.partes.append(match.group(0))
+            inicio = match.end()
+        if inicio < len(texto):
+            self.partes.append(texto[inicio:])
+
+        self.placeholders = frozenset(nome for _, nome, _, _ in self.slots)
+        self._texto_alternativo = None
+
+    @property
+    def texto_alternativo(self):
+        """Versão text/plain do template, convertida uma vez e com os placeholders preservados"""
+        if self._texto_alternativo is None:
+            self._texto_alternativo = CompiledTemplate(html_para_texto(self.texto))
+        return self._texto_alternativo
+
+    def render(self, valores, extras=None):
+        """Renderiza com os valores informados; `extras` (dict ou linha do CSV) cobre os demais campos"""
+        if not self.slots:
+            return self.texto
+        partes = self.partes[:]
+        for posicao, nome, coluna, original in self.slots:
+            valor = _valor(nome, coluna, valores, extras)
+            if valor is not None:
+                partes[posicao] = str(valor)
+        return ''.join(partes)
+
+    def codificado(self, encoding='utf-8', linesep='\r\n'):
+        """Versão com os segmentos literais já codificados em bytes (ver EncodedTemplate)"""
+        return EncodedTemplate(self, encoding, linesep)
+
+    def __contains__(self, nome):
+        return nome in self.placeholders
+
+
+class EncodedTemplate:
+    """Template compilado cujos segmentos literais já estão em bytes, com quebras `linesep`
+
+    A renderização codifica apenas os valores dos placeholders e faz um
+    único join de bytes: o corpo não passa por uma string intermediária.
+    """
+
+    def __init__(self, compilado, encoding='utf-8', linesep='\r\n'):
+        self.encoding = encoding
+        self.linesep = linesep
+        self.slots = compilado.slots
+        self.partes = [self._codificar(parte) for parte in compilado.partes]
+        self.placeholders = compilado.placeholders
+
+        # Texto fixo (sem placeholders): qualquer linha renderizada tem no máximo
+        # linha_maxima + (tamanho renderizado - tamanho_literal) bytes
+        posicoes = {posicao for posicao, _, _, _ in self.slots}
+        literal = b''.join(parte for i, parte in enumerate(self.partes) if i not in posicoes)
+        self.tamanho_literal = len(literal)
+        self.linha_maxima = max(map(len, literal.split(linesep.encode(encoding))))
+
+    def _codificar(self, texto):
+        if '\n' in texto:
+            texto = texto.replace('\r\n', '\n').replace('\n', self.linesep)
+        return texto.encode(self.encoding)
+
+    def render(self, valores, extras=None):
+        partes = self.partes[:]
+        for posicao, nome, coluna, original in self.slots:
+            valor = _valor(nome, coluna, valores, extras)
+            if valor is not None:
+                partes[posicao] = self._codificar(str(valor))
+        return b''.join(partes)
+
+
+def _valor(nome, coluna, valores, extras):
+    """Valor do placeholder `nome`; `coluna` (nome em maiúsculas) cobre {email}, {cidade} etc."""
+    valor = valores.get(nome)
+    if valor is None:
+        valor = valores.get(coluna)
+    if valor is None and extras is not None:
+        chave = nome if nome in extras else coluna
+        if chave not in extras:
+            return None
+        valor = extras[chave]
+        # Célula vazia: NaN, None ou pd.NA, conforme o dtype da coluna
+        if pd.api.types.is_scalar(valor) and pd.isna(valor):
+            valor = ''
+    return valor
+
+
+@lru_cache(maxsize=64)
+def compilar_template(texto):
+    """Compila um template (o resultado fica em cache para o mesmo texto)"""
+    return CompiledTemplate(texto)
@@ -0,0 +1,66 @@
+"""Campanha em lotes (preparar_campanha / enviar_lote / concluir_campanha)
+
+Uso: python -m pytest tests
+"""
+import os
+import smtplib
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from sender import EmailDispatcher  # noqa: E402
+from stats import StatsRecorder  # noqa: E402
+
+
+class PoolFalso:
+    """Aceita tudo, exceto a primeira tentativa dos endereços em `adiar` (451)"""
+
+    def __init__(self, adiar=()):
+        self.adiar = set(adiar)
+        self.entregues = []
+
+    def enviar_bytes(self, envelope, destinatarios, dados, mail_options=()):
+        email = destinatarios[0]
+        if email in self.adiar:
+            self.adiar.discard(email)
+            raise smtplib.SMTPDataError(451, b'tente mais tarde')
+        self.entregues.append(email)
+        return '250 ok'
+
+
+@pytest.fixture
+def dispatcher(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'template.html').write_text('<p>Oi {nome}</p>', encoding='utf-8')
+    dispatcher = EmailDispatcher()
+    dispatcher.retry_config.update(espera_inicial=0.05)
+    dispatcher.estatisticas = StatsRecorder(str(tmp_path / 'stats.json'), str(tmp_path / 'stats.db'), intervalo=0)
+    yield dispatcher
+    dispatcher.estatisticas.close()
+
+
+def test_concluir_campanha_envia_retentativas_e_finaliza_estatisticas(dispatcher):
+    contexto = dispatcher.preparar_campanha('template.html', 'Oi', 'Blazee <x@example.com>', campanha_id=7)
+    pool = contexto.smtp_pool = PoolFalso(adiar={'adiado@example.com'})
+    assert dispatcher.estatisticas.atual(7)['status'] == 'enviando'
+
+    resultados = dispatcher.enviar_lote(
+        [{'EMAIL': 'adiado@example.com', 'NOME': 'A'}, {'EMAIL': 'b@example.com', 'NOME': 'B'}], contexto
+    )
+    # O lote não espera a nova tentativa
+    assert [email for email, _, _ in resultados] == ['b@example.com']
+    assert len(contexto.retentativas) == 1
+
+    resultados = dispatcher.concluir_campanha(contexto)
+    assert [email for email, _, erro in resultados if erro is None] == ['adiado@example.com']
+    assert sorted(pool.entregues) == ['adiado@example.com', 'b@example.com']
+
+    stats = dispatcher.estatisticas.atual(7)
+    assert stats['status'] == 'concluido' and stats['fim'] is not None
+    assert (stats['enviados'], stats['retentativas']) == (2, 1)
+    assert dispatcher.estatisticas.atual()['status'] == 'concluido'
+    historico, total = dispatcher.estatisticas.historico(campanha_id=7)
+    assert total == 1 and historico[0]['enviados'] == 2
@@ -0,0 +1,128 @@
+"""Blacklist: gravação avulsa x importação e consulta pelo índice
+
+Uso: python -m pytest tests
+"""
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from blacklist import BlacklistIndex, BlacklistStore  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'blacklist.db')
+
+
+@pytest.fixture
+def store(db_path):
+    indice = BlacklistIndex(db_path)
+    store = BlacklistStore(db_path, indice=indice)
+    yield store
+    store.close()
+    indice.close()
+
+
+def linha(db_path, email):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT reason, campaign_id FROM invalid_emails WHERE email = ?', (email,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_adicionar_atualiza_motivo_de_quem_ja_estava(store, db_path):
+    store.adicionar('a@example.com', 'bounce', campanha_id='1', aguardar=True)
+    store.adicionar('a@example.com', 'unsubscribe', campanha_id='2', aguardar=True)
+    assert linha(db_path, 'a@example.com') == ('unsubscribe', '2')
+
+
+def test_importar_nao_sobrescreve_e_conta_so_os_novos(store, db_path):
+    store.adicionar('a@example.com', 'unsubscribe', aguardar=True)
+    assert store.importar(['a@example.com', 'b@example.com', 'b@example.com'], 'importado') == 1
+    assert linha(db_path, 'a@example.com') == ('unsubscribe', None)
+    assert linha(db_path, 'b@example.com') == ('importado', None)
+
+
+@pytest.mark.parametrize('bloom_threshold', [2_000_000, 0])
+def test_mascara_com_set_e_com_filtro_de_bloom(store, db_path, bloom_threshold):
+    store.importar([f'bloqueado{i}@example.com' for i in range(1200)], 'importado')
+    indice = BlacklistIndex(db_path, bloom_threshold=bloom_threshold)
+    try:
+        indice.carregar()
+        assert (indice._bloom is not None) == (bloom_threshold == 0)
+        emails = pd.Series(
+            [f'bloqueado{i}@example.com' for i in range(0, 1200, 2)]
+            + [f'livre{i}@example.com' for i in range(600)]
+            + ['bloqueado0@example.com', None]
+        )
+        mascara = indice.mascara(emails)
+        assert mascara.dtype == bool
+        assert mascara.tolist() == [True] * 600 + [False] * 600 + [True, False]
+    finally:
+        indice.close()
+
+
+def test_importar_csv_pela_coluna_do_cabecalho(store, tmp_path):
+    caminho = tmp_path / 'lista.csv'
+    caminho.write_text('nome,Email\nAna,ANA@example.com\nBia,invalido\n', encoding='utf-8')
+    contagem = store.importar_csv(str(caminho), 'importado', coluna='email')
+    assert (contagem['linhas'], contagem['invalidos'], contagem['inseridos']) == (2, 1, 1)
+    assert store.indice.contem('ana@example.com')
+
+
+def test_importar_csv_sem_cabecalho_usa_a_primeira_coluna(store, tmp_path):
+    caminho = tmp_path / 'lista.csv'
+    caminho.write_text('a@example.com\nb@example.com\n', encoding='utf-8')
+    assert store.importar_csv(str(caminho), 'importado')['inseridos'] == 2
+
+
+def test_importar_csv_coluna_inexistente(store, tmp_path):
+    caminho = tmp_path / 'lista.csv'
+    caminho.write_text('nome,contato\nAna,ana@example.com\n', encoding='utf-8')
+    with pytest.raises(ValueError, match='nome, contato'):
+        store.importar_csv(str(caminho), 'importado')
+    assert store.get_metrics()['importados'] == 0
+
+
+def test_adicoes_sem_aguardar_vao_em_um_unico_commit(db_path):
+    indice = BlacklistIndex(db_path)
+    indice.carregar()
+    store = BlacklistStore(db_path, intervalo=0.5, indice=indice)
+    try:
+        for i in range(50):
+            store.adicionar(f'bounce{i}@example.com', 'bounce')
+        # Publicado no índice antes do commit: as campanhas já deixam de enviar
+        assert indice.contem('bounce49@example.com')
+        store.sincronizar(timeout=5)
+        metrics = store.get_metrics()
+        assert (metrics['enfileirados'], metrics['gravados'], metrics['commits']) == (50, 50, 1)
+        assert linha(db_path, 'bounce0@example.com') == ('bounce', None)
+    finally:
+        store.close()
+        indice.close()
+
+
+def test_grupo_limitado_pelo_lote(db_path):
+    indice = BlacklistIndex(db_path)
+    store = BlacklistStore(db_path, intervalo=0.5, lote=10, indice=indice)
+    try:
+        for i in range(25):
+            store.adicionar(f'bounce{i}@example.com', 'bounce')
+        store.sincronizar(timeout=5)
+        assert store.get_metrics()['commits'] == 3
+    finally:
+        store.close()
+        indice.close()
+
+
+def test_aguardar_nao_espera_o_fim_do_intervalo(store, db_path):
+    store.intervalo = 30
+    store.adicionar('a@example.com', 'unsubscribe', aguardar=True)
+    assert linha(db_path, 'a@example.com') == ('unsubscribe', None)
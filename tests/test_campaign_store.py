@@ -0,0 +1,83 @@
+"""Máquina de estados e consultas de vencimento do CampaignStore
+
+Uso: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from campaign_store import CampaignStore, calcular_vencimento  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CampaignStore(str(tmp_path / 'campaigns.db'))
+    yield store
+    store.close()
+
+
+def criar(store, horario='2030-01-01 10:00:00'):
+    return store.criar('promocional', 'oferta.html', 'Oferta', horario)
+
+
+def test_fluxo_normal(store):
+    campanha = criar(store)
+    assert campanha['status'] == 'pendente'
+    assert store.transicionar(campanha['id'], 'enviando')
+    assert store.transicionar(campanha['id'], 'concluido')
+    assert store.obter(campanha['id'])['status'] == 'concluido'
+
+
+@pytest.mark.parametrize('caminho, invalida', [
+    ([], 'concluido'),
+    (['enviando'], 'cancelado'),
+    (['cancelado'], 'enviando'),
+    (['enviando', 'concluido'], 'erro'),
+    (['erro'], 'enviando'),
+])
+def test_transicao_invalida_nao_altera(store, caminho, invalida):
+    campanha = criar(store)
+    for status in caminho:
+        assert store.transicionar(campanha['id'], status)
+    assert not store.transicionar(campanha['id'], invalida)
+    assert store.obter(campanha['id'])['status'] == (caminho[-1] if caminho else 'pendente')
+
+
+def test_status_desconhecido(store):
+    with pytest.raises(ValueError):
+        store.transicionar(criar(store)['id'], 'pendente')
+
+
+def test_erro_guarda_a_mensagem(store):
+    campanha = criar(store)
+    store.transicionar(campanha['id'], 'enviando')
+    assert store.transicionar(campanha['id'], 'erro', error='SMTP indisponível')
+    assert store.obter(campanha['id'])['error'] == 'SMTP indisponível'
+    assert not store.cancelar(campanha['id'])
+
+
+def test_vencidas_e_proximo_vencimento(store):
+    antiga = criar(store, '2020-01-01 08:00:00')
+    recente = criar(store, '2020-01-01 09:00:00')
+    futura = criar(store, '2030-01-01 10:00:00')
+    cancelada = criar(store, '2019-01-01 08:00:00')
+    store.cancelar(cancelada['id'])
+
+    assert [c['id'] for c in store.vencidas()] == [antiga['id'], recente['id']]
+    assert [c['id'] for c in store.vencidas(ignorar=[antiga['id']])] == [recente['id']]
+    assert store.proximo_vencimento() == calcular_vencimento('2020-01-01 08:00:00')
+    assert store.proximo_vencimento(ignorar=[antiga['id'], recente['id']]) == calcular_vencimento(futura['datetime'])
+
+
+def test_recuperar_interrompidas_volta_para_pendente(store):
+    campanha = criar(store)
+    store.transicionar(campanha['id'], 'enviando')
+    assert store.recuperar_interrompidas() == 1
+    registro = store.obter(campanha['id'])
+    assert registro['status'] == 'pendente' and registro['error']
+    # Retomada: pode voltar a ser disparada
+    assert store.transicionar(campanha['id'], 'enviando')
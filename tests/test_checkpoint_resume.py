@@ -0,0 +1,79 @@
+"""Retomada de campanha pelo log de checkpoint depois de o processo morrer
+
+Uso: python -m pytest tests
+"""
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from checkpoint import ENVIADO, CheckpointLog  # noqa: E402
+
+EMAILS = [f'cliente{i}@example.com' for i in range(120)]
+
+# Envia a campanha 1 com um envio de mentira que anota cada email entregue;
+# com um limite, o processo morre (os._exit, sem finally) antes do envio seguinte
+CAMPANHA = '''
+import os, sys
+sys.path.insert(0, {raiz!r})
+from rate_limiter import DomainRateLimiter
+from sender import EmailDispatcher
+
+limite = int(sys.argv[1])
+dispatcher = EmailDispatcher()
+dispatcher.rate_limiter = DomainRateLimiter(global_rate=1_000_000, domain_limits={{}})
+entregues = open('entregues.txt', 'a')
+enviados = 0
+
+def enviar_email(email, *args, **kwargs):
+    global enviados
+    if limite and enviados >= limite:
+        os._exit(1)
+    entregues.write(email + '\\n')
+    entregues.flush()
+    enviados += 1
+    return '250 ok'
+
+dispatcher.enviar_email = enviar_email
+ok = dispatcher.enviar_emails('lista.csv', 'template.html', '2000-01-01 00:00:00', 'Oi', 'x@example.com',
+                              modo='sequencial', campanha_id=1)
+sys.exit(0 if ok else 2)
+'''
+
+
+def executar(tmp_path, limite=0):
+    script = CAMPANHA.format(raiz=RAIZ)
+    return subprocess.run([sys.executable, '-c', script, str(limite)], cwd=tmp_path, capture_output=True).returncode
+
+
+def test_retomada_depois_de_morrer_nao_reenvia(tmp_path):
+    (tmp_path / 'lista.csv').write_text('EMAIL,NOME\n' + ''.join(f'{email},Cliente\n' for email in EMAILS))
+    (tmp_path / 'template.html').write_text('<p>Oi {nome}</p>')
+    (tmp_path / 'entregues.txt').write_text('')
+    log = tmp_path / 'checkpoints' / 'campanha_1.log'
+
+    assert executar(tmp_path, limite=45) == 1
+    assert log.exists()
+    assert len((tmp_path / 'entregues.txt').read_text().split()) == 45
+
+    assert executar(tmp_path) == 0
+    entregues = (tmp_path / 'entregues.txt').read_text().split()
+    assert sorted(entregues) == sorted(EMAILS)
+    # Concluída, a campanha não deixa log para uma execução futura com o mesmo id
+    assert not log.exists()
+
+
+def test_log_descartado_quando_a_lista_muda(tmp_path):
+    lista = tmp_path / 'lista.csv'
+    lista.write_text('EMAIL\na@example.com\n')
+    with CheckpointLog.da_campanha(1, lista, diretorio=tmp_path) as checkpoint:
+        checkpoint.registrar(0, ENVIADO, '250 ok')
+    with CheckpointLog.da_campanha(1, lista, diretorio=tmp_path) as checkpoint:
+        assert 0 in checkpoint.concluidos and checkpoint.registros_anteriores == 1
+
+    lista.write_text('EMAIL\nb@example.com\nc@example.com\n')
+    with CheckpointLog.da_campanha(1, lista, diretorio=tmp_path) as checkpoint:
+        assert len(checkpoint.concluidos) == 0 and checkpoint.registros_anteriores == 0
+    assert (tmp_path / 'campanha_1.descartado').exists()
@@ -0,0 +1,54 @@
+"""Cache colunar das listas: leitura equivalente ao CSV e reimportação com leitores abertos
+
+Uso: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import list_cache  # noqa: E402
+from list_cache import ListaImportada, abrir_lista, diretorio_cache  # noqa: E402
+from list_reader import ListaCSV  # noqa: E402
+
+
+def escrever_lista(path, quantidade, cidade='Recife'):
+    linhas = ['EMAIL,Nome,Cidade']
+    for i in range(quantidade):
+        # Células vazias e acentos precisam sobreviver ao formato colunar
+        linhas.append(f'cliente{i}@example.com,Cliente {i},{"" if i % 7 == 0 else cidade}')
+    path.write_text('\n'.join(linhas) + '\n', encoding='utf-8')
+
+
+@pytest.fixture(autouse=True)
+def sem_tamanho_minimo(monkeypatch):
+    monkeypatch.setattr(list_cache, 'TAMANHO_MINIMO_CACHE', 0)
+
+
+def test_blocos_iguais_aos_do_csv(tmp_path):
+    path = tmp_path / 'lista.csv'
+    escrever_lista(path, 250, cidade='São Paulo')
+    with abrir_lista(path, chunksize=100) as lista, ListaCSV(path, chunksize=100) as csv:
+        assert isinstance(lista, ListaImportada)
+        assert lista.contar() == 250
+        for importado, lido in zip(lista.blocos({'CIDADE'}), csv.blocos({'CIDADE'}), strict=True):
+            assert importado[lido.columns].reset_index(drop=True).equals(lido.reset_index(drop=True))
+
+
+def test_reimportacao_nao_quebra_leitor_aberto(tmp_path):
+    path = tmp_path / 'lista.csv'
+    escrever_lista(path, 50)
+    antiga = abrir_lista(path)
+    try:
+        escrever_lista(path, 60, cidade='Natal')
+        with abrir_lista(path) as nova:
+            assert nova.contar() == 60
+        # A versão antiga já foi apagada do disco, mas o leitor aberto segue lendo
+        assert not (diretorio_cache(path) / antiga.meta['hash']).exists()
+        bloco = next(antiga.blocos({'CIDADE'}))
+        assert len(bloco) == 50 and bloco['CIDADE'].iloc[1] == 'Recife'
+    finally:
+        antiga.close()
@@ -0,0 +1,84 @@
+"""Token buckets do DomainRateLimiter: orçamento global e por domínio, redução e recuperação
+
+Uso: python -m pytest tests
+"""
+import os
+import smtplib
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import rate_limiter  # noqa: E402
+from rate_limiter import DomainRateLimiter  # noqa: E402
+
+
+class Relogio:
+    """Substitui o módulo time do limitador: o tempo só anda quando o teste (ou um sleep) manda"""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(rate_limiter, 'time', relogio)
+    return relogio
+
+
+def test_bucket_global_libera_a_capacidade_e_depois_espera(relogio):
+    limitador = DomainRateLimiter(global_rate=2, domain_limits={})
+    assert limitador.try_acquire('a.com') == 0
+    assert limitador.try_acquire('b.com') == 0
+    assert limitador.try_acquire('c.com') == pytest.approx(0.5)
+    relogio.agora += 0.5
+    assert limitador.try_acquire('c.com') == 0
+    assert limitador.get_metrics()['liberados'] == 3
+
+
+def test_dominio_estrangulado_nao_bloqueia_os_demais(relogio):
+    limitador = DomainRateLimiter(global_rate=100, domain_limits={'lento.com': 1})
+    assert limitador.try_acquire('lento.com') == 0
+    assert limitador.try_acquire('lento.com') == pytest.approx(1.0)
+    assert limitador.try_acquire('rapido.com') == 0
+
+
+def test_adiamento_reduz_pela_metade_e_sucesso_recupera(relogio):
+    limitador = DomainRateLimiter(global_rate=8, domain_limits={'a.com': 4}, recovery_step=1)
+    limitador.registrar_resultado('a.com', smtplib.SMTPDataError(451, b'tente depois'))
+    assert limitador.taxa_global() == 4
+    assert limitador.get_metrics()['taxas_dominio'] == {'a.com': 2}
+
+    # Recusa permanente não é adiamento: as taxas não mudam
+    limitador.registrar_resultado('a.com', smtplib.SMTPDataError(550, b'recusado'))
+    assert limitador.taxa_global() == 4
+
+    for _ in range(10):
+        limitador.registrar_resultado('a.com')
+    assert limitador.taxa_global() == 8
+    assert limitador.get_metrics()['taxas_dominio'] == {}
+
+
+def test_taxa_nao_cai_abaixo_do_minimo(relogio):
+    limitador = DomainRateLimiter(global_rate=4, domain_limits={}, min_rate=1)
+    for _ in range(5):
+        limitador.registrar_adiamento('a.com')
+    assert limitador.taxa_global() == 1
+    assert limitador.get_metrics()['adiamentos'] == 5
+
+
+def test_liberar_intercala_dominios_e_espera_o_estrangulado(relogio):
+    limitador = DomainRateLimiter(global_rate=100, domain_limits={'lento.com': 1})
+    itens = ['1@lento.com', '2@lento.com', '1@rapido.com', '2@rapido.com']
+    assert list(limitador.liberar(itens)) == ['1@lento.com', '1@rapido.com', '2@rapido.com', '2@lento.com']
+    # Só o segundo email de lento.com precisou esperar o bucket do domínio
+    assert limitador.get_metrics()['espera_total'] == pytest.approx(1.0, abs=0.05)
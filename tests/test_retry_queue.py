@@ -0,0 +1,115 @@
+"""Classificação das falhas SMTP e ordem das novas tentativas da RetryQueue
+
+Uso: python -m pytest tests
+"""
+import os
+import smtplib
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import retry_queue  # noqa: E402
+from retry_queue import CONEXAO, PERMANENTE, TEMPORARIO, RetryQueue, classificar_erro  # noqa: E402
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(retry_queue, 'time', relogio)
+    return relogio
+
+
+def destinatario(email):
+    # (email, nome, primeiro_nome, campos, linha), como no sender
+    return (email, 'Nome', 'Nome', {}, 0)
+
+
+@pytest.mark.parametrize('erro, classe', [
+    (smtplib.SMTPDataError(451, b'greylisting'), TEMPORARIO),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (452, b'caixa cheia')}), TEMPORARIO),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'usuario desconhecido')}), PERMANENTE),
+    (smtplib.SMTPSenderRefused(553, b'remetente recusado', 'x@example.com'), PERMANENTE),
+    (smtplib.SMTPResponseException(421, b'servico indisponivel'), CONEXAO),
+    (smtplib.SMTPServerDisconnected('Connection unexpectedly closed'), CONEXAO),
+    (ConnectionResetError(104, 'Connection reset by peer'), CONEXAO),
+    ('451 4.7.1 tente mais tarde', TEMPORARIO),
+    ('550 5.1.1 usuario desconhecido', PERMANENTE),
+    ('erro sem codigo', None),
+    (ValueError('nada a ver com SMTP'), None),
+])
+def test_classificar_erro(erro, classe):
+    assert classificar_erro(erro) == classe
+
+
+def test_vencidos_saem_pela_ordem_do_vencimento(relogio):
+    fila = RetryQueue(espera_inicial=30, espera_conexao=2)
+    assert fila.adiar(destinatario('a@example.com'), smtplib.SMTPDataError(451, b'')) == 30
+    assert fila.adiar(destinatario('b@example.com'), smtplib.SMTPServerDisconnected('')) == 2
+    assert fila.adiar(destinatario('c@example.com'), smtplib.SMTPDataError(451, b'')) == 30
+    assert fila.adiar(destinatario('d@example.com'), smtplib.SMTPDataError(550, b'')) is None
+    assert len(fila) == 3
+
+    assert fila.vencidos() == []
+    assert fila.espera() == pytest.approx(2)
+    relogio.agora += 2
+    assert [d[0] for d in fila.vencidos()] == ['b@example.com']
+    relogio.agora += 28
+    # Mesmo vencimento: na ordem em que foram adiados
+    assert [d[0] for d in fila.vencidos()] == ['a@example.com', 'c@example.com']
+    assert fila.espera() is None
+
+
+def test_espera_dobra_ate_esgotar_as_tentativas(relogio):
+    fila = RetryQueue(tentativas=4, espera_inicial=30, espera_maxima=50)
+    alvo = destinatario('a@example.com')
+    erro = smtplib.SMTPDataError(451, b'')
+    esperas = []
+    while True:
+        espera = fila.adiar(alvo, erro)
+        if espera is None:
+            break
+        esperas.append(espera)
+        relogio.agora += espera
+        assert fila.vencidos() == [alvo]
+    assert esperas == [30, 50, 50]
+    assert fila.metrics['agendadas'] == 3 and fila.metrics['esgotadas'] == 1
+
+
+def test_intercalar_e_rodada(relogio):
+    fila = RetryQueue(espera_inicial=5)
+    fila.adiar(destinatario('adiado@example.com'), smtplib.SMTPDataError(451, b''))
+
+    def fonte():
+        yield 'primeiro'
+        relogio.agora += 5
+        yield 'segundo'
+
+    itens = [item if isinstance(item, str) else item[0] for item in fila.intercalar(fonte())]
+    assert itens == ['primeiro', 'adiado@example.com', 'segundo']
+
+    fila.adiar(destinatario('outro@example.com'), smtplib.SMTPDataError(451, b''))
+    assert [d[0] for d in fila.rodada()] == ['outro@example.com']
+    assert fila.rodada() is None
+
+
+def test_descartar_so_invalida_recusa_do_destinatario(relogio):
+    invalidados = []
+    fila = RetryQueue(ao_invalidar=lambda email, motivo: invalidados.append((email, motivo)))
+    fila.descartar(destinatario('a@example.com'), smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'nao existe')}))
+    fila.descartar(destinatario('b@example.com'), smtplib.SMTPDataError(554, b'conteudo recusado'))
+    fila.descartar(destinatario('c@example.com'), smtplib.SMTPRecipientsRefused({'c@example.com': (452, b'cheia')}))
+    assert invalidados == [('a@example.com', '550 nao existe')]
@@ -0,0 +1,70 @@
+"""Reconexão do pool SMTP quando a sessão cai antes ou depois do DATA
+
+Uso: python -m pytest tests
+"""
+import os
+import smtplib
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
+
+from fake_smtp import FakeSMTPServer  # noqa: E402
+from smtp_pool import ClienteSMTP, SMTPConnectionPool  # noqa: E402
+
+MENSAGEM = b'Subject: oi\r\n\r\nteste\r\n'
+
+
+@pytest.fixture
+def sink():
+    sink = FakeSMTPServer().start()
+    yield sink
+    sink.stop()
+
+
+@pytest.fixture
+def pool(sink):
+    pool = SMTPConnectionPool('127.0.0.1', sink.port, size=1)
+    yield pool
+    pool.close()
+
+
+def cair_uma_vez(monkeypatch, metodo, depois=False):
+    """Faz ClienteSMTP.<metodo> derrubar a conexão na primeira chamada (antes ou depois de executar)"""
+    original = getattr(ClienteSMTP, metodo)
+    chamadas = []
+
+    def substituto(self, *args, **kwargs):
+        chamadas.append(1)
+        if len(chamadas) > 1:
+            return original(self, *args, **kwargs)
+        if depois:
+            original(self, *args, **kwargs)
+        self.close()
+        raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+    monkeypatch.setattr(ClienteSMTP, metodo, substituto)
+    return chamadas
+
+
+def test_queda_antes_do_data_reenvia_em_nova_sessao(monkeypatch, sink, pool):
+    cair_uma_vez(monkeypatch, 'mail')
+    assert pool.enviar_bytes('x@example.com', ['a@example.com'], MENSAGEM).startswith('250')
+    assert sink.mensagens == 1
+    assert pool.get_metrics()['reconexoes'] == 1
+
+
+def test_queda_depois_do_data_nao_duplica(monkeypatch, sink, pool):
+    # O servidor aceitou a mensagem, mas a resposta se perdeu
+    chamadas = cair_uma_vez(monkeypatch, 'data', depois=True)
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        pool.enviar_bytes('x@example.com', ['a@example.com'], MENSAGEM)
+    assert len(chamadas) == 1
+    assert sink.mensagens == 1
+
+    # A sessão descartada é refeita no envio seguinte
+    assert pool.enviar_bytes('x@example.com', ['b@example.com'], MENSAGEM).startswith('250')
+    assert sink.mensagens == 2
@@ -0,0 +1,52 @@
+"""Placeholders de colunas extras com células vazias
+
+Uso: python -m pytest tests
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from template_engine import compilar_template  # noqa: E402
+
+TEMPLATE = 'Oi {nome} de {CIDADE}'
+
+
+@pytest.mark.parametrize('vazio', [float('nan'), None, pd.NA])
+def test_celula_vazia_vira_texto_vazio(vazio):
+    template = compilar_template(TEMPLATE)
+    assert template.render({'nome': 'Ana'}, {'CIDADE': vazio}) == 'Oi Ana de '
+    assert template.codificado().render({'nome': 'Ana'}, {'CIDADE': vazio}) == b'Oi Ana de '
+
+
+def test_celula_vazia_da_lista_em_stringdtype():
+    # Como o list_reader entrega as colunas extras (StringDtype, vazias como pd.NA)
+    df = pd.DataFrame({'CIDADE': ['Recife', None]}, dtype='string')
+    campos = df.to_dict('records')
+    template = compilar_template(TEMPLATE)
+    assert template.render({'nome': 'Ana'}, campos[0]) == 'Oi Ana de Recife'
+    assert template.render({'nome': 'Ana'}, campos[1]) == 'Oi Ana de '
+
+
+def test_coluna_ausente_mantem_placeholder():
+    template = compilar_template(TEMPLATE)
+    assert template.render({'nome': 'Ana'}, {}) == 'Oi Ana de {CIDADE}'
+    assert template.render({'nome': 'Ana'}) == 'Oi Ana de {CIDADE}'
+
+
+@pytest.mark.parametrize('texto', ['Oi {nome} de {cidade}', 'Oi {{ nome }} de {{ Cidade }}', 'Oi {NOME} de {CIDADE}'])
+def test_placeholder_de_coluna_sem_diferenciar_maiusculas(texto):
+    # Os leitores entregam as colunas em maiúsculas, o template pode usar qualquer forma
+    template = compilar_template(texto)
+    valores = {'nome': 'Ana', 'NOME': 'Ana'}
+    assert template.render(valores, {'CIDADE': 'Recife'}) == 'Oi Ana de Recife'
+    assert template.codificado().render(valores, {'CIDADE': 'Recife'}) == b'Oi Ana de Recife'
+
+
+def test_placeholder_minusculo_usa_valores_padrao():
+    template = compilar_template('{email} / {Nome}')
+    assert template.render({'EMAIL': 'ana@example.com', 'NOME': 'Ana'}) == 'ana@example.com / Ana'